@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Fake Anthropic Messages API Server
+Local stand-in for the Claude API used by the claude_review.py benchmarks
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+# Ścieżki plików w promptach (PACKED_FILE_SECTION i PROMPT_TEMPLATE w claude_review.py)
+PACKED_PATH_RE = re.compile(r'^### Plik: (\S+)', re.MULTILINE)
+SINGLE_PATH_RE = re.compile(r'z pliku (\S+) \(typ:')
+
+# Czas, po którym batch przechodzi w stan "ended"
+BATCH_PROCESSING_S = 2.0
+
+
+class FakeAnthropicServer:
+    """
+    Serwer HTTP udający Messages API (zwykłe, strumieniowe i Message Batches).
+
+    Odpowiada po zadanym opóźnieniu komentarzami w formacie oczekiwanym przez
+    CodeReviewer, losowo zwraca błędy 429/529 i symuluje limit zapytań na
+    minutę razem z nagłówkami anthropic-ratelimit-*. Liczniki zapytań są
+    dostępne przez stats() oraz GET /stats.
+    """
+
+    def __init__(self, port: int = 0, latency_s: float = 0.2, jitter_s: float = 0.0,
+                 error_rate: float = 0.0, overload_rate: float = 0.0, requests_per_minute: int = 0,
+                 comments_per_file: int = 1, output_tokens: int = 200, seed: Optional[int] = None,
+                 batch_processing_s: float = BATCH_PROCESSING_S, batch_results: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            port: Port nasłuchiwania (0 = dowolny wolny)
+            latency_s: Opóźnienie każdej odpowiedzi
+            jitter_s: Losowy dodatek do opóźnienia (0..jitter_s)
+            error_rate: Odsetek zapytań kończonych błędem 429
+            overload_rate: Odsetek zapytań kończonych błędem 529
+            requests_per_minute: Limit zapytań w oknie 60 s (0 = bez limitu)
+            comments_per_file: Liczba komentarzy w odpowiedzi na plik
+            output_tokens: Deklarowana liczba tokenów wyjściowych odpowiedzi
+            seed: Ziarno generatora losowego (powtarzalne błędy)
+            batch_processing_s: Czas, po którym batch przechodzi w stan "ended"
+            batch_results: Wynik zapytań w batchu dla ścieżek plików z promptu
+                ("errored", "expired", "canceled" lub "missing" - brak wyniku);
+                pozostałe zapytania kończą się statusem "succeeded"
+        """
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.error_rate = error_rate
+        self.overload_rate = overload_rate
+        self.requests_per_minute = requests_per_minute
+        self.comments_per_file = comments_per_file
+        self.output_tokens = output_tokens
+        self.random = random.Random(seed)
+        self.batch_processing_s = batch_processing_s
+        self.batch_results = batch_results or {}
+
+        self._lock = threading.Lock()
+        self._window: deque = deque()
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        self._stats = {
+            "requests": 0,
+            "messages": 0,
+            "streamed": 0,
+            "batches": 0,
+            "batch_requests": 0,
+            "rate_limited": 0,
+            "overloaded": 0,
+            "in_flight": 0,
+            "max_in_flight": 0,
+            "input_tokens": 0
+        }
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self) -> 'FakeAnthropicServer':
+        """Uruchamia serwer w wątku w tle"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fake-anthropic', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            for name in self._stats:
+                self._stats[name] = 0
+            self._window.clear()
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += value
+
+    def _admit(self) -> Optional[Dict[str, Any]]:
+        """
+        Decyduje o losowym błędzie lub przekroczeniu limitu.
+
+        Zwraca None, gdy zapytanie ma zostać obsłużone, albo opis błędu
+        (status, typ, retry-after).
+        """
+        roll = self.random.random()
+        if roll < self.overload_rate:
+            self._count('overloaded')
+            return {"status": 529, "type": "overloaded_error", "retry_after": None}
+        if roll < self.overload_rate + self.error_rate:
+            self._count('rate_limited')
+            return {"status": 429, "type": "rate_limit_error", "retry_after": 1}
+
+        if self.requests_per_minute:
+            now = time.monotonic()
+            with self._lock:
+                while self._window and now - self._window[0] >= 60:
+                    self._window.popleft()
+                if len(self._window) >= self.requests_per_minute:
+                    retry_after = max(1, int(60 - (now - self._window[0])) + 1)
+                    self._stats['rate_limited'] += 1
+                    return {"status": 429, "type": "rate_limit_error", "retry_after": retry_after}
+                self._window.append(now)
+
+        return None
+
+    def _rate_limit_headers(self) -> Dict[str, str]:
+        if not self.requests_per_minute:
+            return {}
+        with self._lock:
+            remaining = max(0, self.requests_per_minute - len(self._window))
+        return {
+            "anthropic-ratelimit-requests-limit": str(self.requests_per_minute),
+            "anthropic-ratelimit-requests-remaining": str(remaining)
+        }
+
+    @staticmethod
+    def _prompt(params: Dict[str, Any]) -> str:
+        content = params['messages'][0]['content']
+        if isinstance(content, list):
+            content = ''.join(block.get('text', '') for block in content)
+        return content
+
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Buduje odpowiedź Messages API dla parametrów zapytania"""
+        content = self._prompt(params)
+
+        def comments(file_path: str) -> List[Dict[str, Any]]:
+            return [
+                {
+                    "line_number": index + 1,
+                    "severity": "minor",
+                    "category": "style",
+                    "message": f"Syntetyczny komentarz {index + 1} dla {file_path}",
+                    "suggestion": ""
+                }
+                for index in range(self.comments_per_file)
+            ]
+
+        packed_paths = PACKED_PATH_RE.findall(content)
+        if packed_paths:
+            text = json.dumps({file_path: comments(file_path) for file_path in packed_paths})
+        else:
+            match = SINGLE_PATH_RE.search(content)
+            text = json.dumps(comments(match.group(1) if match else 'unknown'))
+
+        input_tokens = len(content) // 4
+        self._count('input_tokens', input_tokens)
+        return {
+            "id": f"msg_{self.random.getrandbits(48):012x}",
+            "type": "message",
+            "role": "assistant",
+            "model": params.get('model'),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": input_tokens,
+                "output_tokens": self.output_tokens,
+                "cache_read_input_tokens": 0,
+                "cache_creation_input_tokens": 0
+            }
+        }
+
+    def _batch_result_type(self, request: Dict[str, Any]) -> str:
+        """Status wyniku zapytania w batchu (z batch_results dla ścieżek z promptu)"""
+        content = self._prompt(request['params'])
+        paths = PACKED_PATH_RE.findall(content) or SINGLE_PATH_RE.findall(content)
+        for file_path in paths:
+            if file_path in self.batch_results:
+                return self.batch_results[file_path]
+        return 'succeeded'
+
+    def _batch_result(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Wynik zapytania w batchu (None = zapytanie bez wyniku)"""
+        result_type = self._batch_result_type(request)
+        if result_type == 'missing':
+            return None
+        if result_type == 'succeeded':
+            result = {"type": "succeeded", "message": self._message(request['params'])}
+        elif result_type == 'errored':
+            error = {"type": "api_error", "message": "Fake batch error"}
+            result = {"type": "errored", "error": {"type": "error", "error": error}}
+        else:
+            result = {"type": result_type}
+        return {"custom_id": request['custom_id'], "result": result}
+
+    def _batch_status(self, batch_id: str) -> Dict[str, Any]:
+        batch = self._batches[batch_id]
+        ended = time.monotonic() - batch['created'] >= self.batch_processing_s
+        counts = {"succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+        if ended:
+            for request in batch['requests']:
+                result_type = self._batch_result_type(request)
+                if result_type in counts:
+                    counts[result_type] += 1
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else len(batch['requests']),
+                **counts
+            },
+            "created_at": "2025-01-01T00:00:00Z",
+            "expires_at": "2025-01-02T00:00:00Z",
+            "ended_at": "2025-01-01T00:00:02Z" if ended else None,
+            "cancel_initiated_at": None,
+            "archived_at": None,
+            "results_url": f"{self.base_url}/v1/messages/batches/{batch_id}/results" if ended else None
+        }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str = 'application/json',
+                      headers: Optional[Dict[str, str]] = None) -> None:
+                self.send_response(status)
+                self.send_header('content-type', content_type)
+                self.send_header('content-length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, status: int, payload: Dict[str, Any],
+                           headers: Optional[Dict[str, str]] = None) -> None:
+                self._send(status, json.dumps(payload).encode(), headers=headers)
+
+            def _send_error(self, error: Dict[str, Any]) -> None:
+                headers = {}
+                if error['retry_after'] is not None:
+                    headers['retry-after'] = str(error['retry_after'])
+                payload = {"type": "error", "error": {"type": error['type'], "message": "Fake server error"}}
+                self._send_json(error['status'], payload, headers)
+
+            def _send_stream(self, message: Dict[str, Any], headers: Dict[str, str]) -> None:
+                self.send_response(200)
+                self.send_header('content-type', 'text/event-stream')
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+
+                def event(name: str, data: Dict[str, Any]) -> None:
+                    self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode())
+                    self.wfile.flush()
+
+                text = message['content'][0]['text']
+                start = dict(message, content=[], stop_reason=None)
+                start['usage'] = dict(message['usage'], output_tokens=1)
+                event('message_start', {"type": "message_start", "message": start})
+                event('content_block_start', {
+                    "type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}
+                })
+                for offset in range(0, len(text), 64):
+                    event('content_block_delta', {
+                        "type": "content_block_delta", "index": 0,
+                        "delta": {"type": "text_delta", "text": text[offset:offset + 64]}
+                    })
+                event('content_block_stop', {"type": "content_block_stop", "index": 0})
+                event('message_delta', {
+                    "type": "message_delta",
+                    "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                    "usage": {"output_tokens": message['usage']['output_tokens']}
+                })
+                event('message_stop', {"type": "message_stop"})
+                self.close_connection = True
+
+            def do_GET(self):
+                path = self.path.split('?')[0].rstrip('/')
+                if path == '/stats':
+                    return self._send_json(200, server.stats())
+
+                parts = path.split('/')
+                if path.startswith('/v1/messages/batches/') and parts[4] in server._batches:
+                    batch_id = parts[4]
+                    if len(parts) > 5 and parts[5] == 'results':
+                        results = (server._batch_result(request) for request in server._batches[batch_id]['requests'])
+                        lines = [json.dumps(result) for result in results if result is not None]
+                        return self._send(200, ('\n'.join(lines) + '\n').encode(), 'application/binary')
+                    return self._send_json(200, server._batch_status(batch_id))
+
+                self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": path}})
+
+            def do_POST(self):
+                length = int(self.headers.get('content-length', 0))
+                params = json.loads(self.rfile.read(length) or b'{}')
+                path = self.path.split('?')[0].rstrip('/')
+                server._count('requests')
+
+                if path == '/v1/messages/batches':
+                    batch_id = f"msgbatch_{len(server._batches):06d}"
+                    server._batches[batch_id] = {"created": time.monotonic(), "requests": params['requests']}
+                    server._count('batches')
+                    server._count('batch_requests', len(params['requests']))
+                    return self._send_json(200, server._batch_status(batch_id))
+
+                if path.endswith('/cancel') and path.startswith('/v1/messages/batches/'):
+                    return self._send_json(200, server._batch_status(path.split('/')[4]))
+
+                if path != '/v1/messages':
+                    return self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": path}})
+
+                with server._lock:
+                    server._stats['in_flight'] += 1
+                    server._stats['max_in_flight'] = max(server._stats['max_in_flight'], server._stats['in_flight'])
+                try:
+                    time.sleep(server.latency_s + server.random.uniform(0, server.jitter_s))
+
+                    error = server._admit()
+                    if error:
+                        return self._send_error(error)
+
+                    server._count('messages')
+                    message = server._message(params)
+                    headers = server._rate_limit_headers()
+                    if params.get('stream'):
+                        server._count('streamed')
+                        return self._send_stream(message, headers)
+                    self._send_json(200, message, headers)
+                finally:
+                    with server._lock:
+                        server._stats['in_flight'] -= 1
+
+        return Handler
+
+
+def main():
+    """Główna funkcja skryptu"""
+    parser = argparse.ArgumentParser(description='Fake Anthropic Messages API server for benchmarks')
+    parser.add_argument('--port', type=int, default=8089, help='Port nasłuchiwania')
+    parser.add_argument('--latency', type=float, default=0.2, help='Opóźnienie odpowiedzi w sekundach')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Losowy dodatek do opóźnienia w sekundach')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Odsetek odpowiedzi 429')
+    parser.add_argument('--overload-rate', type=float, default=0.0, help='Odsetek odpowiedzi 529')
+    parser.add_argument('--rpm', type=int, default=0, help='Limit zapytań na minutę (0 = bez limitu)')
+    parser.add_argument('--seed', type=int, default=None, help='Ziarno generatora losowego')
+
+    args = parser.parse_args()
+
+    server = FakeAnthropicServer(
+        port=args.port,
+        latency_s=args.latency,
+        jitter_s=args.jitter,
+        error_rate=args.error_rate,
+        overload_rate=args.overload_rate,
+        requests_per_minute=args.rpm,
+        seed=args.seed
+    )
+    print(f"Fake Anthropic API: {server.base_url} (statystyki: {server.base_url}/stats)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
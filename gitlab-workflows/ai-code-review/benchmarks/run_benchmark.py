@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+End-to-end Benchmark for claude_review.py
+Runs the review against synthetic merge requests and a fake Anthropic API, and writes machine-readable results
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from fake_anthropic import FakeAnthropicServer
+from synthetic_repo import create_synthetic_repo
+
+# Konfiguracja logowania
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REVIEW_SCRIPT = os.path.join(BENCHMARK_DIR, '..', 'scripts', 'claude_review.py')
+
+# Metryki porównywane z --baseline (ścieżka w wyniku scenariusza, czy mniej = lepiej)
+COMPARED_METRICS = (
+    ('wall_s', True),
+    ('files_per_s', False),
+    ('per_file_latency_s.p95', True),
+    ('peak_rss_mb', True),
+    ('server.requests', True),
+    ('tokens.input_tokens', True)
+)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Percentyl metodą najbliższej rangi"""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return round(sorted_values[index], 3)
+
+
+def _git_revision() -> Dict[str, Any]:
+    """Zwraca commit i stan drzewa roboczego mierzonego kodu"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BENCHMARK_DIR, check=True, stdout=subprocess.PIPE, text=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--", ".."], cwd=BENCHMARK_DIR, check=True,
+            stdout=subprocess.PIPE, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": bool(status)}
+
+
+def run_review(repo_path: str, base_sha: str, server: FakeAnthropicServer,
+               review_args: List[str]) -> Dict[str, Any]:
+    """
+    Uruchamia claude_review.py w osobnym procesie i zbiera pomiary.
+
+    Szczytowe RSS pochodzi z os.wait4, więc dotyczy wyłącznie tego procesu.
+    """
+    output = os.path.join(repo_path, 'review-results.json')
+    command = [sys.executable, REVIEW_SCRIPT, '--diff', base_sha, '--output', output, *review_args]
+    env = {
+        **os.environ,
+        'ANTHROPIC_API_KEY': 'benchmark',
+        'ANTHROPIC_BASE_URL': server.base_url
+    }
+
+    server.reset_stats()
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=repo_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = process.stderr.read()
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_s = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    process.stderr.close()
+
+    if process.returncode != 0 or not os.path.exists(output):
+        logger.error(f"claude_review.py zakończył się kodem {process.returncode}")
+        logger.error(stderr.decode('utf-8', errors='replace')[-2000:])
+        return {"exit_code": process.returncode, "wall_s": round(wall_s, 3)}
+
+    with open(output, 'r', encoding='utf-8') as f:
+        results = json.load(f)
+
+    metrics = results.get('metrics', {})
+    per_file = sorted(stats['latency_s'] for stats in metrics.get('per_file', {}).values())
+    files_reviewed = results.get('summary', {}).get('files_reviewed', len(per_file))
+
+    # ru_maxrss jest w KiB na Linuksie i w bajtach na macOS
+    rss_divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+
+    return {
+        "exit_code": process.returncode,
+        "wall_s": round(wall_s, 3),
+        "files_reviewed": files_reviewed,
+        "files_per_s": round(files_reviewed / wall_s, 2) if wall_s else None,
+        "per_file_latency_s": {
+            "p50": percentile(per_file, 0.5),
+            "p95": percentile(per_file, 0.95)
+        },
+        "request_latency_s": metrics.get('latency_s', {}),
+        "peak_rss_mb": round(rusage.ru_maxrss / rss_divisor, 1),
+        "cpu_s": round(rusage.ru_utime + rusage.ru_stime, 3),
+        "comments": len(results.get('comments', [])),
+        "tokens": {
+            name: metrics.get(name, 0)
+            for name in ('input_tokens', 'output_tokens', 'cache_read_input_tokens', 'cache_creation_input_tokens')
+        },
+        "server": server.stats()
+    }
+
+
+def _median_run(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Zwraca przebieg z medianowym czasem (odporny na pojedyncze odchylenia)"""
+    successful = sorted((run for run in runs if run.get('exit_code') == 0), key=lambda run: run['wall_s'])
+    if not successful:
+        return runs[-1]
+    return successful[(len(successful) - 1) // 2]
+
+
+def _lookup(result: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = result
+    for key in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value if isinstance(value, (int, float)) else None
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Zestawia wyniki z poprzednim plikiem wyników (zmiana procentowa)"""
+    baseline_scenarios = {scenario['files']: scenario['result'] for scenario in baseline.get('scenarios', [])}
+    lines = [f"Porównanie z {baseline.get('revision', {}).get('commit') or 'baseline'}:"]
+
+    for scenario in results['scenarios']:
+        previous = baseline_scenarios.get(scenario['files'])
+        if previous is None:
+            continue
+        lines.append(f"  {scenario['files']} plików:")
+        for path, lower_is_better in COMPARED_METRICS:
+            old, new = _lookup(previous, path), _lookup(scenario['result'], path)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            better = (change < 0) == lower_is_better or change == 0
+            marker = '' if abs(change) < 5 else (' (lepiej)' if better else ' (gorzej)')
+            lines.append(f"    {path}: {old} -> {new} ({change:+.1f}%){marker}")
+
+    return lines
+
+
+def main():
+    """Główna funkcja skryptu"""
+    parser = argparse.ArgumentParser(description='Benchmark claude_review.py against a fake Anthropic API')
+    parser.add_argument(
+        '--sizes',
+        default='10,100,1000',
+        help='Liczby zmienionych plików w syntetycznych MR (oddzielone przecinkami)'
+    )
+    parser.add_argument('--repeat', type=int, default=1, help='Liczba powtórzeń każdego scenariusza')
+    parser.add_argument('--seed', type=int, default=0, help='Ziarno generatora repozytoriów i błędów')
+    parser.add_argument('--latency', type=float, default=0.5, help='Opóźnienie odpowiedzi serwera w sekundach')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Losowy dodatek do opóźnienia w sekundach')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Odsetek odpowiedzi 429')
+    parser.add_argument('--overload-rate', type=float, default=0.0, help='Odsetek odpowiedzi 529')
+    parser.add_argument('--rpm', type=int, default=0, help='Limit zapytań na minutę serwera (0 = bez limitu)')
+    parser.add_argument(
+        '--review-args',
+        default='--no-cache',
+        help='Dodatkowe opcje claude_review.py, np. "--no-cache --concurrency 8 --pack-tokens 8000"'
+    )
+    parser.add_argument('--work-dir', default=None, help='Katalog na syntetyczne repozytoria (domyślnie tymczasowy)')
+    parser.add_argument('--output', default='benchmark-results.json', help='Plik wyników')
+    parser.add_argument('--baseline', default=None, help='Poprzedni plik wyników do porównania')
+
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    review_args = shlex.split(args.review_args)
+
+    server = FakeAnthropicServer(
+        latency_s=args.latency,
+        jitter_s=args.jitter,
+        error_rate=args.error_rate,
+        overload_rate=args.overload_rate,
+        requests_per_minute=args.rpm,
+        seed=args.seed
+    ).start()
+
+    results: Dict[str, Any] = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "server": {
+            "latency_s": args.latency,
+            "jitter_s": args.jitter,
+            "error_rate": args.error_rate,
+            "overload_rate": args.overload_rate,
+            "requests_per_minute": args.rpm
+        },
+        "review_args": review_args,
+        "scenarios": []
+    }
+
+    exit_code = 0
+    try:
+        with tempfile.TemporaryDirectory(prefix='ai-review-bench-', dir=args.work_dir) as work_dir:
+            for size in sizes:
+                repo_path = os.path.join(work_dir, f"mr-{size}")
+                base_sha, changed = create_synthetic_repo(repo_path, size, seed=args.seed)
+                logger.info(f"Scenariusz {size} plików ({sum(changed.values())} zmienionych linii)")
+
+                runs = []
+                for attempt in range(args.repeat):
+                    run = run_review(repo_path, base_sha, server, review_args)
+                    runs.append(run)
+                    logger.info(
+                        f"  przebieg {attempt + 1}: {run['wall_s']}s, "
+                        f"{run.get('server', {}).get('requests', '?')} zapytań, "
+                        f"RSS {run.get('peak_rss_mb', '?')} MB"
+                    )
+                    if run.get('exit_code') != 0:
+                        exit_code = 1
+
+                results["scenarios"].append({
+                    "files": size,
+                    "changed_lines": sum(changed.values()),
+                    "result": _median_run(runs),
+                    "runs": runs
+                })
+    finally:
+        server.stop()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Wyniki zapisane do {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print('\n'.join(compare(results, baseline)))
+
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
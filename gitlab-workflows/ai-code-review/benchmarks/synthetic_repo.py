@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Synthetic Merge Request Generator
+Creates git repositories with a base commit and an MR commit of a given size for the claude_review.py benchmarks
+"""
+
+import argparse
+import os
+import random
+import subprocess
+from typing import Dict, List, Tuple
+
+# Rozkład rozmiarów zmian: (udział plików, minimalna i maksymalna liczba zmienionych linii)
+DIFF_SIZE_PROFILE = (
+    (0.6, 1, 20),
+    (0.3, 20, 200),
+    (0.1, 200, 1500)
+)
+
+# Rozszerzenia i katalogi syntetycznych plików
+EXTENSIONS = ('py', 'js', 'ts', 'go', 'java')
+DIRECTORIES = ('src/api', 'src/core', 'src/utils', 'lib', 'services/billing', 'services/auth')
+
+# Tożsamość commitów niezależna od konfiguracji maszyny
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'Benchmark',
+    'GIT_AUTHOR_EMAIL': 'benchmark@example.com',
+    'GIT_COMMITTER_NAME': 'Benchmark',
+    'GIT_COMMITTER_EMAIL': 'benchmark@example.com',
+    'GIT_AUTHOR_DATE': '2025-01-01T00:00:00+00:00',
+    'GIT_COMMITTER_DATE': '2025-01-01T00:00:00+00:00'
+}
+
+
+def _git(repo_path: str, *args: str) -> str:
+    result = subprocess.run(
+        ["git", *args],
+        cwd=repo_path,
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+        env={**os.environ, **GIT_ENV}
+    )
+    return result.stdout.strip()
+
+
+def _source_line(rng: random.Random, index: int) -> str:
+    """Zwraca linię pseudo-kodu o zmiennej długości"""
+    name = f"value_{index}_{rng.randrange(10_000)}"
+    return rng.choice((
+        f"    {name} = compute({rng.randrange(100)}, {rng.randrange(100)})",
+        f"    if {name} > {rng.randrange(1000)}:",
+        f"        logger.debug('processing {name}')",
+        f"    result.append({name} * {rng.randrange(1, 9)})",
+        f"    # TODO: review handling of {name}",
+    ))
+
+
+def _changed_line_count(rng: random.Random) -> int:
+    roll = rng.random()
+    for share, low, high in DIFF_SIZE_PROFILE:
+        if roll < share:
+            return rng.randint(low, high)
+        roll -= share
+    _, low, high = DIFF_SIZE_PROFILE[-1]
+    return rng.randint(low, high)
+
+
+def create_synthetic_repo(repo_path: str, file_count: int, seed: int = 0,
+                          base_lines: int = 60) -> Tuple[str, Dict[str, int]]:
+    """
+    Tworzy repozytorium z commitem bazowym i commitem MR zmieniającym file_count plików.
+
+    Połowa zmienianych plików istnieje w commicie bazowym (zmiany w środku
+    pliku), reszta jest dodawana w MR. Liczba zmienionych linii pliku jest
+    losowana według DIFF_SIZE_PROFILE.
+
+    Returns:
+        (SHA commita bazowego, {ścieżka: liczba zmienionych linii})
+    """
+    rng = random.Random(seed)
+    os.makedirs(repo_path, exist_ok=True)
+    _git(repo_path, "init", "-q")
+
+    paths: List[str] = [
+        f"{DIRECTORIES[index % len(DIRECTORIES)]}/module_{index:04d}.{EXTENSIONS[index % len(EXTENSIONS)]}"
+        for index in range(file_count)
+    ]
+    existing = set(paths[::2])
+
+    def write(path: str, lines: List[str]) -> None:
+        full_path = os.path.join(repo_path, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    base_content: Dict[str, List[str]] = {}
+    for path in paths:
+        if path in existing:
+            base_content[path] = [_source_line(rng, index) for index in range(base_lines)]
+            write(path, base_content[path])
+
+    with open(os.path.join(repo_path, 'README.md'), 'w', encoding='utf-8') as f:
+        f.write('# Synthetic benchmark repository\n')
+
+    _git(repo_path, "add", "-A")
+    _git(repo_path, "commit", "-q", "-m", "Base")
+    base_sha = _git(repo_path, "rev-parse", "HEAD")
+
+    changed: Dict[str, int] = {}
+    for path in paths:
+        count = _changed_line_count(rng)
+        new_lines = [_source_line(rng, index) for index in range(count)]
+        if path in base_content:
+            lines = base_content[path]
+            middle = len(lines) // 2
+            write(path, lines[:middle] + new_lines + lines[middle:])
+        else:
+            write(path, new_lines)
+        changed[path] = count
+
+    _git(repo_path, "add", "-A")
+    _git(repo_path, "commit", "-q", "-m", f"Synthetic MR with {file_count} files")
+
+    return base_sha, changed
+
+
+def main():
+    """Główna funkcja skryptu"""
+    parser = argparse.ArgumentParser(description='Create a synthetic git repository with an MR-sized commit')
+    parser.add_argument('path', help='Katalog repozytorium (zostanie utworzony)')
+    parser.add_argument('--files', type=int, default=100, help='Liczba zmienionych plików')
+    parser.add_argument('--seed', type=int, default=0, help='Ziarno generatora losowego')
+
+    args = parser.parse_args()
+
+    base_sha, changed = create_synthetic_repo(args.path, args.files, seed=args.seed)
+    print(f"{base_sha} ({len(changed)} plików, {sum(changed.values())} zmienionych linii)")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,15 +6,25 @@ Analyzes code changes and generates review suggestions using Claude API
 
 import argparse
 import hashlib
+import heapq
 import json
 import logging
+import math
 import os
 import re
+import signal
 import subprocess
 import sys
-from typing import List, Dict, Any
-from dataclasses import dataclass, asdict
-from anthropic import Anthropic
+import threading
+import time
+from datetime import datetime, timezone
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+from typing import List, Dict, Any, Optional, Mapping, Iterable, Iterator, Set, Tuple, Callable
+from dataclasses import dataclass, asdict, field, replace
+from anthropic import Anthropic, APIConnectionError, APIStatusError
+
+from tracing import add_tracing_arguments, configure_tracing, export_tracing, span, traced
 
 # Konfiguracja logowania
 logging.basicConfig(
@@ -23,6 +33,115 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+DEFAULT_MODEL = "claude-sonnet-4-5-20250929"
+
+# Minimalna długość prefiksu zapisywanego w cache promptów (Sonnet/Opus; mniejsze modele wymagają więcej)
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+# Cały statyczny tekst (rola, kryteria i format odpowiedzi) jest w prompcie systemowym,
+# który kończy się punktem cache_control; wiadomość użytkownika zawiera tylko diffy
+SYSTEM_PROMPT = """Jesteś ekspertem code review. Analizuj kod pod kątem:
+- Potencjalnych błędów i bugów
+- Problemów bezpieczeństwa
+- Wydajności
+- Czytelności i maintainability
+- Zgodności z best practices
+
+## Zakres analizy
+
+Otrzymujesz diff w formacie git (unified diff). Skup się na:
+1. Nowych liniach kodu (zaczynających się od '+')
+2. Kontekście zmian (linie bez prefiksu pokazują otoczenie zmiany)
+3. Potencjalnych problemach wprowadzonych przez zmiany
+
+Linie usunięte (zaczynające się od '-') traktuj wyłącznie jako kontekst: komentuj je tylko wtedy,
+gdy usunięcie samo w sobie wprowadza problem (np. usunięta walidacja, zwolnienie zasobu lub
+obsługa błędu). Nie komentuj kodu, którego zmiana nie dotyczy, chyba że zmiana sprawia, że
+istniejący kod przestaje działać poprawnie. Diff może być fragmentem większego pliku lub
+jedną z kilku części dużego diffa - nie zgłaszaj braków, które mogą znajdować się poza
+widocznym fragmentem (np. brak importu albo definicji funkcji spoza diffa).
+
+## Kryteria oceny
+
+Błędy (bug):
+- niepoprawna logika warunków, pomyłki o jeden (off-by-one), odwrócone porównania,
+- nieobsłużone wartości None/null, puste kolekcje, dzielenie przez zero,
+- wyścigi i współdzielony stan bez synchronizacji, niezamknięte zasoby (pliki, połączenia, locki),
+- połknięte wyjątki, zbyt szerokie except/catch, zgubione kody błędów,
+- niezgodność typów, błędne jednostki (sekundy/milisekundy, bajty/kilobajty), strefy czasowe.
+
+Bezpieczeństwo (security):
+- wstrzyknięcia (SQL, komendy powłoki, ścieżki plików, szablony, deserializacja niezaufanych danych),
+- sekrety, tokeny i hasła w kodzie lub logach, słabe algorytmy kryptograficzne i losowość,
+- brak weryfikacji uprawnień, uwierzytelnienia lub certyfikatów TLS,
+- niebezpieczne ustawienia domyślne, zbyt szerokie uprawnienia plików i kontenerów.
+
+Wydajność (performance):
+- zapytania lub wywołania sieciowe w pętli (N+1), zbędne kopiowanie dużych struktur,
+- algorytmy o złożoności kwadratowej tam, gdzie wystarczy liniowa, brak indeksów i limitów,
+- wczytywanie całych plików lub odpowiedzi do pamięci bez potrzeby, brak timeoutów.
+
+Styl kodu (style):
+- nieczytelne nazwy, martwy kod, zbyt długie funkcje, niespójne formatowanie z otoczeniem.
+
+Dobre praktyki (best_practice):
+- brak testów dla nowej logiki, duplikacja, magiczne liczby, brak obsługi konfiguracji,
+- odstępstwa od idiomów języka i konwencji widocznych w otaczającym kodzie.
+
+## Priorytety (severity)
+
+- critical: błąd lub luka, która niemal na pewno spowoduje awarię, utratę danych albo
+  naruszenie bezpieczeństwa po wdrożeniu; zmiana nie powinna zostać scalona bez poprawki,
+- major: poważny problem, który wystąpi w realnych warunkach (np. przy błędzie sieci,
+  dużych danych, współbieżności) lub znacząco utrudni utrzymanie kodu,
+- minor: drobny problem lub ryzyko o ograniczonym wpływie, warte poprawy przy okazji,
+- info: uwaga lub sugestia bez wpływu na poprawność.
+
+Nie zawyżaj priorytetów. Jeśli nie masz pewności, że problem istnieje, obniż priorytet
+i opisz założenie w treści komentarza. Nie zgłaszaj kwestii czysto gustu jako major ani critical.
+
+## Numery linii
+
+Podawaj numer linii w NOWEJ wersji pliku, wyliczony z nagłówka hunka "@@ -a,b +c,d @@":
+pierwsza linia po nagłówku ma numer c, a każda kolejna linia kontekstowa lub dodana zwiększa
+go o jeden (linie usunięte nie zwiększają numeru). Dla problemu w usuniętej linii podaj numer
+najbliższej linii nowej wersji. Jeden problem zgłaszaj raz - przy linii, w której występuje;
+ten sam problem w kilku miejscach opisz przy pierwszym wystąpieniu i wymień pozostałe linie.
+
+## Format odpowiedzi
+
+Zwracaj odpowiedź TYLKO w formacie JSON, bez tekstu przed ani po nim i bez bloków markdown.
+Każdy komentarz powinien mieć:
+- line_number: numer linii (z diffa)
+- severity: 'critical'|'major'|'minor'|'info'
+- category: 'bug'|'security'|'performance'|'style'|'best_practice'
+- message: opis problemu (po polsku, konkretnie: co jest nie tak i dlaczego)
+- suggestion: sugestia poprawy (opcjonalne; poprawiony kod zastępujący wskazaną linię)
+
+Dla diffa jednego pliku zwróć tablicę JSON z komentarzami lub pustą tablicę jeśli kod jest OK, np.:
+[{"line_number": 42, "severity": "major", "category": "bug", "message": "Brak obsługi pustej listy - items[0] rzuci IndexError.", "suggestion": "first = items[0] if items else None"}]
+
+Gdy wiadomość zawiera kilka sekcji "### Plik: ...", oceniaj każdy plik osobno i zamiast tablicy
+zwróć JEDEN obiekt JSON, którego kluczami są dokładnie podane ścieżki plików, a wartościami
+tablice komentarzy (pusta tablica, jeśli plik jest OK). Numery linii podawaj względem danego pliku, np.:
+{"src/a.py": [], "src/b.py": [{"line_number": 7, "severity": "minor", "category": "style", "message": "Nieużywana zmienna tmp.", "suggestion": ""}]}"""
+
+PROMPT_TEMPLATE = """Przeanalizuj następujący diff kodu z pliku {file_path} (typ: {file_extension}).
+
+Diff git:
+```diff
+{diff}
+```"""
+
+PACKED_PROMPT_TEMPLATE = """Przeanalizuj następujące diffy kodu z {file_count} plików. Każdy plik oceniaj osobno.
+
+{file_sections}"""
+
+PACKED_FILE_SECTION = """### Plik: {file_path} (typ: {file_extension})
+```diff
+{diff}
+```"""
+
 
 @dataclass
 class ReviewComment:
@@ -35,159 +154,2095 @@ class ReviewComment:
     suggestion: str = ""
 
 
+HUNK_HEADER_RE = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+
+@dataclass
+class DiffHunk:
+    """Pojedynczy hunk diffa (nagłówek @@ i jego linie)"""
+    header: str
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    lines: List[str] = field(default_factory=list)
+
+
+@dataclass
+class FileDiff:
+    """Diff pojedynczego pliku sparsowany ze strumienia git diff"""
+    path: str
+    old_path: str
+    header_lines: List[str] = field(default_factory=list)
+    hunks: List[DiffHunk] = field(default_factory=list)
+    added: int = 0
+    removed: int = 0
+    binary: bool = False
+    copied: bool = False
+    truncated: bool = False
+    skipped: bool = False
+    size_bytes: int = 0
+    # Hunki pominięte przy normalizacji (tylko do przeliczania numerów linii)
+    ignored_hunks: List[DiffHunk] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        """Zwraca diff pliku w formacie tekstowym (jak z git diff)"""
+        parts = list(self.header_lines)
+        for hunk in self.hunks:
+            parts.append(hunk.header)
+            parts.extend(hunk.lines)
+        if self.truncated:
+            parts.append(f"\\ Diff obcięty po {self.size_bytes} bajtach")
+        return "\n".join(parts) + "\n" if parts else ""
+
+    def map_old_line(self, old_line: int) -> Optional[int]:
+        """
+        Przelicza numer linii ze starej wersji pliku na nową.
+
+        Zwraca None, jeśli linia została usunięta lub zmieniona w tym diffie
+        (albo diff jest obcięty i nie da się tego stwierdzić).
+        """
+        hunks = self.hunks
+        if self.ignored_hunks:
+            hunks = sorted(self.hunks + self.ignored_hunks, key=lambda hunk: hunk.old_start)
+
+        offset = 0
+        for hunk in hunks:
+            # Przy pustym zakresie git podaje numer linii poprzedzającej
+            old_start = hunk.old_start if hunk.old_count else hunk.old_start + 1
+            new_start = hunk.new_start if hunk.new_count else hunk.new_start + 1
+            if old_line < old_start:
+                return old_line + offset
+
+            old_end = old_start + hunk.old_count
+            if old_line >= old_end:
+                offset = (new_start + hunk.new_count) - old_end
+                continue
+
+            current_old = old_start
+            current_new = new_start
+            for line in hunk.lines:
+                if line.startswith('+'):
+                    current_new += 1
+                elif line.startswith('-'):
+                    if current_old == old_line:
+                        return None
+                    current_old += 1
+                elif not line.startswith('\\'):
+                    if current_old == old_line:
+                        return current_new
+                    current_old += 1
+                    current_new += 1
+            return None
+
+        # Za ostatnim hunkiem obciętego diffa mogą być zmiany, których nie znamy
+        if self.truncated:
+            return None
+        return old_line + offset
+
+
+def _strip_diff_path(raw_path: str) -> Optional[str]:
+    """Usuwa prefiks a/ lub b/ ze ścieżki z nagłówka ---/+++ (None dla /dev/null)"""
+    raw_path = raw_path.rstrip('\t')
+    if raw_path == '/dev/null':
+        return None
+    if raw_path.startswith(('a/', 'b/')):
+        return raw_path[2:]
+    return raw_path
+
+
+def _path_from_git_header(line: str) -> Optional[str]:
+    """Wyciąga ścieżkę z linii 'diff --git a/X b/X' (tylko gdy obie ścieżki są równe)"""
+    rest = line[len('diff --git '):]
+    path_len = (len(rest) - 5) // 2
+    if path_len <= 0 or not rest.startswith('a/'):
+        return None
+    path = rest[2:2 + path_len]
+    if rest[2 + path_len:] != f" b/{path}":
+        return None
+    return path
+
+
+def parse_diff_stream(lines: Iterable[str], max_file_bytes: int = 0,
+                      skip: Optional[Callable[[str], bool]] = None) -> Iterator[FileDiff]:
+    """
+    Parsuje strumień linii z `git diff` i zwraca kolejne obiekty FileDiff.
+
+    Plik jest oddawany, gdy tylko zaczyna się diff następnego, więc w pamięci
+    trzymany jest najwyżej jeden plik. Linie pliku ponad max_file_bytes
+    (0 = bez limitu) są tylko zliczane, a diff oznaczany jako obcięty.
+    Dla plików, dla których skip(ścieżka) zwraca True, linie są tylko
+    zliczane (FileDiff.skipped), bez trzymania ich w pamięci.
+    """
+    current: Optional[FileDiff] = None
+    hunk: Optional[DiffHunk] = None
+
+    for raw_line in lines:
+        line = raw_line.rstrip('\n')
+
+        if line.startswith('diff --git '):
+            if current is not None:
+                yield current
+            path = _path_from_git_header(line) or ''
+            current = FileDiff(path=path, old_path=path, header_lines=[line], size_bytes=len(line) + 1)
+            hunk = None
+            continue
+
+        if current is None:
+            continue
+
+        if hunk is None:
+            # Nagłówek pliku (index, mode, rename, ---/+++)
+            if line.startswith('@@'):
+                pass
+            else:
+                if line.startswith('--- '):
+                    old_path = _strip_diff_path(line[4:])
+                    if old_path:
+                        current.old_path = old_path
+                elif line.startswith('+++ '):
+                    new_path = _strip_diff_path(line[4:])
+                    if new_path:
+                        current.path = new_path
+                        if not current.old_path:
+                            current.old_path = new_path
+                    elif current.old_path:
+                        current.path = current.old_path
+                elif line.startswith('rename from '):
+                    current.old_path = line[len('rename from '):]
+                elif line.startswith('rename to '):
+                    current.path = line[len('rename to '):]
+                elif line.startswith('copy from '):
+                    current.old_path = line[len('copy from '):]
+                    current.copied = True
+                elif line.startswith('copy to '):
+                    current.path = line[len('copy to '):]
+                elif line.startswith('Binary files ') or line == 'GIT binary patch':
+                    current.binary = True
+                current.header_lines.append(line)
+                current.size_bytes += len(line) + 1
+                continue
+
+        if line.startswith('@@'):
+            match = HUNK_HEADER_RE.match(line)
+            if match:
+                # Ścieżka jest już znana przy pierwszym hunku pliku
+                if hunk is None and skip is not None:
+                    current.skipped = skip(current.path)
+                hunk = DiffHunk(
+                    header=line,
+                    old_start=int(match.group(1)),
+                    old_count=int(match.group(2) or 1),
+                    new_start=int(match.group(3)),
+                    new_count=int(match.group(4) or 1)
+                )
+                if not current.truncated and not current.skipped:
+                    current.hunks.append(hunk)
+                continue
+
+        if line.startswith('+'):
+            current.added += 1
+        elif line.startswith('-'):
+            current.removed += 1
+
+        if current.skipped:
+            current.size_bytes += len(line) + 1
+            continue
+
+        if current.truncated:
+            continue
+
+        current.size_bytes += len(line) + 1
+        if max_file_bytes and current.size_bytes > max_file_bytes:
+            current.truncated = True
+            continue
+
+        if hunk is not None:
+            hunk.lines.append(line)
+
+    if current is not None:
+        yield current
+
+
+# Prefiksy komentarzy jednoliniowych według rozszerzenia pliku (--ignore-comments)
+_C_STYLE_COMMENTS = ('//', '/*', '*/', '* ')
+COMMENT_PREFIXES = {
+    **dict.fromkeys(('.py', '.sh', '.bash', '.rb', '.pl', '.yml', '.yaml', '.toml', '.cfg', '.conf', '.r'), ('#',)),
+    **dict.fromkeys(('.ini', '.cnf'), ('#', ';')),
+    **dict.fromkeys(('.tf', '.hcl'), ('#',) + _C_STYLE_COMMENTS),
+    **dict.fromkeys((
+        '.js', '.jsx', '.ts', '.tsx', '.go', '.java', '.c', '.h', '.cc', '.cpp', '.hpp', '.cs',
+        '.kt', '.swift', '.rs', '.scala', '.groovy', '.php', '.css', '.scss', '.less'
+    ), _C_STYLE_COMMENTS),
+    **dict.fromkeys(('.sql',), ('--', '/*', '*/', '* ')),
+    **dict.fromkeys(('.lua', '.hs'), ('--',)),
+    **dict.fromkeys(('.html', '.xml', '.vue', '.svelte'), ('<!--', '-->'))
+}
+
+HUNK_SECTION_RE = re.compile(r'^@@ [^@]* @@(.*)$')
+
+
+def _comment_prefixes(file_path: str) -> Optional[Tuple[str, ...]]:
+    """Zwraca prefiksy komentarzy dla pliku (None, gdy język jest nieznany)"""
+    name = os.path.basename(file_path)
+    if name.lower().endswith('dockerfile') or name in ('Makefile', '.gitignore', '.dockerignore'):
+        return ('#',)
+    return COMMENT_PREFIXES.get(os.path.splitext(name)[1].lower())
+
+
+def _is_whitespace_only(lines: List[str]) -> bool:
+    """
+    Sprawdza, czy grupa zmian różni się tylko białymi znakami i pustymi liniami.
+
+    Linie są porównywane w kolejności, po przycięciu i zastąpieniu ciągów
+    białych znaków jedną spacją (jak git diff -b), więc zmiana kolejności
+    linii ani sklejenie tokenów ("not x" -> "notx") nie są traktowane jako
+    zmiana białych znaków.
+    """
+    def normalized(prefix: str) -> List[str]:
+        collapsed = (' '.join(line[1:].split()) for line in lines if line.startswith(prefix))
+        return [line for line in collapsed if line]
+
+    return normalized('-') == normalized('+')
+
+
+def _is_comment_only(lines: List[str], prefixes: Tuple[str, ...]) -> bool:
+    """Sprawdza, czy grupa zmian dotyczy wyłącznie komentarzy i pustych linii"""
+    for line in lines:
+        if line.startswith('\\'):
+            continue
+        content = line[1:].strip()
+        if content and content != '*' and not content.startswith(prefixes):
+            return False
+    return True
+
+
+def _hunk_from_lines(lines: List[str], old_start: int, new_start: int, section: str = '') -> DiffHunk:
+    """Buduje hunk (z nagłówkiem @@) z linii zaczynających się od podanych numerów linii"""
+    old_count = sum(1 for line in lines if not line.startswith(('+', '\\')))
+    new_count = sum(1 for line in lines if not line.startswith(('-', '\\')))
+    # Dla pustego zakresu git podaje numer linii poprzedzającej
+    old_start = old_start if old_count else old_start - 1
+    new_start = new_start if new_count else new_start - 1
+    return DiffHunk(
+        header=f"@@ -{old_start},{old_count} +{new_start},{new_count} @@{section}",
+        old_start=old_start,
+        old_count=old_count,
+        new_start=new_start,
+        new_count=new_count,
+        lines=list(lines)
+    )
+
+
+@traced('diff.normalize')
+def normalize_file_diff(file_diff: FileDiff, context_lines: int = 3, ignore_whitespace: bool = False,
+                        ignore_comments: bool = False) -> Dict[str, int]:
+    """
+    Usuwa z diffa grupy zmian dotyczące tylko białych znaków lub komentarzy.
+
+    Hunki są dzielone na grupy kolejnych linii +/-; pominięte grupy trafiają
+    do FileDiff.ignored_hunks (dla map_old_line), a wokół pozostałych
+    zostaje najwyżej context_lines linii kontekstu. Zwraca liczbę usuniętych
+    linii i bajtów (łącznie i według powodu).
+    """
+    stats = {"lines": 0, "bytes": 0, "whitespace_lines": 0, "comment_lines": 0, "context_lines": 0}
+    prefixes = _comment_prefixes(file_diff.path) if ignore_comments else None
+    if not ignore_whitespace and not prefixes:
+        return stats
+
+    hunks: List[DiffHunk] = []
+    for hunk in file_diff.hunks:
+        # Numery linii (stara, nowa wersja) na początku każdej linii hunka
+        old_line = hunk.old_start if hunk.old_count else hunk.old_start + 1
+        new_line = hunk.new_start if hunk.new_count else hunk.new_start + 1
+        positions = []
+        groups: List[List[int]] = []
+        for index, line in enumerate(hunk.lines):
+            positions.append((old_line, new_line))
+            if line.startswith(('+', '-')) or (line.startswith('\\') and groups and groups[-1][1] == index):
+                if groups and groups[-1][1] == index:
+                    groups[-1][1] = index + 1
+                else:
+                    groups.append([index, index + 1])
+            if line.startswith('+'):
+                new_line += 1
+            elif line.startswith('-'):
+                old_line += 1
+            elif not line.startswith('\\'):
+                old_line += 1
+                new_line += 1
+        positions.append((old_line, new_line))
+
+        kept = []
+        for start, end in groups:
+            group_lines = hunk.lines[start:end]
+            reason = None
+            if ignore_whitespace and _is_whitespace_only(group_lines):
+                reason = 'whitespace_lines'
+            elif prefixes and _is_comment_only(group_lines, prefixes):
+                reason = 'comment_lines'
+
+            if reason is None:
+                kept.append((start, end))
+                continue
+
+            file_diff.ignored_hunks.append(_hunk_from_lines(group_lines, *positions[start]))
+            stats[reason] += len(group_lines)
+
+        if len(kept) == len(groups):
+            hunks.append(hunk)
+            continue
+
+        # Okna kontekstu wokół zachowanych grup (bez nachodzenia na inne grupy)
+        boundaries = [(0, 0)] + [tuple(group) for group in groups] + [(len(hunk.lines), len(hunk.lines))]
+        windows: List[List[int]] = []
+        for start, end in kept:
+            position = boundaries.index((start, end))
+            window = [max(start - context_lines, boundaries[position - 1][1]),
+                      min(end + context_lines, boundaries[position + 1][0])]
+            if windows and window[0] <= windows[-1][1]:
+                windows[-1][1] = window[1]
+            else:
+                windows.append(window)
+
+        match = HUNK_SECTION_RE.match(hunk.header)
+        section = match.group(1) if match else ''
+        for start, end in windows:
+            hunks.append(_hunk_from_lines(hunk.lines[start:end], *positions[start], section=section))
+
+        removed_lines = len(hunk.lines) - sum(end - start for start, end in windows)
+        stats["context_lines"] += removed_lines - sum(
+            end - start for start, end in groups if (start, end) not in kept
+        )
+        stats["lines"] += removed_lines
+        stats["bytes"] += sum(len(line) + 1 for line in hunk.lines) - sum(
+            len(line) + 1 for start, end in windows for line in hunk.lines[start:end]
+        )
+
+    file_diff.hunks = hunks
+    return stats
+
+
+def diff_fingerprint(file_diff: FileDiff) -> str:
+    """
+    Zwraca skrót zmian pliku niezależny od ścieżki i położenia hunków.
+
+    Pliki z tym samym skrótem (np. kopie konfiguracji w kilku katalogach
+    zmienione w ten sam sposób) różnią się co najwyżej ścieżką i numerami
+    linii, więc wystarczy przeanalizować jeden z nich.
+    """
+    digest = hashlib.sha256(os.path.splitext(file_diff.path)[1].lower().encode('utf-8'))
+    for hunk in file_diff.hunks:
+        digest.update(f"\0@@{hunk.old_count},{hunk.new_count}\0".encode('utf-8'))
+        digest.update("\n".join(hunk.lines).encode('utf-8'))
+    if file_diff.truncated:
+        digest.update(b"\0truncated")
+    return digest.hexdigest()
+
+
+def group_identical_diffs(file_diffs: List[FileDiff]) -> Tuple[List[FileDiff], Dict[str, List[FileDiff]]]:
+    """
+    Grupuje pliki o identycznych zmianach.
+
+    Zwraca (pliki do analizy, {ścieżka analizowanego pliku: pozostałe pliki
+    z tymi samymi zmianami}); kolejność plików do analizy jest zachowana.
+    """
+    representatives: Dict[str, FileDiff] = {}
+    duplicates: Dict[str, List[FileDiff]] = {}
+    for file_diff in file_diffs:
+        fingerprint = diff_fingerprint(file_diff)
+        representative = representatives.setdefault(fingerprint, file_diff)
+        if representative is not file_diff:
+            duplicates.setdefault(representative.path, []).append(file_diff)
+    return list(representatives.values()), duplicates
+
+
+def project_line(source: FileDiff, target: FileDiff, line_number: int) -> int:
+    """
+    Przenosi numer linii (nowej wersji) z pliku source na plik target o identycznych hunkach.
+
+    Linia wewnątrz hunka lub za nim jest przesuwana o różnicę początków
+    odpowiadających sobie hunków.
+    """
+    offset = 0
+    for index, (source_hunk, target_hunk) in enumerate(zip(source.hunks, target.hunks)):
+        if index and line_number < source_hunk.new_start:
+            break
+        offset = target_hunk.new_start - source_hunk.new_start
+    return max(1, line_number + offset)
+
+
+# Domyślnie pomijane pliki (wzorce jak w .gitignore; "katalog/" oznacza katalog na dowolnej głębokości)
+DEFAULT_EXCLUDE_PATTERNS = (
+    '*.min.js', '*.min.css', '*.map', '*.lock', '*.sum', 'package-lock.json', 'pnpm-lock.yaml',
+    '*.svg', '*.png', '*.jpg', '*.gif', '*.ico', '*.webp', '*.pdf', '*.woff', '*.woff2',
+    'node_modules/', 'vendor/', 'dist/', 'build/'
+)
+
+# Nagłówki plików generowanych ("Code generated ... DO NOT EDIT." z Go, "@generated")
+GENERATED_MARKER_RE = re.compile(r'Code generated .* DO NOT EDIT|@generated\b|<auto-generated')
+
+# Atrybuty .gitattributes sprawdzane przez `git check-attr`
+CLASSIFIER_ATTRIBUTES = ('diff', 'linguist-generated', 'linguist-vendored')
+
+
+def _glob_to_regex(pattern: str) -> str:
+    """
+    Tłumaczy wzorzec w stylu .gitignore na wyrażenie regularne.
+
+    Wzorzec bez "/" pasuje do nazwy na dowolnej głębokości, "/" na początku
+    lub w środku zakotwicza go w katalogu głównym repozytorium, "/" na końcu
+    oznacza katalog, "**" dowolną liczbę katalogów.
+    """
+    directory = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+
+    regex = []
+    index = 0
+    while index < len(pattern):
+        if pattern.startswith('**/', index):
+            regex.append('(?:.*/)?')
+            index += 3
+        elif pattern.startswith('**', index):
+            regex.append('.*')
+            index += 2
+        elif pattern[index] == '*':
+            regex.append('[^/]*')
+            index += 1
+        elif pattern[index] == '?':
+            regex.append('[^/]')
+            index += 1
+        else:
+            regex.append(re.escape(pattern[index]))
+            index += 1
+
+    prefix = '' if anchored else '(?:.*/)?'
+    suffix = '/.*' if directory else '(?:/.*)?'
+    return prefix + ''.join(regex) + suffix
+
+
+class FileClassifier:
+    """
+    Decyduje, które zmienione pliki trafiają do review.
+
+    Wzorce include/exclude są kompilowane raz do pojedynczych wyrażeń
+    regularnych. Poza ścieżką brane są pod uwagę atrybuty .gitattributes
+    (linguist-generated, linguist-vendored, -diff/binary), statystyki
+    `git diff --numstat` (pliki binarne i zbyt duże zmiany) oraz nagłówki
+    plików generowanych. Pominięte pliki i oszczędzone tokeny trafiają do
+    raportu w review-results.json.
+    """
+
+    def __init__(self, exclude_patterns: Iterable[str] = DEFAULT_EXCLUDE_PATTERNS,
+                 include_patterns: Iterable[str] = (), max_changed_lines: int = 5_000):
+        self.exclude_patterns = list(exclude_patterns)
+        self.include_patterns = list(include_patterns)
+        self.max_changed_lines = max(0, max_changed_lines)
+        self._exclude_re = self._compile(self.exclude_patterns)
+        self._include_re = self._compile(self.include_patterns)
+        self.skipped: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _compile(patterns: List[str]) -> Optional['re.Pattern']:
+        if not patterns:
+            return None
+        return re.compile('|'.join(f'(?:{_glob_to_regex(pattern)})' for pattern in patterns))
+
+    def classify_path(self, file_path: str) -> Optional[str]:
+        """Zwraca powód pominięcia pliku na podstawie samej ścieżki (None = do review)"""
+        if self._include_re is not None and not self._include_re.fullmatch(file_path):
+            return 'not_included'
+        if self._exclude_re is not None and self._exclude_re.fullmatch(file_path):
+            return 'excluded'
+        return None
+
+    def classify(self, file_path: str, numstat: Optional[Tuple[int, int, bool]] = None,
+                 attributes: Optional[Dict[str, str]] = None) -> Optional[str]:
+        """Zwraca powód pominięcia pliku (None = do review)"""
+        reason = self.classify_path(file_path)
+        if reason:
+            return reason
+
+        attributes = attributes or {}
+        if attributes.get('linguist-generated') in ('set', 'true'):
+            return 'generated'
+        if attributes.get('linguist-vendored') in ('set', 'true'):
+            return 'vendored'
+        if attributes.get('diff') == 'unset':
+            return 'no_diff'
+
+        if numstat is not None:
+            added, removed, binary = numstat
+            if binary:
+                return 'binary'
+            if self.max_changed_lines and added + removed > self.max_changed_lines:
+                return 'oversized'
+
+        return None
+
+    def detect_generated(self, file_diff: FileDiff) -> bool:
+        """Sprawdza, czy początek pliku w diffie zawiera znacznik kodu generowanego"""
+        for hunk in file_diff.hunks[:1]:
+            if hunk.new_start > 5:
+                return False
+            for line in hunk.lines[:10]:
+                if not line.startswith('-') and GENERATED_MARKER_RE.search(line):
+                    return True
+        return False
+
+    def record_skip(self, file_path: str, reason: str, size_bytes: int) -> None:
+        """Zapisuje pominięty plik w raporcie"""
+        self.skipped[file_path] = {
+            "reason": reason,
+            "estimated_tokens": (size_bytes + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        }
+
+    def report(self) -> Dict[str, Any]:
+        """Raport pominiętych plików do review-results.json"""
+        by_reason: Dict[str, int] = {}
+        for entry in self.skipped.values():
+            by_reason[entry['reason']] = by_reason.get(entry['reason'], 0) + 1
+
+        return {
+            "count": len(self.skipped),
+            "estimated_tokens_saved": sum(entry['estimated_tokens'] for entry in self.skipped.values()),
+            "by_reason": by_reason,
+            "files": self.skipped
+        }
+
+
+# Przybliżona liczba znaków na token (kod i diffy; bez wywołania API)
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Szacuje liczbę tokenów tekstu lokalnie"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _split_hunk(hunk: DiffHunk, max_tokens: int) -> List[DiffHunk]:
+    """Dzieli zbyt duży hunk na mniejsze z przeliczonymi nagłówkami @@"""
+    pieces = []
+    old_line, new_line = hunk.old_start, hunk.new_start
+    lines: List[str] = []
+    tokens = 0
+    piece_old_start, piece_new_start = old_line, new_line
+
+    def flush() -> None:
+        old_count = sum(1 for line in lines if not line.startswith(('+', '\\')))
+        new_count = sum(1 for line in lines if not line.startswith(('-', '\\')))
+        header = f"@@ -{piece_old_start},{old_count} +{piece_new_start},{new_count} @@"
+        pieces.append(DiffHunk(header, piece_old_start, old_count, piece_new_start, new_count, list(lines)))
+
+    for line in hunk.lines:
+        line_tokens = estimate_tokens(line + "\n")
+        if lines and tokens + line_tokens > max_tokens:
+            flush()
+            lines, tokens = [], 0
+            piece_old_start, piece_new_start = old_line, new_line
+
+        lines.append(line)
+        tokens += line_tokens
+        if line.startswith('+'):
+            new_line += 1
+        elif line.startswith('-'):
+            old_line += 1
+        elif not line.startswith('\\'):
+            old_line += 1
+            new_line += 1
+
+    if lines:
+        flush()
+    return pieces
+
+
+def split_file_diff(file_diff: FileDiff, max_tokens: int) -> List[FileDiff]:
+    """
+    Dzieli diff pliku na części mieszczące się w budżecie tokenów.
+
+    Podział następuje na granicach hunków (hunk większy niż budżet jest
+    dzielony na mniejsze). Nagłówki @@ zachowują oryginalne numery linii,
+    więc komentarze z każdej części odnoszą się do właściwych linii pliku.
+    """
+    if max_tokens <= 0 or estimate_tokens(file_diff.text) <= max_tokens:
+        return [file_diff]
+
+    header_tokens = estimate_tokens("\n".join(file_diff.header_lines) + "\n")
+    hunk_budget = max(1, max_tokens - header_tokens)
+
+    chunks: List[FileDiff] = []
+    current: List[DiffHunk] = []
+    tokens = 0
+
+    def flush() -> None:
+        lines = [line for hunk in current for line in hunk.lines]
+        chunks.append(FileDiff(
+            path=file_diff.path,
+            old_path=file_diff.old_path,
+            header_lines=file_diff.header_lines,
+            hunks=list(current),
+            added=sum(1 for line in lines if line.startswith('+')),
+            removed=sum(1 for line in lines if line.startswith('-')),
+            binary=file_diff.binary
+        ))
+
+    for hunk in file_diff.hunks:
+        hunk_tokens = estimate_tokens(hunk.header + "\n" + "\n".join(hunk.lines) + "\n")
+        pieces = [hunk] if hunk_tokens <= hunk_budget else _split_hunk(hunk, hunk_budget)
+
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece.header + "\n" + "\n".join(piece.lines) + "\n")
+            if current and tokens + piece_tokens > hunk_budget:
+                flush()
+                current, tokens = [], 0
+            current.append(piece)
+            tokens += piece_tokens
+
+    if current:
+        flush()
+
+    # Informacja o obcięciu trafia do ostatniej części
+    chunks[-1].truncated = file_diff.truncated
+    chunks[-1].size_bytes = file_diff.size_bytes
+    return chunks
+
+
+def pack_small_diffs(file_diffs: List[FileDiff], max_tokens: int,
+                     max_file_tokens: int) -> Tuple[List[List[FileDiff]], List[FileDiff]]:
+    """
+    Grupuje małe diffy w paczki mieszczące się w budżecie tokenów.
+
+    Pliki przychodzą w kolejności z git diff (posortowane po ścieżce), więc
+    zachłanne wypełnianie paczek w tej kolejności trzyma razem pliki z tego
+    samego katalogu. Zwraca (paczki co najmniej dwóch plików, pozostałe pliki).
+    """
+    small = [fd for fd in file_diffs if estimate_tokens(fd.text) <= max_file_tokens]
+    large = [fd for fd in file_diffs if estimate_tokens(fd.text) > max_file_tokens]
+
+    # Katalog jako pierwszy klucz: pliki z jednego katalogu trafiają do tej samej paczki
+    small.sort(key=lambda fd: (os.path.dirname(fd.path), fd.path))
+
+    packs: List[List[FileDiff]] = []
+    current: List[FileDiff] = []
+    tokens = 0
+    for file_diff in small:
+        file_tokens = estimate_tokens(file_diff.text)
+        if current and tokens + file_tokens > max_tokens:
+            packs.append(current)
+            current, tokens = [], 0
+        current.append(file_diff)
+        tokens += file_tokens
+    if current:
+        packs.append(current)
+
+    # Pojedyncze pliki nie zyskują na pakowaniu
+    singles = [pack[0] for pack in packs if len(pack) == 1]
+    return [pack for pack in packs if len(pack) > 1], large + singles
+
+
+class ReviewCache:
+    """
+    Trwały cache wyników review adresowany treścią.
+
+    Kluczem jest hash znormalizowanego diffa pliku, szablonu promptu, promptu
+    systemowego i nazwy modelu, więc niezmienione pliki nie są ponownie
+    wysyłane do API przy kolejnych pipeline'ach. Katalog nadaje się do
+    sekcji `cache:` GitLab CI; po przekroczeniu max_bytes usuwane są
+    najdawniej używane wpisy (LRU wg mtime).
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 100 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(file_path: str, diff: str, model: str, system_prompt: str, prompt_template: str) -> str:
+        """Buduje klucz cache z treści zapytania"""
+        # Linie "index abc..def" zmieniają się po rebase mimo identycznych zmian
+        normalized_diff = "\n".join(
+            line.rstrip() for line in diff.splitlines() if not line.startswith('index ')
+        )
+        payload = json.dumps(
+            [model, system_prompt, prompt_template, file_path, normalized_diff],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def contains(self, key: str) -> bool:
+        """Sprawdza, czy wpis istnieje (bez liczenia trafienia i odświeżania LRU)"""
+        return os.path.exists(self._entry_path(key))
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Zwraca zapisane komentarze lub None, jeśli wpisu nie ma"""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)  # Odśwież pozycję w LRU
+        except (OSError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return entry.get('comments', [])
+
+    def put(self, key: str, comments: List[Dict[str, Any]]) -> None:
+        """Zapisuje komentarze pod danym kluczem (atomowo)"""
+        path = self._entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"comments": comments}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Nie udało się zapisać wpisu cache {key}: {e}")
+            return
+
+        with self._lock:
+            self.writes += 1
+
+    def _entries(self) -> List[Tuple[str, os.stat_result]]:
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.json'):
+                    path = os.path.join(root, name)
+                    try:
+                        entries.append((path, os.stat(path)))
+                    except OSError:
+                        continue
+        return entries
+
+    def prune(self) -> None:
+        """Usuwa najdawniej używane wpisy, aż rozmiar cache zmieści się w max_bytes"""
+        entries = self._entries()
+        total = sum(stat.st_size for _, stat in entries)
+        if total <= self.max_bytes:
+            return
+
+        for path, stat in sorted(entries, key=lambda entry: entry[1].st_mtime):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= stat.st_size
+            self.evictions += 1
+
+        logger.info(f"Cache review: usunięto {self.evictions} najstarszych wpisów")
+
+    def stats(self) -> Dict[str, Any]:
+        """Statystyki trafień cache do review-results.json"""
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "directory": self.directory,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "size_bytes": sum(stat.st_size for _, stat in entries)
+        }
+
+
+class ReviewJournal:
+    """
+    Dziennik postępu review w formacie JSON Lines.
+
+    Wynik pliku jest dopisywany (z fsync) zaraz po zakończeniu jego analizy,
+    z kluczem będącym hashem ścieżki i diffa. Po przerwaniu joba (timeout,
+    eviction runnera) uruchomienie z resume=True pomija pliki, których
+    klucz jest już w dzienniku, i bierze ich komentarze z dziennika.
+    Dziennik jest przepisywany od nowa w każdym uruchomieniu, więc zawiera
+    tylko pliki bieżącego diffa.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = self._load(path) if resume else {}
+        self.resumed_files: List[str] = []
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'w', encoding='utf-8')
+
+    @staticmethod
+    def make_key(file_diff: 'FileDiff') -> str:
+        """Klucz wpisu: hash ścieżki i treści diffa pliku"""
+        payload = json.dumps([file_diff.path, file_diff.text], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _load(path: str) -> Dict[str, Dict[str, Any]]:
+        entries: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line_number, line in enumerate(f, start=1):
+                    try:
+                        entry = json.loads(line)
+                        entries[entry['key']] = entry
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        # Ostatnia linia mogła zostać ucięta przy przerwaniu joba
+                        logger.warning(f"Pomijam uszkodzoną linię {line_number} dziennika {path}")
+        except FileNotFoundError:
+            logger.info(f"Brak dziennika {path} - review od początku")
+        return entries
+
+    def get(self, file_diff: 'FileDiff') -> Optional[List[ReviewComment]]:
+        """Zwraca komentarze pliku z poprzedniego uruchomienia (i przenosi wpis do nowego dziennika)"""
+        entry = self.entries.get(self.make_key(file_diff))
+        if entry is None:
+            return None
+
+        try:
+            comments = [ReviewComment(**item) for item in entry.get('comments', [])]
+        except TypeError:
+            return None
+        self.resumed_files.append(file_diff.path)
+        self._write(entry)
+        return comments
+
+    def record(self, file_diff: 'FileDiff', comments: List[ReviewComment]) -> None:
+        """Dopisuje wynik przeanalizowanego pliku"""
+        self._write({
+            "key": self.make_key(file_diff),
+            "file_path": file_diff.path,
+            "comments": [asdict(comment) for comment in comments]
+        })
+        with self._lock:
+            self.recorded += 1
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Statystyki dziennika do review-results.json"""
+        return {
+            "path": self.path,
+            "resumed_files": self.resumed_files,
+            "recorded": self.recorded
+        }
+
+
+class ResultsStreamWriter:
+    """
+    Wyniki review w formacie JSON Lines zapisywane w trakcie analizy.
+
+    Pierwsza linia to nagłówek ({"type": "header"}), kolejne to komentarze
+    ({"type": "comment"} i pola ReviewComment) dopisywane, gdy tylko są
+    gotowe, a ostatnia - podsumowanie ({"type": "summary"}) z save_results.
+    Plik bez podsumowania oznacza przerwane review. post_comments.py czyta
+    go strumieniowo, bez wczytywania wszystkich komentarzy do pamięci, a
+    save_results buduje z niego review-results.json i raport Code Quality.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path: str, model: str):
+        self.path = path
+        self.comment_count = 0
+        self._file = open(path, 'w', encoding='utf-8')
+        self._write({
+            "type": "header",
+            "version": self.FORMAT_VERSION,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "model": model
+        })
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def write_comments(self, comments: List[ReviewComment]) -> None:
+        """Dopisuje komentarze (po jednym w linii)"""
+        for comment in comments:
+            self._write({"type": "comment", **asdict(comment)})
+        self.comment_count += len(comments)
+        self._file.flush()
+
+    def iter_comments(self) -> Iterator[Dict[str, Any]]:
+        """Czyta zapisane dotąd komentarze (pola ReviewComment), po jednym"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if record.pop('type', None) == 'comment':
+                    yield record
+
+    def write_summary(self, summary: Dict[str, Any]) -> None:
+        """Dopisuje rekord podsumowania i zamyka plik"""
+        if self._file.closed:
+            return
+        self._write({"type": "summary", "total_comments": self.comment_count, "summary": summary})
+        self._file.close()
+        logger.info(f"Zapisano {self.comment_count} komentarzy do {self.path}")
+
+
+def _write_json_array(f, items: Iterable[Any], level: int = 0, ensure_ascii: bool = True) -> int:
+    """Zapisuje tablicę JSON (wcięcie 2) element po elemencie, bez budowania listy; zwraca liczbę elementów"""
+    padding = '  ' * (level + 1)
+    count = 0
+    f.write('[')
+    for item in items:
+        f.write(',\n' if count else '\n')
+        f.write(padding + json.dumps(item, indent=2, ensure_ascii=ensure_ascii).replace('\n', '\n' + padding))
+        count += 1
+    if count:
+        f.write('\n' + '  ' * level)
+    f.write(']')
+    return count
+
+
+def _write_json_object(f, fields: Dict[str, Any], array_key: str, array_items: Iterable[Any],
+                       ensure_ascii: bool = True) -> int:
+    """
+    Zapisuje obiekt JSON (wcięcie 2): pola fields, a na końcu tablicę array_key
+    zapisywaną element po elemencie przez _write_json_array; zwraca liczbę elementów.
+    """
+    f.write('{\n')
+    for key, value in fields.items():
+        text = json.dumps(value, indent=2, ensure_ascii=ensure_ascii).replace('\n', '\n  ')
+        f.write(f'  {json.dumps(key)}: {text},\n')
+    f.write(f'  {json.dumps(array_key)}: ')
+    count = _write_json_array(f, array_items, level=1, ensure_ascii=ensure_ascii)
+    f.write('\n}\n')
+    return count
+
+
+class IncrementalCommentParser:
+    """
+    Wyciąga kolejne obiekty JSON z tablicy komentarzy w strumieniu odpowiedzi.
+
+    Każdy obiekt jest zwracany, gdy tylko zamknie się jego nawias, więc
+    komentarze z odpowiedzi uciętej w połowie (limit tokenów, zerwane
+    połączenie) nie przepadają.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer: List[str] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Przetwarza kolejny fragment tekstu i zwraca obiekty, które się w nim domknęły"""
+        items = []
+        for char in text:
+            if self.finished:
+                break
+
+            if not self.started:
+                self.started = char == '['
+                continue
+
+            if self._depth == 0:
+                if char == '{':
+                    self._depth = 1
+                    self._buffer = [char]
+                elif char == ']':
+                    self.finished = True
+                continue
+
+            self._buffer.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        items.append(json.loads(''.join(self._buffer)))
+                    except json.JSONDecodeError as e:
+                        logger.debug(f"Pominięto niepoprawny obiekt JSON w strumieniu: {e}")
+                    self._buffer = []
+
+        return items
+
+
+class StreamInterruptedError(Exception):
+    """Strumień odpowiedzi przerwany, zanim przyszedł jakikolwiek komentarz"""
+
+
+class BudgetExceededError(Exception):
+    """Prognoza review przekracza budżet, a --budget-action to refuse"""
+
+
+# Orientacyjne ceny (USD za milion tokenów) i szybkość generowania per rodzina modeli (--plan)
+PLAN_MODEL_PROFILES = {
+    "haiku": {"input_usd_per_mtok": 1.0, "output_usd_per_mtok": 5.0, "output_tokens_per_s": 150.0},
+    "sonnet": {"input_usd_per_mtok": 3.0, "output_usd_per_mtok": 15.0, "output_tokens_per_s": 70.0},
+    "opus": {"input_usd_per_mtok": 15.0, "output_usd_per_mtok": 75.0, "output_tokens_per_s": 40.0},
+}
+
+# Prognoza odpowiedzi: tokeny komentarzy na plik i stały narzut zapytania (połączenie, pierwszy token)
+PLAN_OUTPUT_TOKENS_PER_FILE = 250
+PLAN_REQUEST_OVERHEAD_S = 2.0
+
+
+def _model_profile(model: str) -> Dict[str, float]:
+    """Profil cenowy modelu wg rodziny (nieznane modele liczone jak Sonnet)"""
+    for family, profile in PLAN_MODEL_PROFILES.items():
+        if family in model:
+            return profile
+    return PLAN_MODEL_PROFILES["sonnet"]
+
+
+@dataclass
+class ReviewBudget:
+    """Limity prognozy review (0 = bez limitu) i reakcja na ich przekroczenie"""
+    max_cost_usd: float = 0.0
+    max_requests: int = 0
+    max_input_tokens: int = 0
+    max_wall_s: float = 0.0
+    action: str = 'refuse'  # 'refuse' lub 'downscale'
+
+    def exceeded(self, cost_usd: float, requests: int, input_tokens: int, wall_s: float) -> List[str]:
+        """Zwraca listę przekroczonych limitów"""
+        limits = (
+            ('max_cost_usd', self.max_cost_usd, cost_usd),
+            ('max_requests', self.max_requests, requests),
+            ('max_input_tokens', self.max_input_tokens, input_tokens),
+            ('max_wall_s', self.max_wall_s, wall_s),
+        )
+        return [name for name, limit, value in limits if limit and value > limit]
+
+    @property
+    def is_set(self) -> bool:
+        return any((self.max_cost_usd, self.max_requests, self.max_input_tokens, self.max_wall_s))
+
+
+# Szybszy i tańszy model dla drobnych zmian o niskim ryzyku
+DEFAULT_LIGHT_MODEL = "claude-haiku-4-5-20251001"
+
+# Ścieżki zwiększające ryzyko zmiany (wzorce jak w FileClassifier)
+RISK_PATH_PATTERNS = (
+    'auth/', 'security/', '*auth*', '*login*', '*password*', '*secret*', '*token*', '*crypt*',
+    '*permission*', 'payment*/', 'billing/', 'migrations/', '*.sql', 'Dockerfile', '*.Dockerfile',
+    '.gitlab-ci.yml', '*.tf', '*.sh', 'entrypoint/'
+)
+
+# Ścieżki o niskim ryzyku (dokumentacja, dane)
+LOW_RISK_PATH_PATTERNS = ('*.md', '*.rst', '*.txt', '*.csv', 'docs/', 'LICENSE', 'CHANGELOG*')
+
+# Rozszerzenia plików z kodem wykonywalnym
+CODE_EXTENSIONS = frozenset((
+    '.py', '.js', '.jsx', '.ts', '.tsx', '.go', '.java', '.kt', '.c', '.h', '.cc', '.cpp', '.cs',
+    '.rb', '.php', '.rs', '.scala', '.swift', '.sh', '.sql', '.tf'
+))
+
+
+@dataclass
+class ModelTier:
+    """Model i limit tokenów wyjściowych dla grupy plików"""
+    name: str
+    model: str
+    max_tokens: int
+
+
+class ModelRouter:
+    """
+    Wybiera model dla diffa pliku na podstawie oceny ryzyka.
+
+    Ocena rośnie z rozmiarem zmiany, dla ścieżek z RISK_PATH_PATTERNS
+    i plików z kodem, a maleje dla dokumentacji. Pliki z oceną poniżej
+    progu trafiają do lekkiego modelu, pozostałe do ciężkiego.
+    """
+
+    def __init__(self, light: ModelTier, heavy: ModelTier, threshold: int = 3,
+                 risk_patterns: Iterable[str] = RISK_PATH_PATTERNS,
+                 low_risk_patterns: Iterable[str] = LOW_RISK_PATH_PATTERNS):
+        self.light = light
+        self.heavy = heavy
+        self.threshold = threshold
+        self._risk_re = FileClassifier._compile(list(risk_patterns))
+        self._low_risk_re = FileClassifier._compile(list(low_risk_patterns))
+        self.decisions: Dict[str, Dict[str, Any]] = {}
+
+    def score(self, file_diff: FileDiff) -> Tuple[int, List[str]]:
+        """Zwraca (ocenę ryzyka, powody)"""
+        score = 0
+        reasons = []
+
+        changed = file_diff.added + file_diff.removed
+        if changed > 200 or file_diff.truncated:
+            score += 3
+            reasons.append('large')
+        elif changed > 40:
+            score += 2
+            reasons.append('medium')
+        elif changed > 10:
+            score += 1
+            reasons.append('small')
+
+        if self._risk_re is not None and self._risk_re.fullmatch(file_diff.path):
+            score += 3
+            reasons.append('risky_path')
+
+        if self._low_risk_re is not None and self._low_risk_re.fullmatch(file_diff.path):
+            score -= 2
+            reasons.append('docs')
+        elif os.path.splitext(file_diff.path)[1].lower() in CODE_EXTENSIONS:
+            score += 1
+            reasons.append('code')
+
+        return max(0, score), reasons
+
+    def route(self, file_diff: FileDiff) -> ModelTier:
+        """Wybiera poziom dla pliku i zapisuje decyzję w raporcie"""
+        score, reasons = self.score(file_diff)
+        tier = self.heavy if score >= self.threshold else self.light
+        self.decisions[file_diff.path] = {"tier": tier.name, "score": score, "reasons": reasons}
+        return tier
+
+    def report(self, metrics: 'RequestMetrics') -> Dict[str, Any]:
+        """Raport routingu do review-results.json"""
+        tiers = {}
+        by_model = metrics.by_model()
+        for tier in (self.light, self.heavy):
+            tiers[tier.name] = {
+                "model": tier.model,
+                "max_tokens": tier.max_tokens,
+                "files": sum(1 for decision in self.decisions.values() if decision['tier'] == tier.name),
+                **by_model.get(tier.model, {})
+            }
+
+        return {
+            "threshold": self.threshold,
+            "tiers": tiers,
+            "files": self.decisions
+        }
+
+
+class RequestMetrics:
+    """
+    Zbiera zużycie tokenów i latencję każdego zapytania do Claude API.
+
+    Tokeny zapytań obejmujących kilka plików (paczki) są dzielone po równo
+    między te pliki w zestawieniu per plik.
+    """
+
+    USAGE_FIELDS = ('input_tokens', 'output_tokens', 'cache_read_input_tokens', 'cache_creation_input_tokens')
+
+    def __init__(self):
+        self.requests: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record(self, files: List[str], model: str, usage: Any, latency_s: Optional[float],
+               attempts: int = 1, ttft_s: Optional[float] = None) -> None:
+        """Zapisuje metryki pojedynczego zapytania"""
+        entry = {
+            "files": list(files),
+            "model": model,
+            "latency_s": round(latency_s, 3) if latency_s is not None else None,
+            "ttft_s": round(ttft_s, 3) if ttft_s is not None else None,
+            "attempts": attempts
+        }
+        for name in self.USAGE_FIELDS:
+            entry[name] = getattr(usage, name, None) or 0
+
+        with self._lock:
+            self.requests.append(entry)
+
+    def by_model(self) -> Dict[str, Dict[str, Any]]:
+        """Liczba zapytań, tokeny i latencja w podziale na modele"""
+        with self._lock:
+            requests = list(self.requests)
+
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in requests:
+            grouped.setdefault(entry['model'], []).append(entry)
+
+        result = {}
+        for model, entries in grouped.items():
+            latencies = sorted(entry['latency_s'] for entry in entries if entry['latency_s'] is not None)
+            result[model] = {
+                "requests": len(entries),
+                "input_tokens": sum(entry['input_tokens'] for entry in entries),
+                "output_tokens": sum(entry['output_tokens'] for entry in entries),
+                "latency_s": {"p50": _percentile(latencies, 0.5), "p95": _percentile(latencies, 0.95)}
+            }
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Sekcja metrics do review-results.json"""
+        with self._lock:
+            requests = list(self.requests)
+
+        totals = {name: sum(entry[name] for entry in requests) for name in self.USAGE_FIELDS}
+        latencies = sorted(entry['latency_s'] for entry in requests if entry['latency_s'] is not None)
+        ttfts = sorted(entry['ttft_s'] for entry in requests if entry['ttft_s'] is not None)
+
+        per_file: Dict[str, Dict[str, Any]] = {}
+        for entry in requests:
+            share = 1.0 / max(len(entry['files']), 1)
+            for file_path in entry['files']:
+                stats = per_file.setdefault(file_path, {
+                    "requests": 0, "latency_s": 0.0, **{name: 0.0 for name in self.USAGE_FIELDS}
+                })
+                stats["requests"] += 1
+                stats["latency_s"] += entry['latency_s'] or 0.0
+                for name in self.USAGE_FIELDS:
+                    stats[name] += entry[name] * share
+
+        for stats in per_file.values():
+            stats["latency_s"] = round(stats["latency_s"], 3)
+            for name in self.USAGE_FIELDS:
+                stats[name] = round(stats[name])
+
+        input_total = totals['input_tokens'] + totals['cache_read_input_tokens'] + totals['cache_creation_input_tokens']
+        return {
+            "requests": len(requests),
+            **totals,
+            "cache_read_ratio": round(totals['cache_read_input_tokens'] / input_total, 3) if input_total else 0.0,
+            "latency_s": {
+                "total": round(sum(latencies), 3),
+                "p50": _percentile(latencies, 0.5),
+                "p95": _percentile(latencies, 0.95),
+                "max": latencies[-1] if latencies else None
+            },
+            "ttft_s": {
+                "p50": _percentile(ttfts, 0.5),
+                "p95": _percentile(ttfts, 0.95)
+            },
+            "per_file": per_file
+        }
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Percentyl (metoda nearest-rank) z posortowanej listy"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Ogranicza liczbę równoległych zapytań do Claude API.
+
+    Limit rośnie addytywnie po każdym udanym zapytaniu (do max_concurrency),
+    a po odpowiedzi 429/529 spada o połowę i wstrzymuje nowe zapytania na czas
+    z nagłówka retry-after. Nagłówki anthropic-ratelimit-* obniżają limit,
+    gdy zostało mniej dostępnych zapytań niż aktualnie dopuszczamy.
+    """
+
+    def __init__(self, max_concurrency: int, min_concurrency: int = 1):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self._limit = float(self.max_concurrency)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        """Aktualna liczba dopuszczalnych równoległych zapytań"""
+        return max(self.min_concurrency, int(self._limit))
+
+    def acquire(self) -> None:
+        """Czeka na wolny slot (i koniec ewentualnej pauzy po 429/529)"""
+        with self._condition:
+            while True:
+                delay = self._paused_until - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                if self._in_flight < self.limit:
+                    self._in_flight += 1
+                    return
+                self._condition.wait()
+
+    def release(self) -> None:
+        """Zwalnia slot po zakończonym zapytaniu"""
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self, headers: Mapping[str, str]) -> None:
+        """Aktualizuje limit na podstawie nagłówków rate-limit udanej odpowiedzi"""
+        with self._condition:
+            self._limit = min(float(self.max_concurrency), self._limit + 1.0 / max(self._limit, 1.0))
+
+            remaining = _parse_header_number(headers, 'anthropic-ratelimit-requests-remaining')
+            if remaining is not None and remaining < self._limit:
+                self._limit = max(float(self.min_concurrency), remaining)
+
+            self._condition.notify_all()
+
+    def on_throttle(self, retry_after: Optional[float]) -> None:
+        """Reaguje na 429/529: zmniejsza limit o połowę i wstrzymuje nowe zapytania"""
+        with self._condition:
+            self._limit = max(float(self.min_concurrency), self._limit / 2)
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            logger.warning(
+                f"Limit zapytań API osiągnięty - równoległość zmniejszona do {self.limit}"
+                + (f", pauza {retry_after:.1f}s" if retry_after else "")
+            )
+            self._condition.notify_all()
+
+
+def _parse_header_number(headers: Optional[Mapping[str, str]], name: str) -> Optional[float]:
+    """Zwraca wartość liczbową nagłówka lub None"""
+    if headers is None:
+        return None
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
 class CodeReviewer:
     """Główna klasa do przeprowadzania review kodu z Claude"""
 
-    def __init__(self, api_key: str = None):
-        """Inicjalizacja z kluczem API"""
+    # Statusy HTTP, po których ponawiamy zapytanie do API
+    RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+    THROTTLE_STATUSES = {429, 529}
+
+    # Message Batches API
+    BATCH_MAX_REQUESTS = 10_000
+    BATCH_POLL_INITIAL_DELAY = 5.0
+    BATCH_POLL_MAX_DELAY = 60.0
+
+    def __init__(self, api_key: str = None, concurrency: int = 4, max_retries: int = 4,
+                 max_diff_bytes: int = 100_000, cache: Optional[ReviewCache] = None,
+                 model: str = DEFAULT_MODEL, max_input_tokens: int = 20_000,
+                 pack_tokens: int = 0, pack_file_tokens: int = 1_000,
+                 batch: bool = False, batch_timeout: float = 6 * 3600, stream: bool = True,
+                 classifier: Optional[FileClassifier] = None, context_lines: int = 3,
+                 ignore_whitespace: bool = False, ignore_comments: bool = False, dedup: bool = True,
+                 router: Optional[ModelRouter] = None, time_budget: float = 0,
+                 journal: Optional[ReviewJournal] = None,
+                 results_stream: Optional[ResultsStreamWriter] = None,
+                 client: Optional[Anthropic] = None, repo_path: Optional[str] = None,
+                 limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+                 budget: Optional[ReviewBudget] = None, plan_only: bool = False, plan_rpm: int = 0):
+        """
+        Inicjalizacja z kluczem API
+
+        Args:
+            api_key: Klucz Claude API (domyślnie z ANTHROPIC_API_KEY)
+            concurrency: Maksymalna liczba plików analizowanych równolegle
+            max_retries: Liczba ponowień zapytania po błędach 429/529/5xx
+            max_diff_bytes: Maksymalny rozmiar diffa jednego pliku (0 = bez limitu)
+            cache: Cache wyników review (None = wyłączony)
+            model: Model Claude używany do analizy
+            max_input_tokens: Budżet tokenów wejściowych jednego zapytania (0 = bez podziału)
+            pack_tokens: Budżet tokenów paczki małych plików w jednym zapytaniu (0 = bez pakowania)
+            pack_file_tokens: Maksymalny rozmiar diffa (w tokenach), przy którym plik trafia do paczki
+            batch: Wysyłaj wszystkie prompty jako jedno zadanie Message Batches
+            batch_timeout: Maksymalny czas oczekiwania na wyniki batcha (w sekundach)
+            stream: Odbieraj odpowiedzi strumieniowo i parsuj komentarze na bieżąco
+            classifier: Reguły pomijania plików (domyślnie FileClassifier())
+            context_lines: Liczba linii kontekstu wokół zmian
+            ignore_whitespace: Pomijaj zmiany dotyczące tylko białych znaków
+            ignore_comments: Pomijaj zmiany dotyczące tylko komentarzy
+            dedup: Analizuj raz pliki z identycznymi zmianami i przenoś komentarze na kopie
+            router: Wybór modelu i limitu tokenów per plik (None = zawsze model z parametru model)
+            time_budget: Czas na review w sekundach liczony od utworzenia obiektu (0 = bez limitu)
+            journal: Dziennik wyników plików do wznawiania przerwanego review (None = bez dziennika)
+            results_stream: Zapis komentarzy w JSON Lines w trakcie review (None = tylko review-results.json)
+            client: Współdzielony klient Anthropic (np. w review_service.py); musi mieć max_retries=0
+            repo_path: Katalog repozytorium dla poleceń git (None = bieżący katalog)
+            limiter: Współdzielony limiter zapytań (None = własny z limitem concurrency)
+            budget: Limity prognozy review; przekroczenie przerywa albo okraja review
+            plan_only: Tylko prognoza zapytań, tokenów, kosztu i czasu (bez wywołań API, bez klucza API)
+            plan_rpm: Limit zapytań na minutę przyjmowany w prognozie czasu (0 = bez limitu)
+        """
         self.api_key = api_key or os.environ.get('ANTHROPIC_API_KEY')
-        if not self.api_key:
+        if not self.api_key and client is None and not plan_only:
             raise ValueError("Brak klucza API. Ustaw ANTHROPIC_API_KEY w zmiennych środowiskowych")
 
-        self.client = Anthropic(api_key=self.api_key)
+        # Ponowienia obsługujemy sami, żeby limiter widział odpowiedzi 429/529;
+        # prognoza (plan_only) nie wywołuje API, więc nie potrzebuje klienta ani klucza
+        if client is None and not plan_only:
+            client = Anthropic(api_key=self.api_key, max_retries=0)
+        self.client = client
+        self.repo_path = repo_path
         self.comments: List[ReviewComment] = []
 
-    def get_diff(self, base_sha: str) -> Dict[str, str]:
-        """Pobiera diff między base SHA a HEAD"""
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max(0, max_retries)
+        self.limiter = limiter or AdaptiveConcurrencyLimiter(self.concurrency)
+        self.max_diff_bytes = max(0, max_diff_bytes)
+        self.cache = cache
+        self.model = model
+        self.max_input_tokens = max(0, max_input_tokens)
+        self.pack_tokens = max(0, pack_tokens)
+        self.pack_file_tokens = max(0, pack_file_tokens)
+        self.batch = batch
+        self.batch_timeout = batch_timeout
+        self.stream = stream
+        self.classifier = classifier or FileClassifier()
+        self.context_lines = max(0, context_lines)
+        self.ignore_whitespace = ignore_whitespace
+        self.ignore_comments = ignore_comments
+        self.diff_stats: Dict[str, Dict[str, int]] = {}
+        self.renamed_paths: Dict[str, str] = {}
+        self.dedup = dedup
+        self.router = router
+        self.default_tier = ModelTier(name='default', model=model, max_tokens=4000)
+        self.scorer = router or ModelRouter(light=self.default_tier, heavy=self.default_tier)
+        self.time_budget = time_budget
+        self.deadline = time.monotonic() + time_budget if time_budget > 0 else None
+        self.unreviewed_files: List[str] = []
+        self.interrupted = False
+        self.journal = journal
+        self.budget = budget
+        self.plan_only = plan_only
+        self.plan_rpm = plan_rpm
+        self.plan: Optional[Dict[str, Any]] = None
+        self.results_stream = results_stream
+        self.failed_files: Set[str] = set()
+        self._failed_lock = threading.Lock()
+        # Ustawiane po zakończeniu planowania - spóźnione jednostki pracy są pomijane
+        self._units_closed = threading.Event()
+        self.duplicate_files: Dict[str, List[str]] = {}
+        self.batch_ids: List[str] = []
+        self.metrics = RequestMetrics()
+
+        # Wywoływane dla każdego komentarza dodanego do wyników (plik po pliku, w trakcie review)
+        self.on_comment: Optional[Callable[[ReviewComment], None]] = None
+
+        # Zakres i tryb ostatniego review (zapisywane w wynikach)
+        self.review_mode = "full"
+        self.head_sha: Optional[str] = None
+        self.reviewed_range: Optional[str] = None
+
+    @traced('get_diff')
+    def get_diff(self, base_sha: str) -> Dict[str, FileDiff]:
+        """
+        Pobiera diff między base SHA a HEAD
+
+        Uruchamia jeden proces `git diff` i parsuje jego wyjście strumieniowo,
+        plik po pliku, zamiast osobnego procesu dla każdego zmienionego pliku.
+        Pliki do pominięcia są wybierane wcześniej na podstawie
+        `git diff --numstat` i atrybutów z .gitattributes, więc ich treść
+        nie jest nawet trzymana w pamięci.
+        """
         diff_range = f"{base_sha}..HEAD"
+        command = [
+            "git", "-c", "core.quotePath=off", "diff", "--no-color", "--no-ext-diff",
+            "--src-prefix=a/", "--dst-prefix=b/", *self._diff_options(), diff_range
+        ]
 
+        diffs = {}
+        renamed: List[FileDiff] = []
         try:
-            # Pobierz listę zmienionych plików
-            result = subprocess.run(
-                ["git", "diff", diff_range, "--name-only"],
-                check=True,
+            numstat = self._get_numstat(diff_range)
+            attributes = self._get_attributes(list(numstat))
+            skip_reasons = {}
+            for file_path, stats in numstat.items():
+                reason = self.classifier.classify(file_path, stats, attributes.get(file_path))
+                if reason:
+                    skip_reasons[file_path] = reason
+
+            with subprocess.Popen(
+                command,
+                cwd=self.repo_path,
                 stdout=subprocess.PIPE,
-                text=True
-            )
-            changed_files = result.stdout.strip().splitlines()
-
-            diffs = {}
-            for file_path in changed_files:
-                if not file_path:
-                    continue
-
-                # Pomijaj pliki binarne i niektóre rozszerzenia
-                if self._should_skip_file(file_path):
-                    logger.info(f"Pomijam plik: {file_path}")
-                    continue
-
-                # Pobierz diff dla konkretnego pliku
-                file_diff = subprocess.run(
-                    ["git", "diff", diff_range, "--", file_path],
-                    check=True,
-                    stdout=subprocess.PIPE,
-                    text=True
-                )
-                diff_content = file_diff.stdout
-
-                if diff_content:
-                    diffs[file_path] = diff_content
+                text=True,
+                encoding='utf-8',
+                errors='replace'
+            ) as process:
+                for file_diff in parse_diff_stream(
+                    process.stdout, self.max_diff_bytes, skip=lambda path: path in skip_reasons
+                ):
+                    # Pomijaj pliki binarne, generowane i pasujące do wzorców
+                    reason = (
+                        skip_reasons.get(file_diff.path)
+                        or ('binary' if file_diff.binary else None)
+                        or self.classifier.classify_path(file_diff.path)
+                        or ('generated' if self.classifier.detect_generated(file_diff) else None)
+                    )
+                    if reason:
+                        self.classifier.record_skip(file_diff.path, reason, file_diff.size_bytes)
+                        logger.info(f"Pomijam plik: {file_diff.path} ({reason})")
+                        continue
+
+                    if file_diff.old_path != file_diff.path:
+                        renamed.append(file_diff)
+
+                    stats = normalize_file_diff(
+                        file_diff, self.context_lines, self.ignore_whitespace, self.ignore_comments
+                    )
+                    if stats["lines"]:
+                        self._record_normalization(file_diff.path, stats["lines"], stats["bytes"], stats)
+
+                    if not file_diff.hunks:
+                        if file_diff.old_path != file_diff.path and not file_diff.copied:
+                            self.renamed_paths[file_diff.old_path] = file_diff.path
+                        continue
+
+                    if file_diff.truncated:
+                        logger.warning(
+                            f"Diff pliku {file_diff.path} obcięty do {self.max_diff_bytes} bajtów"
+                        )
+
+                    diffs[file_diff.path] = file_diff
+
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(process.returncode, command)
+
+            if renamed:
+                self._measure_renames(diff_range, renamed)
 
             return diffs
 
-        except subprocess.CalledProcessError as e:
+        except (OSError, subprocess.CalledProcessError) as e:
             logger.error(f"Błąd podczas pobierania diff: {e}")
             return {}
 
-    def _should_skip_file(self, file_path: str) -> bool:
-        """Sprawdza czy plik powinien być pominięty w review"""
-        skip_extensions = {'.min.js', '.min.css', '.lock', '.sum', '.svg', '.png', '.jpg', '.gif'}
-        skip_dirs = {'node_modules/', 'vendor/', 'dist/', 'build/'}
+    @traced('git.numstat')
+    def _get_numstat(self, diff_range: str) -> Dict[str, Tuple[int, int, bool]]:
+        """Zwraca {ścieżka: (dodane, usunięte, binarny)} z `git diff --numstat`"""
+        result = subprocess.run(
+            ["git", "diff", "--numstat", "-z", "-M", "-C", diff_range],
+            cwd=self.repo_path,
+            check=True,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            errors='replace'
+        )
+
+        numstat = {}
+        fields = result.stdout.split('\0')
+        index = 0
+        while index < len(fields):
+            record = fields[index]
+            index += 1
+            if not record:
+                continue
+
+            added, removed, file_path = record.split('\t', 2)
+            if not file_path:
+                # Zmiana nazwy: po rekordzie następują stara i nowa ścieżka
+                file_path = fields[index + 1]
+                index += 2
+
+            binary = added == '-' and removed == '-'
+            numstat[file_path] = (0 if binary else int(added), 0 if binary else int(removed), binary)
+
+        return numstat
+
+    @traced('git.check_attr')
+    def _get_attributes(self, paths: List[str]) -> Dict[str, Dict[str, str]]:
+        """Zwraca atrybuty z .gitattributes dla podanych ścieżek (jedno wywołanie git check-attr)"""
+        if not paths:
+            return {}
 
-        # Sprawdź rozszerzenia
-        for ext in skip_extensions:
-            if file_path.endswith(ext):
-                return True
+        try:
+            result = subprocess.run(
+                ["git", "check-attr", "-z", "--stdin", *CLASSIFIER_ATTRIBUTES],
+                input='\0'.join(paths) + '\0',
+                cwd=self.repo_path,
+                check=True,
+                stdout=subprocess.PIPE,
+                text=True,
+                encoding='utf-8',
+                errors='replace'
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning(f"Nie udało się odczytać .gitattributes: {e}")
+            return {}
 
-        # Sprawdź katalogi
-        for dir_name in skip_dirs:
-            if dir_name in file_path:
-                return True
+        attributes: Dict[str, Dict[str, str]] = {}
+        fields = result.stdout.split('\0')
+        for index in range(0, len(fields) - 2, 3):
+            file_path, name, value = fields[index:index + 3]
+            if value != 'unspecified':
+                attributes.setdefault(file_path, {})[name] = value
+
+        return attributes
+
+    def _diff_options(self) -> List[str]:
+        """Opcje git diff: wykrywanie zmian nazw i kopii oraz liczba linii kontekstu"""
+        return ["-M", "-C", f"-U{self.context_lines}"]
+
+    def _record_normalization(self, file_path: str, lines: int, size_bytes: int,
+                              details: Optional[Dict[str, int]] = None) -> None:
+        """Zapisuje liczbę linii i tokenów usuniętych z diffa pliku"""
+        entry = self.diff_stats.setdefault(file_path, {"lines_removed": 0, "estimated_tokens_removed": 0})
+        entry["lines_removed"] += lines
+        entry["estimated_tokens_removed"] += max(0, size_bytes) // CHARS_PER_TOKEN
+        for name, value in (details or {}).items():
+            if name.endswith('_lines') and value:
+                entry[name] = entry.get(name, 0) + value
+
+    @traced('git.renames')
+    def _measure_renames(self, diff_range: str, renamed: List[FileDiff]) -> None:
+        """
+        Szacuje, ile linii zaoszczędziło wykrycie zmian nazw i kopii.
+
+        Bez -M/-C przeniesiony plik trafiłby do modelu jako pełne usunięcie
+        i pełne dodanie; rozmiar takiego diffa jest liczony (bez buforowania
+        treści) z `git diff --no-renames` ograniczonego do tych ścieżek.
+        """
+        paths = []
+        for file_diff in renamed:
+            paths.append(file_diff.path)
+            if not file_diff.copied:
+                paths.append(file_diff.old_path)
+
+        raw: Dict[str, FileDiff] = {}
+        for offset in range(0, len(paths), 500):
+            command = [
+                "git", "-c", "core.quotePath=off", "diff", "--no-color", "--no-ext-diff", "--no-renames",
+                "--src-prefix=a/", "--dst-prefix=b/", f"-U{self.context_lines}", diff_range,
+                "--", *paths[offset:offset + 500]
+            ]
+            try:
+                with subprocess.Popen(
+                    command,
+                    cwd=self.repo_path,
+                    stdout=subprocess.PIPE,
+                    text=True,
+                    encoding='utf-8',
+                    errors='replace'
+                ) as process:
+                    for file_diff in parse_diff_stream(process.stdout, skip=lambda path: True):
+                        raw[file_diff.path] = file_diff
+            except OSError as e:
+                logger.warning(f"Nie udało się policzyć diffa bez wykrywania zmian nazw: {e}")
+                return
+
+        for file_diff in renamed:
+            # Kopia bez -C byłaby tylko dodaniem pliku; zmiana nazwy także usunięciem starego
+            sources = (file_diff.path,) if file_diff.copied else (file_diff.path, file_diff.old_path)
+            baseline = [raw[path] for path in sources if path in raw]
+
+            lines = sum(entry.added + entry.removed for entry in baseline) - (file_diff.added + file_diff.removed)
+            size_bytes = sum(entry.size_bytes for entry in baseline) - file_diff.size_bytes
+            if lines > 0:
+                reason = "copy_lines" if file_diff.copied else "rename_lines"
+                self._record_normalization(file_diff.path, lines, size_bytes, {reason: lines})
 
-        return False
+    def _should_skip_file(self, file_path: str) -> bool:
+        """Sprawdza czy plik powinien być pominięty w review (na podstawie ścieżki)"""
+        return self.classifier.classify_path(file_path) is not None
 
     def analyze_with_claude(self, file_path: str, diff: str) -> List[ReviewComment]:
         """Analizuje pojedynczy plik używając Claude API"""
 
+        cached, cache_key = self._cached_comments(file_path, diff, PROMPT_TEMPLATE)
+        if cached is not None:
+            logger.info(f"Wynik z cache dla {file_path}")
+            return cached
+
         # Przygotuj prompt dla Claude
         prompt = self._prepare_prompt(file_path, diff)
 
         try:
-            response = self.client.messages.create(
-                model="claude-sonnet-4-5-20250929",
-                max_tokens=4000,
-                temperature=0.3,
-                system="""Jesteś ekspertem code review. Analizuj kod pod kątem:
-                - Potencjalnych błędów i bugów
-                - Problemów bezpieczeństwa
-                - Wydajności
-                - Czytelności i maintainability
-                - Zgodności z best practices
-                
-                Zwracaj odpowiedź TYLKO w formacie JSON. Każdy komentarz powinien mieć:
-                - line_number: numer linii (z diffa)
-                - severity: 'critical'|'major'|'minor'|'info'
-                - category: 'bug'|'security'|'performance'|'style'|'best_practice'
-                - message: opis problemu
-                - suggestion: sugestia poprawy (opcjonalne)
-                
-                Zwróć tablicę JSON z komentarzami lub pustą tablicę jeśli kod jest OK.""",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
+            if not self.stream:
+                response = self._create_message([file_path], **self._message_params(prompt, [file_path]))
+
+                # Parsuj odpowiedź
+                return self._finish_file_response(file_path, response.content[0].text, response.stop_reason, cache_key)
+
+            items, text, stop_reason = self._stream_message([file_path], **self._message_params(prompt, [file_path]))
+            if not items:
+                # Odpowiedź bez tablicy na początku - parsujemy całość jak dotychczas
+                return self._finish_file_response(file_path, text, stop_reason, cache_key)
 
-            # Parsuj odpowiedź
-            return self._parse_claude_response(response.content[0].text, file_path)
+            comments = self._comments_from_items(items, file_path)
+
+            if stop_reason != 'end_turn':
+                logger.warning(
+                    f"Odpowiedź dla {file_path} ucięta ({stop_reason or 'przerwany strumień'}) - "
+                    f"zachowuję {len(comments)} kompletnych komentarzy"
+                )
+            elif cache_key:
+                self.cache.put(cache_key, [asdict(comment) for comment in comments])
+            return comments
 
         except Exception as e:
             logger.error(f"Błąd podczas analizy {file_path} z Claude: {e}")
+            self._mark_failed([file_path])
             return []
 
+    def _mark_failed(self, file_paths: List[str]) -> None:
+        """Zapamiętuje pliki bez wyniku z API (trafiają do unreviewed_files, a nie do dziennika, więc --resume je powtórzy)"""
+        with self._failed_lock:
+            self.failed_files.update(file_paths)
+
+    def analyze_packed(self, file_diffs: List[FileDiff]) -> List[ReviewComment]:
+        """
+        Analizuje kilka małych plików w jednym zapytaniu do Claude API
+
+        Odpowiedź to obiekt JSON z tablicą komentarzy dla każdej ścieżki.
+        Jeśli nie da się jej sparsować, pliki są analizowane pojedynczo.
+        """
+        paths = [file_diff.path for file_diff in file_diffs]
+        logger.info(f"Analizuję paczkę {len(file_diffs)} plików: {', '.join(paths)}")
+
+        # Pliki z wynikiem w cache nie trafiają do zapytania
+        comments, pending, cache_keys = self._split_cached_pack(file_diffs)
+
+        if len(pending) == 1:
+            return comments + self.analyze_with_claude(pending[0].path, pending[0].text)
+        if not pending:
+            return comments
+
+        prompt = self._prepare_packed_prompt(pending)
+
+        try:
+            pending_paths = [file_diff.path for file_diff in pending]
+            response = self._create_message(pending_paths, **self._message_params(prompt, pending_paths))
+            packed = self._finish_packed_response(pending, response.content[0].text, response.stop_reason, cache_keys)
+        except Exception as e:
+            logger.error(f"Błąd podczas analizy paczki plików z Claude: {e}")
+            packed = None
+
+        if packed is None:
+            return comments + self._analyze_individually(pending)
+
+        return comments + packed
+
+    def _analyze_individually(self, file_diffs: List[FileDiff]) -> List[ReviewComment]:
+        """Analizuje pliki z nieudanej paczki pojedynczo"""
+        logger.warning("Nie udało się przeanalizować paczki - analizuję pliki pojedynczo")
+        comments = []
+        for file_diff in file_diffs:
+            comments.extend(self.analyze_with_claude(file_diff.path, file_diff.text))
+        return comments
+
+    @traced('cache.lookup')
+    def _cached_comments(self, file_path: str, diff: str,
+                         template: str) -> Tuple[Optional[List[ReviewComment]], Optional[str]]:
+        """Zwraca (komentarze z cache lub None, klucz cache lub None gdy cache wyłączony)"""
+        if self.cache is None:
+            return None, None
+
+        model = self._tier_for([file_path]).model
+        cache_key = ReviewCache.make_key(file_path, diff, model, SYSTEM_PROMPT, template)
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return None, cache_key
+
+        comments = [ReviewComment(**{**item, 'file_path': file_path}) for item in cached]
+        return comments, cache_key
+
+    def _emit(self, comments: List[ReviewComment]) -> None:
+        """Przekazuje gotowe komentarze do on_comment (np. do publikowania w trakcie analizy)"""
+        if self.on_comment is None:
+            return
+        for comment in comments:
+            self.on_comment(comment)
+
+    def _split_cached_pack(self, file_diffs: List[FileDiff]) -> Tuple[List[ReviewComment], List[FileDiff], Dict[str, str]]:
+        """Dzieli pliki paczki na (komentarze z cache, pliki do analizy, klucze cache)"""
+        comments: List[ReviewComment] = []
+        pending: List[FileDiff] = []
+        cache_keys: Dict[str, str] = {}
+        for file_diff in file_diffs:
+            cached, cache_key = self._cached_comments(file_diff.path, file_diff.text, PACKED_PROMPT_TEMPLATE)
+            if cached is not None:
+                comments.extend(cached)
+                continue
+            if cache_key:
+                cache_keys[file_diff.path] = cache_key
+            pending.append(file_diff)
+        return comments, pending, cache_keys
+
+    @traced('parse.response')
+    def _finish_file_response(self, file_path: str, text: str, stop_reason: Optional[str],
+                              cache_key: Optional[str]) -> List[ReviewComment]:
+        """Parsuje odpowiedź dla pojedynczego pliku i zapisuje ją w cache"""
+        comments = self._parse_claude_response(text, file_path)
+        if comments is None:
+            # Nieczytelna odpowiedź to brak wyniku, a nie "brak uwag" - nie trafia do cache ani dziennika
+            self._mark_failed([file_path])
+            return []
+
+        # Nie zapisujemy w cache odpowiedzi uciętych przez limit tokenów
+        if cache_key and stop_reason == 'end_turn':
+            self.cache.put(cache_key, [asdict(comment) for comment in comments])
+
+        return comments
+
+    @traced('parse.response')
+    def _finish_packed_response(self, file_diffs: List[FileDiff], text: str, stop_reason: Optional[str],
+                                cache_keys: Dict[str, str]) -> Optional[List[ReviewComment]]:
+        """Parsuje odpowiedź dla paczki plików (None = paczkę trzeba powtórzyć pojedynczo)"""
+        if stop_reason == 'max_tokens':
+            return None
+
+        packed = self._parse_packed_response(text, [file_diff.path for file_diff in file_diffs])
+        if packed is None:
+            return None
+
+        comments = []
+        for file_diff in file_diffs:
+            file_comments = packed.get(file_diff.path, [])
+            if file_diff.path in cache_keys:
+                self.cache.put(cache_keys[file_diff.path], [asdict(comment) for comment in file_comments])
+            comments.extend(file_comments)
+
+        return comments
+
+    def _tier_for(self, files: List[str]) -> ModelTier:
+        """Zwraca poziom modelu dla plików zapytania (najwyższy spośród plików paczki)"""
+        if self.router is None:
+            return self.default_tier
+        tiers = {self.router.decisions.get(file_path, {}).get('tier') for file_path in files}
+        if self.router.light.name in tiers and len(tiers) == 1:
+            return self.router.light
+        return self.router.heavy
+
+    def _message_params(self, prompt: str, files: List[str]) -> Dict[str, Any]:
+        """
+        Parametry zapytania messages.create dla danego promptu
+
+        Model i limit tokenów wyjściowych zależą od poziomu wybranego przez
+        router dla plików zapytania. Prompt systemowy (rola, kryteria i format
+        odpowiedzi) jest identyczny dla wszystkich plików i dłuższy niż
+        PROMPT_CACHE_MIN_TOKENS, więc kończy się punktem cache_control -
+        kolejne zapytania czytają go z cache promptów.
+        """
+        tier = self._tier_for(files)
+        return {
+            "model": tier.model,
+            "max_tokens": tier.max_tokens,
+            "temperature": 0.3,
+            "system": [
+                {
+                    "type": "text",
+                    "text": SYSTEM_PROMPT,
+                    "cache_control": {"type": "ephemeral"}
+                }
+            ],
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        }
+
+    def _create_message(self, files: List[str], **params) -> Any:
+        """Wysyła zapytanie do Claude API i zwraca pełną odpowiedź"""
+
+        def request(attempt: int) -> Any:
+            started = time.monotonic()
+            raw_response = self.client.messages.with_raw_response.create(**params, **self._request_options())
+            self.limiter.on_success(raw_response.headers)
+            response = raw_response.parse()
+            self.metrics.record(files, params['model'], response.usage, time.monotonic() - started, attempt + 1)
+            return response
+
+        return self._call_with_retries(request)
+
+    def _stream_message(self, files: List[str], **params) -> Tuple[List[Dict[str, Any]], str, Optional[str]]:
+        """
+        Wysyła zapytanie w trybie strumieniowym i parsuje komentarze na bieżąco.
+
+        Zwraca (obiekty komentarzy, pełny tekst, stop_reason). Jeśli strumień
+        zerwie się po pierwszym komentarzu, zwraca to, co przyszło (stop_reason
+        None); zerwanie przed pierwszym komentarzem jest ponawiane.
+        """
+
+        def request(attempt: int) -> Tuple[List[Dict[str, Any]], str, Optional[str]]:
+            parser = IncrementalCommentParser()
+            items: List[Dict[str, Any]] = []
+            chunks: List[str] = []
+            started = time.monotonic()
+            ttft = None
+
+            with self.client.messages.stream(**params, **self._request_options()) as stream:
+                self.limiter.on_success(stream.response.headers)
+                try:
+                    for text in stream.text_stream:
+                        if ttft is None:
+                            ttft = time.monotonic() - started
+                        chunks.append(text)
+                        items.extend(parser.feed(text))
+                    message = stream.get_final_message()
+                except Exception as e:
+                    if not items:
+                        raise StreamInterruptedError(str(e)) from e
+                    logger.warning(f"Strumień odpowiedzi przerwany: {e}")
+                    self.metrics.record(files, params['model'], None, time.monotonic() - started, attempt + 1, ttft)
+                    return items, ''.join(chunks), None
+
+            self.metrics.record(files, params['model'], message.usage, time.monotonic() - started, attempt + 1, ttft)
+            return items, ''.join(chunks), message.stop_reason
+
+        return self._call_with_retries(request)
+
+    def _call_with_retries(self, request: Callable[[int], Any]) -> Any:
+        """
+        Wykonuje zapytanie do Claude API przez limiter równoległości.
+
+        Ponawia zapytanie z wykładniczym backoffem po błędach połączenia
+        i statusach z RETRYABLE_STATUSES; 429/529 dodatkowo zmniejszają limit.
+        """
+        attempt = 0
+        while True:
+            with span('claude.queue_wait'):
+                self.limiter.acquire()
+            try:
+                with span('claude.request', attempt=attempt):
+                    return request(attempt)
+            except APIStatusError as e:
+                if e.status_code not in self.RETRYABLE_STATUSES or attempt >= self.max_retries:
+                    raise
+                retry_after = _parse_header_number(e.response.headers, 'retry-after')
+                if e.status_code in self.THROTTLE_STATUSES:
+                    self.limiter.on_throttle(retry_after)
+                delay = retry_after or self._backoff_delay(attempt)
+                if self._past_deadline(delay):
+                    raise
+            except (APIConnectionError, StreamInterruptedError):
+                if attempt >= self.max_retries or self._past_deadline(self._backoff_delay(attempt)):
+                    raise
+                delay = self._backoff_delay(attempt)
+            finally:
+                self.limiter.release()
+
+            attempt += 1
+            logger.debug(f"Ponawiam zapytanie do API za {delay:.1f}s (próba {attempt}/{self.max_retries})")
+            with span('claude.backoff'):
+                time.sleep(delay)
+
+    def _request_options(self) -> Dict[str, Any]:
+        """Opcje zapytania HTTP: przy budżecie czasu timeout nie wykracza poza termin"""
+        if self.deadline is None:
+            return {}
+        return {"timeout": max(1.0, self.deadline - time.monotonic())}
+
+    def cancel(self) -> None:
+        """Przerywa review: nowe zapytania nie są wysyłane, a na trwające nie czekamy"""
+        self.deadline = time.monotonic()
+
+    def _past_deadline(self, delay: float = 0.0) -> bool:
+        """Sprawdza, czy po odczekaniu delay sekund budżet czasu będzie wyczerpany (lub review już się zakończył)"""
+        if self._units_closed.is_set():
+            return True
+        return self.deadline is not None and time.monotonic() + delay >= self.deadline
+
+    @staticmethod
+    def _backoff_delay(attempt: int) -> float:
+        """Opóźnienie przed kolejną próbą (wykładnicze, maks. 30s)"""
+        return min(30.0, 2.0 ** attempt)
+
     def _prepare_prompt(self, file_path: str, diff: str) -> str:
         """Przygotowuje prompt dla Claude"""
         file_extension = os.path.splitext(file_path)[1]
 
-        return f"""Przeanalizuj następujący diff kodu z pliku {file_path} (typ: {file_extension}).
-        
-Diff git:
-```diff
-{diff}
-```
+        return PROMPT_TEMPLATE.format(file_path=file_path, file_extension=file_extension, diff=diff)
 
-Zidentyfikuj problemy i zasugeruj ulepszenia. Skup się na:
-1. Nowych liniach kodu (zaczynających się od '+')
-2. Kontekście zmian
-3. Potencjalnych problemach wprowadzonych przez zmiany
+    def _prepare_packed_prompt(self, file_diffs: List[FileDiff]) -> str:
+        """Przygotowuje prompt dla paczki małych plików"""
+        sections = [
+            PACKED_FILE_SECTION.format(
+                file_path=file_diff.path,
+                file_extension=os.path.splitext(file_diff.path)[1],
+                diff=file_diff.text
+            )
+            for file_diff in file_diffs
+        ]
+        return PACKED_PROMPT_TEMPLATE.format(file_count=len(file_diffs), file_sections="\n\n".join(sections))
+
+    def _parse_packed_response(self, response_text: str,
+                               paths: List[str]) -> Optional[Dict[str, List[ReviewComment]]]:
+        """Parsuje odpowiedź dla paczki plików (None, jeśli odpowiedź jest nieczytelna)"""
+        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+        if not json_match:
+            logger.warning("Brak obiektu JSON w odpowiedzi dla paczki plików")
+            return None
+
+        try:
+            json_data = json.loads(json_match.group())
+        except json.JSONDecodeError as e:
+            logger.error(f"Błąd parsowania JSON dla paczki plików: {e}")
+            logger.debug(f"Odpowiedź: {response_text}")
+            return None
+
+        if not isinstance(json_data, dict):
+            return None
+
+        # Obiekt bez żadnej ze ścieżek paczki (np. pojedynczy komentarz) to nie "brak uwag"
+        if json_data and not set(json_data) & set(paths):
+            logger.warning("Odpowiedź dla paczki nie zawiera żadnej ze ścieżek plików")
+            return None
 
-Zwróć wynik w formacie JSON jako tablicę obiektów z polami: line_number, severity, category, message, suggestion."""
+        result = {}
+        for path in paths:
+            items = json_data.get(path, [])
+            result[path] = self._comments_from_items(items if isinstance(items, list) else [], path)
 
-    def _parse_claude_response(self, response_text: str, file_path: str) -> List[ReviewComment]:
-        """Parsuje odpowiedź Claude do obiektów ReviewComment"""
+        unknown = set(json_data) - set(paths)
+        if unknown:
+            logger.debug(f"Pominięto komentarze dla nieznanych ścieżek: {sorted(unknown)}")
+
+        return result
+
+    def _comments_from_items(self, items: List[Dict[str, Any]], file_path: str) -> List[ReviewComment]:
+        """Tworzy obiekty ReviewComment z elementów JSON odpowiedzi"""
         comments = []
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            comments.append(ReviewComment(
+                file_path=file_path,
+                line_number=item.get('line_number', 0),
+                severity=item.get('severity', 'info'),
+                category=item.get('category', 'best_practice'),
+                message=item.get('message', ''),
+                suggestion=item.get('suggestion', '')
+            ))
+        return comments
 
+    def _parse_claude_response(self, response_text: str, file_path: str) -> Optional[List[ReviewComment]]:
+        """Parsuje odpowiedź Claude do obiektów ReviewComment (None, jeśli odpowiedź jest nieczytelna)"""
         try:
             # Wyciągnij JSON z odpowiedzi (Claude może dodać dodatkowy tekst)
             json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
             if not json_match:
                 logger.warning(f"Brak JSON w odpowiedzi dla {file_path}")
-                return []
+                return None
 
             json_data = json.loads(json_match.group())
-
-            for item in json_data:
-                comment = ReviewComment(
-                    file_path=file_path,
-                    line_number=item.get('line_number', 0),
-                    severity=item.get('severity', 'info'),
-                    category=item.get('category', 'best_practice'),
-                    message=item.get('message', ''),
-                    suggestion=item.get('suggestion', '')
-                )
-                comments.append(comment)
+            return self._comments_from_items(json_data, file_path)
 
         except json.JSONDecodeError as e:
             logger.error(f"Błąd parsowania JSON dla {file_path}: {e}")
@@ -195,41 +2250,825 @@ Zwróć wynik w formacie JSON jako tablicę obiektów z polami: line_number, sev
         except Exception as e:
             logger.error(f"Nieoczekiwany błąd podczas parsowania: {e}")
 
-        return comments
+        return None
 
     def review_all_changes(self, base_sha: str) -> None:
         """Przeprowadza review wszystkich zmian"""
         logger.info(f"Rozpoczynam review zmian od {base_sha}")
 
+        self.head_sha = self._rev_parse('HEAD')
+        self.reviewed_range = f"{base_sha}..HEAD"
+
         diffs = self.get_diff(base_sha)
 
         if not diffs:
             logger.info("Brak zmian do review")
             return
 
-        logger.info(f"Znaleziono {len(diffs)} plików do analizy")
+        self._review_diffs(diffs)
+
+    def review_incremental(self, base_sha: str, state_file: str, since_sha: str = None) -> None:
+        """
+        Review tylko zmian od ostatnio sprawdzonego commita.
+
+        Ostatni SHA pochodzi z --since-sha (np. z ukrytego znacznika w notatce
+        podsumowania) lub z pliku stanu poprzedniego uruchomienia. Wcześniejsze
+        komentarze z pliku stanu są przenoszone na nowe numery linii; komentarze
+        przy liniach zmienionych od tamtej pory zastępuje nowy review.
+        """
+        state = self.load_review_state(state_file)
+        since_sha = since_sha or state.get('head_sha')
+
+        if not since_sha:
+            logger.info("Brak poprzedniego review - wykonuję pełny review")
+            self.review_all_changes(base_sha)
+            return
+
+        if not self._is_ancestor(since_sha, 'HEAD'):
+            logger.info(f"Commit {since_sha} nie jest przodkiem HEAD (rebase/force push) - wykonuję pełny review")
+            self.review_all_changes(base_sha)
+            return
+
+        previous_comments = []
+        if state.get('head_sha') == since_sha:
+            previous_comments = [ReviewComment(**item) for item in state.get('comments', [])]
+        else:
+            logger.info("Plik stanu nie odpowiada ostatniemu review - poprzednie komentarze nie zostaną scalone")
+
+        logger.info(f"Review przyrostowy zmian od {since_sha}")
+        self.review_mode = "incremental"
+        self.head_sha = self._rev_parse('HEAD')
+        self.reviewed_range = f"{since_sha}..HEAD"
+
+        diffs = self.get_diff(since_sha)
+        diffs_by_old_path = {file_diff.old_path: file_diff for file_diff in diffs.values()}
+
+        # Przenieś poprzednie komentarze na numery linii w HEAD
+        carried_over = []
+        for comment in previous_comments:
+            file_diff = diffs_by_old_path.get(comment.file_path)
+            if file_diff is None:
+                comment.file_path = self.renamed_paths.get(comment.file_path, comment.file_path)
+                carried_over.append(comment)
+                continue
+
+            new_line = file_diff.map_old_line(comment.line_number)
+            if new_line is not None:
+                comment.file_path = file_diff.path
+                comment.line_number = new_line
+                carried_over.append(comment)
+
+        logger.info(f"Przeniesiono {len(carried_over)} z {len(previous_comments)} poprzednich komentarzy")
+        self._add_comments(carried_over)
+
+        if not diffs:
+            logger.info("Brak nowych zmian do review")
+            return
+
+        self._review_diffs(diffs)
+
+    def load_review_state(self, state_file: str) -> Dict[str, Any]:
+        """Wczytuje stan poprzedniego review (pusty słownik, jeśli brak)"""
+        try:
+            with open(state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            logger.warning(f"Uszkodzony plik stanu {state_file}: {e}")
+            return {}
+
+    def save_review_state(self, state_file: str) -> None:
+        """Zapisuje SHA sprawdzonego HEAD i komentarze dla kolejnego review przyrostowego"""
+        if not self.head_sha:
+            return
+
+        if not self.complete:
+            logger.warning("Review niepełny - nie aktualizuję stanu review przyrostowego")
+            return
+
+        state = {
+            "head_sha": self.head_sha,
+            "comments": [asdict(comment) for comment in self.comments]
+        }
+
+        with open(state_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+
+        logger.info(f"Zapisano stan review ({self.head_sha}) do {state_file}")
+
+    def _rev_parse(self, revision: str) -> Optional[str]:
+        """Zwraca pełny SHA dla rewizji lub None"""
+        try:
+            result = subprocess.run(
+                ["git", "rev-parse", "--verify", "--quiet", f"{revision}^{{commit}}"],
+                cwd=self.repo_path,
+                check=True,
+                stdout=subprocess.PIPE,
+                text=True
+            )
+            return result.stdout.strip() or None
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _is_ancestor(self, ancestor: str, revision: str) -> bool:
+        """Sprawdza czy ancestor jest przodkiem revision"""
+        if not self._rev_parse(ancestor):
+            return False
+        result = subprocess.run(["git", "merge-base", "--is-ancestor", ancestor, revision], cwd=self.repo_path)
+        return result.returncode == 0
+
+    @traced('review')
+    def _review_diffs(self, diffs: Dict[str, FileDiff]) -> None:
+        """
+        Analizuje podane diffy plików i dokłada komentarze
+
+        Pliki o identycznych zmianach są analizowane raz, pliki zapisane już
+        w dzienniku (--resume) nie trafiają do API, a pozostałe są dzielone na
+        jednostki pracy i wykonywane od najbardziej ryzykownych w budżecie
+        czasu. Komentarze pliku trafiają do wyników po zakończeniu wszystkich
+        jego zapytań; pliki bez wyniku lądują w unreviewed_files.
+        """
+        logger.info(f"Znaleziono {len(diffs)} plików do analizy (równoległość: {self.concurrency})")
+
+        # Pliki z identycznymi zmianami analizujemy raz
+        file_diffs = list(diffs.values())
+        duplicates: Dict[str, List[FileDiff]] = {}
+        if self.dedup:
+            file_diffs, duplicates = group_identical_diffs(file_diffs)
+            if duplicates:
+                logger.info(
+                    f"Pominięto {sum(len(group) for group in duplicates.values())} plików "
+                    f"z identycznymi zmianami ({len(duplicates)} grup)"
+                )
+                for file_path, group in duplicates.items():
+                    self.duplicate_files[file_path] = [file_diff.path for file_diff in group]
+
+        # Przy wznowieniu pliki z dziennika nie są ponownie analizowane
+        resumed: Dict[str, List[ReviewComment]] = {}
+        if self.journal is not None:
+            remaining = []
+            for file_diff in file_diffs:
+                comments = self.journal.get(file_diff)
+                if comments is None:
+                    remaining.append(file_diff)
+                else:
+                    resumed[file_diff.path] = comments
+            file_diffs = remaining
+            if resumed:
+                logger.info(f"Wznowienie: {len(resumed)} plików z dziennika {self.journal.path}")
+
+        units = self._build_units(file_diffs)
+        scores = {file_diff.path: self._risk_score(file_diff) for file_diff in diffs.values()}
+
+        # Prognoza (--plan) i budżet: przy downscale odpadają pliki o najniższym priorytecie
+        dropped: List[Tuple[str, tuple]] = []
+        if self.plan_only or (self.budget is not None and self.budget.is_set):
+            self.plan = self._plan_units(units, scores, len(diffs), len(resumed))
+            if self.plan_only:
+                return
+            units, dropped = self._apply_budget(units, scores)
+
+        # Wyniki trafiają do self.comments plik po pliku, gdy zakończą się wszystkie jego części,
+        # więc przerwane review zapisuje wszystko, co zdążyło się zakończyć
+        start = len(self.comments)
+        for file_path, comments in resumed.items():
+            self._finish_file(file_path, comments, diffs, duplicates)
+
+        on_unit_done, flush_unfinished = self._unit_collector(units, diffs, duplicates)
+        self._units_closed.clear()
+        try:
+            if self.batch:
+                if self.deadline is not None:
+                    logger.warning("Tryb batch nie obsługuje budżetu czasu - obowiązuje --batch-timeout")
+                results = self._review_units_batch(units)
+                for index, unit_comments in enumerate(results):
+                    on_unit_done(index, unit_comments)
+            else:
+                self._schedule_units(units, scores, on_unit_done)
+        finally:
+            # Zapytania, na które już nie czekamy, nie zmieniają wyników ani dziennika
+            self._units_closed.set()
+
+            # Pliki z niewykonanymi jednostkami (budżet, przerwanie) i bez wyniku z API
+            # oznaczamy jako nieprzeanalizowane
+            unreviewed = set(flush_unfinished())
+            unreviewed.update(file_path for unit in dropped for file_path in self._unit_files(unit))
+            unreviewed.update(file_path for file_path in self.failed_files if file_path in diffs)
+            for file_path in list(unreviewed):
+                unreviewed.update(file_diff.path for file_diff in duplicates.get(file_path, []))
+            self.unreviewed_files.extend(file_path for file_path in diffs if file_path in unreviewed)
+            if unreviewed:
+                logger.warning(f"Review niepełny - {len(unreviewed)} plików bez review")
+
+            # Komentarze porządkujemy według kolejności plików z diffa, niezależnie od kolejności zakończenia
+            file_order = {file_path: position for position, file_path in enumerate(diffs)}
+            self.comments[start:] = sorted(
+                self.comments[start:], key=lambda comment: file_order.get(comment.file_path, len(file_order))
+            )
+
+    def _finish_file(self, file_path: str, comments: List[ReviewComment], diffs: Dict[str, FileDiff],
+                     duplicates: Dict[str, List[FileDiff]]) -> None:
+        """Dodaje komentarze przeanalizowanego pliku do wyników i przenosi je na jego kopie"""
+        comments = self._deduplicate_comments(comments)
+        logger.info(f"Znaleziono {len(comments)} komentarzy dla {file_path}")
+        self._add_comments(comments)
+
+        for file_diff in duplicates.get(file_path, []):
+            projected = [
+                replace(
+                    comment,
+                    file_path=file_diff.path,
+                    line_number=project_line(diffs[file_path], file_diff, comment.line_number)
+                )
+                for comment in comments
+            ]
+            self._add_comments(projected)
+
+    def _add_comments(self, comments: List[ReviewComment]) -> None:
+        """Dodaje ostateczne komentarze do wyników, strumienia JSON Lines i on_comment"""
+        self.comments.extend(comments)
+        if self.results_stream is not None:
+            self.results_stream.write_comments(comments)
+        self._emit(comments)
+
+    def _build_units(self, file_diffs: List[FileDiff]) -> List[Tuple[str, tuple]]:
+        """Dzieli pliki na jednostki pracy: paczki małych plików i (części) pojedynczych plików"""
+        # Wybór modelu dla każdego pliku
+        tier_groups: Dict[str, List[FileDiff]] = {}
+        for file_diff in file_diffs:
+            tier = self.router.route(file_diff) if self.router is not None else self.default_tier
+            tier_groups.setdefault(tier.name, []).append(file_diff)
+        if self.router is not None:
+            logger.info("Routing modeli: " + ", ".join(
+                f"{name}: {len(group)} plików" for name, group in tier_groups.items()
+            ))
+
+        # Małe pliki pakujemy po kilka w jedno zapytanie (tylko pliki z tym samym modelem)
+        packs: List[List[FileDiff]] = []
+        if self.pack_tokens:
+            file_diffs = []
+            for group in tier_groups.values():
+                group_packs, rest = pack_small_diffs(group, self.pack_tokens, self.pack_file_tokens)
+                packs.extend(group_packs)
+                file_diffs.extend(rest)
+            if packs:
+                logger.info(
+                    f"Spakowano {sum(len(pack) for pack in packs)} małych plików w {len(packs)} zapytań"
+                )
+
+        # Duże pliki dzielimy na części, które analizowane są równolegle jak osobne pliki
+        diff_budget = self._diff_token_budget()
+        units = [('pack', (pack,)) for pack in packs]
+        for file_diff in file_diffs:
+            chunks = split_file_diff(file_diff, diff_budget)
+            if len(chunks) > 1:
+                logger.info(f"Diff {file_diff.path} podzielony na {len(chunks)} części (budżet {diff_budget} tokenów)")
+            for index, chunk in enumerate(chunks, start=1):
+                units.append(('file', (file_diff.path, chunk, index, len(chunks))))
+
+        return units
+
+    def _priority_order(self, units: List[Tuple[str, tuple]], scores: Dict[str, int]) -> List[int]:
+        """Indeksy jednostek pracy od najwyższej oceny ryzyka (przy równej - od najtańszej)"""
+        return sorted(
+            range(len(units)),
+            key=lambda index: (
+                -max(scores.get(file_path, 0) for file_path in self._unit_files(units[index])),
+                self._unit_tokens(units[index])
+            )
+        )
+
+    def _is_cached(self, file_path: str, diff: str, template: str) -> bool:
+        """Czy wynik pliku jest już w cache (bez liczenia trafień)"""
+        if self.cache is None:
+            return False
+        model = self._tier_for([file_path]).model
+        return self.cache.contains(ReviewCache.make_key(file_path, diff, model, SYSTEM_PROMPT, template))
+
+    def _estimate_unit(self, unit: Tuple[str, tuple]) -> Dict[str, Any]:
+        """Prognoza zapytania jednostki pracy: model, tokeny, czas i koszt (bez wywołania API)"""
+        kind, args = unit
+        paths = self._unit_files(unit)
+        if kind == 'pack':
+            pending = [
+                file_diff for file_diff in args[0]
+                if not self._is_cached(file_diff.path, file_diff.text, PACKED_PROMPT_TEMPLATE)
+            ]
+            if len(pending) == 1:
+                prompt = self._prepare_prompt(pending[0].path, pending[0].text)
+            else:
+                prompt = self._prepare_packed_prompt(pending)
+        else:
+            file_path, chunk = args[0], args[1]
+            pending = [] if self._is_cached(file_path, chunk.text, PROMPT_TEMPLATE) else [chunk]
+            prompt = self._prepare_prompt(file_path, chunk.text)
+
+        tier = self._tier_for(paths)
+        estimate = {"files": paths, "model": tier.model, "cached": not pending}
+        if not pending:
+            return {**estimate, "input_tokens": 0, "output_tokens": 0, "latency_s": 0.0, "cost_usd": 0.0,
+                    "cost_usd_max": 0.0}
+
+        profile = _model_profile(tier.model)
+        input_tokens = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(prompt)
+        output_tokens = min(tier.max_tokens, PLAN_OUTPUT_TOKENS_PER_FILE * len(pending))
+        discount = 0.5 if self.batch else 1.0  # Message Batches są o połowę tańsze
+
+        def cost(output: int) -> float:
+            usd = input_tokens * profile["input_usd_per_mtok"] + output * profile["output_usd_per_mtok"]
+            return usd / 1_000_000 * discount
+
+        return {
+            **estimate,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "latency_s": round(PLAN_REQUEST_OVERHEAD_S + output_tokens / profile["output_tokens_per_s"], 2),
+            "cost_usd": cost(output_tokens),
+            "cost_usd_max": cost(tier.max_tokens)
+        }
 
-        for file_path, diff in diffs.items():
-            logger.info(f"Analizuję: {file_path}")
-            file_comments = self.analyze_with_claude(file_path, diff)
-            self.comments.extend(file_comments)
-            logger.info(f"Znaleziono {len(file_comments)} komentarzy dla {file_path}")
+    def _plan_units(self, units: List[Tuple[str, tuple]], scores: Dict[str, int],
+                    file_count: int, resumed_count: int = 0) -> Dict[str, Any]:
+        """
+        Prognozuje zapytania, tokeny, koszt i czas review bez wywołań API.
+
+        Czas to symulacja harmonogramu: jednostki w kolejności priorytetu
+        trafiają do pierwszego wolnego z `concurrency` slotów, a przy
+        plan_rpm kolejne zapytanie nie startuje wcześniej, niż pozwala limit.
+        Dla każdego prefiksu tej kolejności zapamiętywane są sumy, których
+        używa downscale w _apply_budget.
+        """
+        order = self._priority_order(units, scores)
+        estimates = [self._estimate_unit(unit) for unit in units]
+
+        slots = [0.0] * self.concurrency
+        totals = {"cost_usd": 0.0, "requests": 0, "input_tokens": 0, "wall_s": 0.0}
+        cumulative: List[Dict[str, Any]] = []
+        output_tokens = output_tokens_max = 0
+        cost_usd_max = 0.0
+        by_model: Dict[str, Dict[str, Any]] = {}
+
+        for index in order:
+            estimate = estimates[index]
+            if not estimate["cached"]:
+                start = heapq.heappop(slots)
+                if self.plan_rpm:
+                    start = max(start, totals["requests"] * 60.0 / self.plan_rpm)
+                finish = start + estimate["latency_s"]
+                heapq.heappush(slots, finish)
+
+                totals["requests"] += 1
+                totals["cost_usd"] += estimate["cost_usd"]
+                totals["input_tokens"] += estimate["input_tokens"]
+                totals["wall_s"] = max(totals["wall_s"], finish)
+                output_tokens += estimate["output_tokens"]
+                output_tokens_max += self._tier_for(estimate["files"]).max_tokens
+                cost_usd_max += estimate["cost_usd_max"]
+
+                model = by_model.setdefault(
+                    estimate["model"], {"requests": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+                )
+                model["requests"] += 1
+                model["input_tokens"] += estimate["input_tokens"]
+                model["output_tokens"] += estimate["output_tokens"]
+                model["cost_usd"] = round(model["cost_usd"] + estimate["cost_usd"], 4)
+            cumulative.append(dict(totals))
+
+        self._plan_order, self._plan_cumulative = order, cumulative
+
+        plan = {
+            "files": file_count,
+            "resumed_files": resumed_count,
+            "skipped_files": self.classifier.report()["count"],
+            "duplicate_files": sum(len(paths) for paths in self.duplicate_files.values()),
+            "units": len(units),
+            "cached_units": sum(1 for estimate in estimates if estimate["cached"]),
+            "requests": totals["requests"],
+            "input_tokens": totals["input_tokens"],
+            "output_tokens": output_tokens,
+            "output_tokens_max": output_tokens_max,
+            "cost_usd": round(totals["cost_usd"], 4),
+            "cost_usd_max": round(cost_usd_max, 4),
+            "wall_s": round(totals["wall_s"], 1),
+            "concurrency": self.concurrency,
+            "requests_per_minute": self.plan_rpm,
+            "batch": self.batch,
+            "by_model": by_model,
+            "requests_by_priority": [
+                {key: value for key, value in estimates[index].items() if key != "cost_usd_max"}
+                for index in order if not estimates[index]["cached"]
+            ]
+        }
+        if self.batch:
+            plan["note"] = "Tryb batch: koszt z 50% rabatem, czas zależy od kolejki Message Batches (do --batch-timeout)"
+
+        if self.budget is not None and self.budget.is_set:
+            plan["budget"] = asdict(self.budget)
+            plan["exceeded"] = self.budget.exceeded(**totals)
+
+        logger.info(
+            f"Prognoza: {plan['requests']} zapytań, ~{plan['input_tokens']} tokenów wejściowych, "
+            f"~{plan['output_tokens']} wyjściowych, ~${plan['cost_usd']} (maks. ${plan['cost_usd_max']}), "
+            f"~{plan['wall_s']}s przy równoległości {self.concurrency}"
+        )
+        return plan
+
+    def _apply_budget(self, units: List[Tuple[str, tuple]],
+                      scores: Dict[str, int]) -> Tuple[List[Tuple[str, tuple]], List[Tuple[str, tuple]]]:
+        """
+        Sprawdza prognozę z budżetem; zwraca (jednostki do wykonania, jednostki pominięte).
+
+        Przy action='refuse' przekroczenie kończy się BudgetExceededError, przy
+        'downscale' zostaje najdłuższy prefiks kolejności priorytetu mieszczący
+        się w budżecie (pliki dzielone na części odpadają w całości).
+        """
+        exceeded = self.plan.get("exceeded")
+        if not exceeded:
+            return units, []
+
+        if self.budget.action != 'downscale':
+            raise BudgetExceededError(
+                f"Prognoza review przekracza budżet ({', '.join(exceeded)}): {self.plan['requests']} zapytań, "
+                f"~${self.plan['cost_usd']}, ~{self.plan['wall_s']}s"
+            )
+
+        keep = 0
+        for position, totals in enumerate(self._plan_cumulative):
+            if self.budget.exceeded(**totals):
+                break
+            keep = position + 1
+
+        dropped_indices = set(self._plan_order[keep:])
+        dropped_files = {file_path for index in dropped_indices for file_path in self._unit_files(units[index])}
+        dropped_indices.update(
+            index for index, unit in enumerate(units) if dropped_files & set(self._unit_files(unit))
+        )
+
+        kept = [unit for index, unit in enumerate(units) if index not in dropped_indices]
+        dropped = [unit for index, unit in enumerate(units) if index in dropped_indices]
+        self.plan["downscaled"] = {"kept_units": len(kept), "dropped_files": sorted(dropped_files)}
+        logger.warning(
+            f"Prognoza przekracza budżet ({', '.join(exceeded)}) - pomijam {len(dropped_files)} plików "
+            f"o najniższym priorytecie ({len(dropped)} z {len(units)} jednostek pracy)"
+        )
+        return kept, dropped
+
+    def save_plan(self, plan_file: str = "review-plan.json") -> None:
+        """Zapisuje prognozę review do pliku JSON (pustą, gdy nie było zmian do review)"""
+        plan = self.plan if self.plan is not None else {"files": 0, "requests": 0, "cost_usd": 0.0, "wall_s": 0.0}
+        with open(plan_file, 'w', encoding='utf-8') as f:
+            json.dump(plan, f, indent=2, ensure_ascii=False)
+        logger.info(f"Zapisano prognozę review do {plan_file}")
+
+    def _unit_collector(self, units: List[Tuple[str, tuple]], diffs: Dict[str, FileDiff],
+                        duplicates: Dict[str, List[FileDiff]]
+                        ) -> Tuple[Callable[[int, List[ReviewComment]], None], Callable[[], List[str]]]:
+        """
+        Zwraca (on_unit_done, flush_unfinished).
+
+        on_unit_done(indeks, komentarze) jest wywoływane po zakończeniu jednostki
+        pracy; gdy zakończą się wszystkie części pliku, jego komentarze trafiają
+        do wyników, a plik bez błędów API - do dziennika. flush_unfinished()
+        dokłada komentarze z zakończonych części pozostałych plików i zwraca
+        ścieżki tych plików.
+        """
+        units_left: Dict[str, int] = {}
+        for unit in units:
+            for file_path in self._unit_files(unit):
+                units_left[file_path] = units_left.get(file_path, 0) + 1
+        collected: Dict[str, List[ReviewComment]] = {file_path: [] for file_path in units_left}
+
+        def on_unit_done(index: int, comments: List[ReviewComment]) -> None:
+            if self._units_closed.is_set():
+                return
+            for comment in comments:
+                if comment.file_path in collected:
+                    collected[comment.file_path].append(comment)
+            for file_path in self._unit_files(units[index]):
+                units_left[file_path] -= 1
+                if units_left[file_path] > 0:
+                    continue
+                file_comments = collected.pop(file_path)
+                self._finish_file(file_path, file_comments, diffs, duplicates)
+                if self.journal is not None and file_path not in self.failed_files:
+                    self.journal.record(diffs[file_path], file_comments)
+
+        def flush_unfinished() -> List[str]:
+            unfinished = list(collected)
+            for file_path in unfinished:
+                self._finish_file(file_path, collected.pop(file_path), diffs, duplicates)
+            return unfinished
+
+        return on_unit_done, flush_unfinished
+
+    def _risk_score(self, file_diff: FileDiff) -> int:
+        """Ocena ryzyka pliku (z decyzji routera, jeśli już ją policzył)"""
+        decision = self.scorer.decisions.get(file_diff.path)
+        if decision is not None:
+            return decision['score']
+        return self.scorer.score(file_diff)[0]
+
+    @staticmethod
+    def _unit_files(unit: Tuple[str, tuple]) -> List[str]:
+        """Ścieżki plików objętych jednostką pracy"""
+        kind, args = unit
+        if kind == 'pack':
+            return [file_diff.path for file_diff in args[0]]
+        return [args[0]]
+
+    @staticmethod
+    def _unit_tokens(unit: Tuple[str, tuple]) -> int:
+        """Szacowany rozmiar jednostki pracy w tokenach"""
+        kind, args = unit
+        if kind == 'pack':
+            return sum(estimate_tokens(file_diff.text) for file_diff in args[0])
+        return estimate_tokens(args[1].text)
+
+    @traced('review.schedule')
+    def _schedule_units(self, units: List[Tuple[str, tuple]], scores: Dict[str, int],
+                        on_unit_done: Callable[[int, List[ReviewComment]], None]) -> None:
+        """
+        Wykonuje jednostki pracy w kolejności priorytetu, pilnując budżetu czasu.
+
+        Najpierw idą jednostki o najwyższej ocenie ryzyka, a przy równej ocenie
+        tańsze (mniej tokenów). Nowa jednostka jest uruchamiana tylko wtedy,
+        gdy przy średnim dotychczasowym czasie jednostki zdąży przed terminem;
+        po terminie nie czekamy na trwające zapytania. Po każdej zakończonej
+        jednostce wywoływane jest on_unit_done(indeks, komentarze); jednostki
+        niewykonane rozlicza wywołujący.
+        """
+        order = self._priority_order(units, scores)
+
+        durations: List[float] = []
+        in_flight: Dict[Any, Tuple[int, float]] = {}
+        position = 0
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            while True:
+                while position < len(order) and len(in_flight) < self.concurrency:
+                    # Dopóki żadna jednostka się nie zakończyła, wystarczy, że termin jeszcze nie minął
+                    unit_time = sum(durations) / len(durations) if durations else 0.0
+                    if self._past_deadline(unit_time):
+                        remaining = len(order) - position
+                        logger.warning(
+                            f"Za mało czasu na kolejne zapytanie (średnio {unit_time:.1f}s) - "
+                            f"pomijam {remaining} z {len(units)} jednostek pracy"
+                        )
+                        position = len(order)
+                        break
+
+                    index = order[position]
+                    position += 1
+                    in_flight[executor.submit(self._run_unit, units[index])] = (index, time.monotonic())
+
+                if not in_flight:
+                    break
+
+                timeout = None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+                finished, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not finished:
+                    logger.warning(f"Termin minął - przerywam oczekiwanie na {len(in_flight)} zapytań")
+                    break
+
+                for future in finished:
+                    index, started = in_flight.pop(future)
+                    durations.append(time.monotonic() - started)
+                    comments: List[ReviewComment] = []
+                    try:
+                        comments = future.result()
+                    except Exception as e:
+                        logger.error(f"Błąd podczas analizy {', '.join(self._unit_files(units[index]))}: {e}")
+                        self._mark_failed(self._unit_files(units[index]))
+                    on_unit_done(index, comments)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run_unit(self, unit: Tuple[str, tuple]) -> List[ReviewComment]:
+        """Wykonuje jednostkę pracy: paczkę małych plików lub (część) pliku"""
+        if self._units_closed.is_set():
+            return []
+        kind, args = unit
+        if kind == 'pack':
+            return self.analyze_packed(*args)
+        return self._review_file(*args)
+
+    @traced('review.batch')
+    def _review_units_batch(self, units: List[Tuple[str, tuple]]) -> List[List[ReviewComment]]:
+        """
+        Analizuje jednostki pracy przez Message Batches API.
+
+        Wszystkie prompty (poza wynikami z cache) trafiają do jednego zadania
+        wsadowego; wyniki są mapowane z powrotem na jednostki przez custom_id.
+        """
+        results: List[List[ReviewComment]] = [[] for _ in units]
+        requests = []
+        handlers = {}
+        request_files: Dict[str, List[str]] = {}
+
+        for index, (kind, args) in enumerate(units):
+            custom_id = f"unit-{index}"
+
+            if kind == 'pack':
+                cached, pending, cache_keys = self._split_cached_pack(args[0])
+                results[index].extend(cached)
+                if len(pending) > 1:
+                    prompt = self._prepare_packed_prompt(pending)
+                    handlers[custom_id] = (
+                        index,
+                        partial(self._finish_packed_response, pending, cache_keys=cache_keys),
+                        partial(self._analyze_individually, pending)
+                    )
+                    request_files[custom_id] = [file_diff.path for file_diff in pending]
+                    requests.append({
+                        "custom_id": custom_id,
+                        "params": self._message_params(prompt, request_files[custom_id])
+                    })
+                    continue
+                if not pending:
+                    continue
+                file_path, diff = pending[0].path, pending[0].text
+            else:
+                file_path, diff = args[0], args[1].text
+
+            cached, cache_key = self._cached_comments(file_path, diff, PROMPT_TEMPLATE)
+            if cached is not None:
+                results[index].extend(cached)
+                continue
+
+            handlers[custom_id] = (
+                index,
+                partial(self._finish_file_response, file_path, cache_key=cache_key),
+                list
+            )
+            requests.append({
+                "custom_id": custom_id,
+                "params": self._message_params(self._prepare_prompt(file_path, diff), [file_path])
+            })
+            request_files[custom_id] = [file_path]
+
+        if not requests:
+            return results
+
+        for start in range(0, len(requests), self.BATCH_MAX_REQUESTS):
+            batch_requests = requests[start:start + self.BATCH_MAX_REQUESTS]
+            for custom_id, result in self._run_message_batch(batch_requests):
+                if custom_id not in handlers:
+                    continue
+                index, on_text, fallback = handlers.pop(custom_id)
+                if result.type == 'succeeded':
+                    message = result.message
+                    self.metrics.record(request_files[custom_id], message.model, message.usage, None)
+                    comments = on_text(message.content[0].text, message.stop_reason)
+                    results[index].extend(fallback() if comments is None else comments)
+                else:
+                    logger.error(f"Zapytanie {custom_id} w batchu zakończone statusem {result.type}")
+                    self._mark_failed(request_files[custom_id])
+
+        for custom_id in handlers:
+            logger.error(f"Brak wyniku dla zapytania {custom_id} w batchu")
+            self._mark_failed(request_files[custom_id])
+
+        return results
+
+    def _run_message_batch(self, requests: List[Dict[str, Any]]) -> Iterator[Tuple[str, Any]]:
+        """Wysyła zadanie Message Batches, czeka na jego zakończenie i zwraca wyniki"""
+        batch = self.client.messages.batches.create(requests=requests)
+        logger.info(f"Utworzono batch {batch.id} z {len(requests)} zapytaniami")
+        self.batch_ids.append(batch.id)
+
+        started = time.monotonic()
+        delay = self.BATCH_POLL_INITIAL_DELAY
+        cancelled = False
+
+        while batch.processing_status != 'ended':
+            if not cancelled and time.monotonic() - started > self.batch_timeout:
+                logger.error(f"Przekroczono czas oczekiwania na batch {batch.id} - anuluję")
+                try:
+                    self.client.messages.batches.cancel(batch.id)
+                    cancelled = True
+                except (APIConnectionError, APIStatusError) as e:
+                    logger.warning(f"Nie udało się anulować batcha {batch.id}: {e}")
+
+            time.sleep(delay)
+            delay = min(self.BATCH_POLL_MAX_DELAY, delay * 2)
+
+            try:
+                batch = self.client.messages.batches.retrieve(batch.id)
+            except (APIConnectionError, APIStatusError) as e:
+                logger.warning(f"Błąd podczas sprawdzania statusu batcha {batch.id}: {e}")
+                continue
+
+            counts = batch.request_counts
+            logger.info(
+                f"Batch {batch.id}: {batch.processing_status} "
+                f"(w toku: {counts.processing}, gotowe: {counts.succeeded}, błędy: {counts.errored})"
+            )
+
+        for entry in self.client.messages.batches.results(batch.id):
+            yield entry.custom_id, entry.result
+
+    def _diff_token_budget(self) -> int:
+        """Budżet tokenów na sam diff (po odjęciu promptu systemowego i szablonu)"""
+        if not self.max_input_tokens:
+            return 0
+        overhead = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(PROMPT_TEMPLATE)
+        return max(1, self.max_input_tokens - overhead)
+
+    def _review_file(self, file_path: str, file_diff: FileDiff,
+                     chunk_index: int = 1, chunk_count: int = 1) -> List[ReviewComment]:
+        """Analizuje pojedynczy plik lub jego część (wywoływane z puli wątków)"""
+        part = f" [część {chunk_index}/{chunk_count}]" if chunk_count > 1 else ""
+        logger.info(f"Analizuję: {file_path}{part} (+{file_diff.added}/-{file_diff.removed})")
+        return self.analyze_with_claude(file_path, file_diff.text)
+
+    @staticmethod
+    def _deduplicate_comments(comments: List[ReviewComment]) -> List[ReviewComment]:
+        """Usuwa powtórzone komentarze (np. z nakładającego się kontekstu części diffa)"""
+        seen = set()
+        unique = []
+        for comment in comments:
+            key = (comment.file_path, comment.line_number, comment.message)
+            if key in seen:
+                continue
+            seen.add(key)
+            unique.append(comment)
+        return unique
+
+    @property
+    def complete(self) -> bool:
+        """Czy review objął wszystkie pliki (bez przerwania, wyczerpania budżetu i błędów API)"""
+        return not self.unreviewed_files and not self.interrupted
+
+    @traced('save_results')
+    def save_results(self, output_file: str = "review-results.json",
+                     report_file: str = "review-report.json") -> None:
+        """Zapisuje wyniki review do pliku (i raport Code Quality do report_file)"""
+        summary = self._generate_summary()
+        summary["review_mode"] = self.review_mode
+        summary["complete"] = self.complete
+        if self.unreviewed_files:
+            summary["unreviewed_files"] = self.unreviewed_files
+        if self.head_sha:
+            # Niepełny review nie może przesunąć punktu startowego kolejnego review przyrostowego
+            if self.complete:
+                summary["head_sha"] = self.head_sha
+            summary["reviewed_range"] = self.reviewed_range
 
-    def save_results(self, output_file: str = "review-results.json") -> None:
-        """Zapisuje wyniki review do pliku"""
         results = {
             "total_comments": len(self.comments),
-            "summary": self._generate_summary(),
-            "comments": [asdict(comment) for comment in self.comments]
+            "summary": summary
+        }
+
+        results["metrics"] = self.metrics.to_dict()
+        results["skipped_files"] = self.classifier.report()
+        if self.router is not None:
+            results["routing"] = self.router.report(self.metrics)
+        results["duplicate_files"] = {
+            "groups": len(self.duplicate_files),
+            "files": sum(len(paths) for paths in self.duplicate_files.values()),
+            "reviewed_as": self.duplicate_files
+        }
+        results["diff_normalization"] = {
+            "context_lines": self.context_lines,
+            "ignore_whitespace": self.ignore_whitespace,
+            "ignore_comments": self.ignore_comments,
+            "lines_removed": sum(entry["lines_removed"] for entry in self.diff_stats.values()),
+            "estimated_tokens_removed": sum(entry["estimated_tokens_removed"] for entry in self.diff_stats.values()),
+            "files": self.diff_stats
         }
 
+        if self.batch_ids:
+            results["batch_ids"] = self.batch_ids
+
+        if self.journal is not None:
+            results["journal"] = self.journal.stats()
+
+        if self.cache is not None:
+            self.cache.prune()
+            results["cache"] = self.cache.stats()
+            logger.info(
+                f"Cache review: {results['cache']['hits']} trafień, {results['cache']['misses']} chybień"
+            )
+
+        # Komentarze dopisujemy na końcu, przepisując je po jednym ze strumienia JSON Lines
         with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+            count = _write_json_object(f, results, 'comments', self._comment_records(), ensure_ascii=False)
 
-        logger.info(f"Zapisano {len(self.comments)} komentarzy do {output_file}")
+        logger.info(f"Zapisano {count} komentarzy do {output_file}")
 
         # Zapisz też w formacie GitLab Code Quality
-        self._save_gitlab_format()
+        self._save_gitlab_format(report_file)
+
+        if self.results_stream is not None:
+            self.results_stream.write_summary(summary)
+
+    def _comment_records(self) -> Iterator[Dict[str, Any]]:
+        """Komentarze do plików wyników: ze strumienia JSON Lines, jeśli jest włączony, inaczej z pamięci"""
+        if self.results_stream is not None:
+            return self.results_stream.iter_comments()
+        return (asdict(comment) for comment in self.comments)
 
     def _generate_summary(self) -> Dict[str, Any]:
         """Generuje podsumowanie review"""
@@ -257,34 +3096,33 @@ Zwróć wynik w formacie JSON jako tablicę obiektów z polami: line_number, sev
             "files_reviewed": len(set(c.file_path for c in self.comments))
         }
 
-    def _save_gitlab_format(self) -> None:
+    def _save_gitlab_format(self, report_file: str = "review-report.json") -> None:
         """Zapisuje wyniki w formacie GitLab Code Quality"""
-        gitlab_issues = []
-
-        for comment in self.comments:
-            issue = {
-                "description": comment.message,
-                "check_name": f"claude-review/{comment.category}",
-                "fingerprint": hashlib.sha256(
-                    f"{comment.file_path}:{comment.line_number}:{comment.message}".encode("utf-8")
-                ).hexdigest(),
-                "severity": self._map_severity_to_gitlab(comment.severity),
-                "location": {
-                    "path": comment.file_path,
-                    "lines": {
-                        "begin": comment.line_number
+        def gitlab_issues() -> Iterator[Dict[str, Any]]:
+            for comment in self._comment_records():
+                issue = {
+                    "description": comment['message'],
+                    "check_name": f"claude-review/{comment['category']}",
+                    "fingerprint": hashlib.sha256(
+                        f"{comment['file_path']}:{comment['line_number']}:{comment['message']}".encode("utf-8")
+                    ).hexdigest(),
+                    "severity": self._map_severity_to_gitlab(comment['severity']),
+                    "location": {
+                        "path": comment['file_path'],
+                        "lines": {
+                            "begin": comment['line_number']
+                        }
                     }
                 }
-            }
 
-            if comment.suggestion:
-                issue["remediation_points"] = 100000  # GitLab format
-                issue["content"] = {"body": comment.suggestion}
+                if comment.get('suggestion'):
+                    issue["remediation_points"] = 100000  # GitLab format
+                    issue["content"] = {"body": comment['suggestion']}
 
-            gitlab_issues.append(issue)
+                yield issue
 
-        with open("review-report.json", 'w') as f:
-            json.dump(gitlab_issues, f, indent=2)
+        with open(report_file, 'w') as f:
+            _write_json_array(f, gitlab_issues())
 
     def _map_severity_to_gitlab(self, severity: str) -> str:
         """Mapuje severity na format GitLab"""
@@ -297,12 +3135,315 @@ Zwróć wynik w formacie JSON jako tablicę obiektów z polami: line_number, sev
         return mapping.get(severity, 'info')
 
 
+def add_review_arguments(parser: argparse.ArgumentParser) -> None:
+    """Dodaje opcje review (wspólne dla claude_review.py i review_and_post.py)"""
+    parser.add_argument('--diff', required=True, help='Base SHA for diff comparison')
+    parser.add_argument('--output', default='review-results.json', help='Output file path')
+    parser.add_argument(
+        '--report-output',
+        default='review-report.json',
+        help='Plik raportu w formacie GitLab Code Quality'
+    )
+    parser.add_argument(
+        '--jsonl-output',
+        default='',
+        help='Dodatkowo zapisuj komentarze w trakcie review do pliku JSON Lines (np. review-results.jsonl)'
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=int(os.environ.get('AI_REVIEW_CONCURRENCY', 4)),
+        help='Maksymalna liczba plików analizowanych równolegle (domyślnie 4)'
+    )
+    parser.add_argument(
+        '--max-diff-bytes',
+        type=int,
+        default=100_000,
+        help='Obcina diff pojedynczego pliku po tylu bajtach (0 = bez limitu)'
+    )
+    parser.add_argument(
+        '--max-input-tokens',
+        type=int,
+        default=20_000,
+        help='Budżet tokenów wejściowych na zapytanie; większe diffy są dzielone na granicach hunków (0 = bez podziału)'
+    )
+    parser.add_argument(
+        '--pack-tokens',
+        type=int,
+        default=0,
+        help='Łącz małe pliki w jedno zapytanie do tego budżetu tokenów (0 = wyłączone)'
+    )
+    parser.add_argument(
+        '--pack-file-tokens',
+        type=int,
+        default=1_000,
+        help='Maksymalny rozmiar diffa pliku (w tokenach), który może trafić do paczki'
+    )
+    parser.add_argument(
+        '--batch',
+        action='store_true',
+        help='Wyślij wszystkie prompty jako jedno zadanie Message Batches (bez interaktywnej latencji)'
+    )
+    parser.add_argument(
+        '--batch-timeout',
+        type=float,
+        default=6 * 3600,
+        help='Maksymalny czas oczekiwania na wyniki batcha w sekundach (potem batch jest anulowany)'
+    )
+    parser.add_argument(
+        '--no-stream',
+        action='store_true',
+        help='Czekaj na pełną odpowiedź zamiast parsować komentarze ze strumienia'
+    )
+    parser.add_argument(
+        '--exclude',
+        action='append',
+        default=[],
+        metavar='GLOB',
+        help='Dodatkowy wzorzec plików pomijanych w review (można podać wielokrotnie)'
+    )
+    parser.add_argument(
+        '--include',
+        action='append',
+        default=[],
+        metavar='GLOB',
+        help='Analizuj tylko pliki pasujące do wzorca (można podać wielokrotnie)'
+    )
+    parser.add_argument(
+        '--no-default-excludes',
+        action='store_true',
+        help='Nie używaj domyślnej listy pomijanych plików (lockfile, minifikaty, obrazy, node_modules/...)'
+    )
+    parser.add_argument(
+        '--max-changed-lines',
+        type=int,
+        default=5_000,
+        help='Pomijaj pliki z większą liczbą zmienionych linii (0 = bez limitu)'
+    )
+    parser.add_argument(
+        '--context-lines',
+        type=int,
+        default=3,
+        help='Liczba linii kontekstu wokół zmian w diffie'
+    )
+    parser.add_argument(
+        '--ignore-whitespace',
+        action='store_true',
+        help='Pomijaj zmiany dotyczące tylko białych znaków i pustych linii'
+    )
+    parser.add_argument(
+        '--ignore-comments',
+        action='store_true',
+        help='Pomijaj zmiany dotyczące tylko komentarzy'
+    )
+    parser.add_argument(
+        '--no-dedup',
+        action='store_true',
+        help='Analizuj osobno także pliki z identycznymi zmianami'
+    )
+    parser.add_argument(
+        '--routing',
+        action='store_true',
+        help='Kieruj pliki o niskim ryzyku do lekkiego modelu (domyślnie wszystkie pliki trafiają do --heavy-model)'
+    )
+    parser.add_argument('--light-model', default=DEFAULT_LIGHT_MODEL, help='Model dla drobnych zmian o niskim ryzyku')
+    parser.add_argument('--heavy-model', default=DEFAULT_MODEL, help='Model dla dużych lub ryzykownych zmian')
+    parser.add_argument(
+        '--light-max-tokens',
+        type=int,
+        default=1500,
+        help='Limit tokenów odpowiedzi lekkiego modelu'
+    )
+    parser.add_argument(
+        '--heavy-max-tokens',
+        type=int,
+        default=4000,
+        help='Limit tokenów odpowiedzi ciężkiego modelu'
+    )
+    parser.add_argument(
+        '--routing-threshold',
+        type=int,
+        default=3,
+        help='Minimalna ocena ryzyka pliku kierująca go do ciężkiego modelu'
+    )
+    parser.add_argument(
+        '--time-budget',
+        type=float,
+        default=0,
+        help='Czas na review w sekundach (0 = bez limitu); po jego upływie zapisywane są częściowe wyniki'
+    )
+    parser.add_argument(
+        '--plan',
+        action='store_true',
+        help='Tylko prognoza: policz zapytania, tokeny, koszt i czas review bez wywołań API'
+    )
+    parser.add_argument('--plan-output', default='review-plan.json', help='Plik prognozy review (JSON)')
+    parser.add_argument(
+        '--plan-rpm',
+        type=int,
+        default=0,
+        help='Limit zapytań na minutę uwzględniany w prognozie czasu (0 = bez limitu)'
+    )
+    parser.add_argument('--max-cost', type=float, default=0, help='Budżet kosztu review w USD (0 = bez limitu)')
+    parser.add_argument('--max-requests', type=int, default=0, help='Budżet liczby zapytań do API (0 = bez limitu)')
+    parser.add_argument(
+        '--max-total-input-tokens',
+        type=int,
+        default=0,
+        help='Budżet łącznej liczby tokenów wejściowych (0 = bez limitu)'
+    )
+    parser.add_argument(
+        '--max-wall-time',
+        type=float,
+        default=0,
+        help='Budżet prognozowanego czasu review w sekundach (0 = bez limitu)'
+    )
+    parser.add_argument(
+        '--budget-action',
+        choices=['refuse', 'downscale'],
+        default='refuse',
+        help='Przy prognozie ponad budżet: odmów review (kod wyjścia 3) albo pomiń pliki o najniższym priorytecie'
+    )
+    parser.add_argument(
+        '--journal',
+        default='',
+        help='Dziennik wyników plików zapisywany w trakcie review, np. review-journal.jsonl ("" = wyłączony)'
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Wznów przerwane review: pliki z wynikiem w dzienniku (--journal) nie są ponownie analizowane'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        default=os.environ.get('AI_REVIEW_CACHE_DIR', '.ai-review-cache'),
+        help='Katalog cache wyników review (np. ścieżka z sekcji cache: GitLab CI)'
+    )
+    parser.add_argument('--cache-max-mb', type=int, default=100, help='Maksymalny rozmiar cache w MB')
+    parser.add_argument('--no-cache', action='store_true', help='Wyłącz cache wyników review')
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Review tylko commitów od ostatnio sprawdzonego SHA (z --since-sha lub pliku stanu)'
+    )
+    parser.add_argument(
+        '--since-sha',
+        default=None,
+        help='SHA ostatnio sprawdzonego HEAD (np. z post_comments.py --print-last-reviewed-sha)'
+    )
+    parser.add_argument('--state-file', default='review-state.json', help='Plik stanu review przyrostowego')
+
+
+def create_reviewer(args: argparse.Namespace, client: Optional[Anthropic] = None,
+                    repo_path: Optional[str] = None,
+                    limiter: Optional[AdaptiveConcurrencyLimiter] = None) -> CodeReviewer:
+    """Tworzy CodeReviewer na podstawie opcji z add_review_arguments"""
+    if args.resume and not args.journal:
+        logger.warning("--resume bez --journal - review zacznie się od początku")
+
+    cache = None
+    if not args.no_cache:
+        cache = ReviewCache(args.cache_dir, max_bytes=args.cache_max_mb * 1024 * 1024)
+
+    exclude_patterns = [] if args.no_default_excludes else list(DEFAULT_EXCLUDE_PATTERNS)
+    classifier = FileClassifier(
+        exclude_patterns=exclude_patterns + args.exclude,
+        include_patterns=args.include,
+        max_changed_lines=args.max_changed_lines
+    )
+
+    # Routing jest opcjonalny: lżejszy model może przeoczyć uwagi w plikach ocenionych jako mało ryzykowne
+    router = None
+    if args.routing:
+        router = ModelRouter(
+            light=ModelTier(name='light', model=args.light_model, max_tokens=args.light_max_tokens),
+            heavy=ModelTier(name='heavy', model=args.heavy_model, max_tokens=args.heavy_max_tokens),
+            threshold=args.routing_threshold
+        )
+
+    return CodeReviewer(
+        concurrency=args.concurrency,
+        model=args.heavy_model,
+        max_diff_bytes=args.max_diff_bytes,
+        cache=cache,
+        max_input_tokens=args.max_input_tokens,
+        pack_tokens=args.pack_tokens,
+        pack_file_tokens=args.pack_file_tokens,
+        batch=args.batch,
+        batch_timeout=args.batch_timeout,
+        stream=not args.no_stream,
+        classifier=classifier,
+        context_lines=args.context_lines,
+        ignore_whitespace=args.ignore_whitespace,
+        ignore_comments=args.ignore_comments,
+        dedup=not args.no_dedup,
+        router=router,
+        time_budget=args.time_budget,
+        budget=ReviewBudget(
+            max_cost_usd=args.max_cost,
+            max_requests=args.max_requests,
+            max_input_tokens=args.max_total_input_tokens,
+            max_wall_s=args.max_wall_time,
+            action=args.budget_action
+        ),
+        plan_only=args.plan,
+        plan_rpm=args.plan_rpm,
+        # --plan zapisuje tylko prognozę - nie może wyczyścić dziennika ani pliku JSON Lines poprzedniego review
+        journal=ReviewJournal(args.journal, resume=args.resume) if args.journal and not args.plan else None,
+        results_stream=(
+            ResultsStreamWriter(args.jsonl_output, args.heavy_model) if args.jsonl_output and not args.plan else None
+        ),
+        client=client,
+        repo_path=repo_path,
+        limiter=limiter
+    )
+
+
+def run_review(reviewer: CodeReviewer, args: argparse.Namespace) -> None:
+    """
+    Przeprowadza review (pełny lub przyrostowy) i zapisuje wyniki (także częściowe po przerwaniu).
+
+    Z --plan zapisywana jest wyłącznie prognoza. Odmowa z powodu budżetu
+    (BudgetExceededError) zapisuje prognozę, ale nie wyniki review.
+    """
+    try:
+        if args.incremental:
+            reviewer.review_incremental(args.diff, args.state_file, since_sha=args.since_sha or None)
+        else:
+            reviewer.review_all_changes(args.diff)
+    except BudgetExceededError:
+        reviewer.save_plan(args.plan_output)
+        raise
+    except BaseException:
+        logger.warning("Review przerwany - zapisuję częściowe wyniki")
+        reviewer.interrupted = True
+        reviewer.save_results(args.output, args.report_output)
+        raise
+    finally:
+        if reviewer.journal is not None:
+            reviewer.journal.close()
+
+    if args.plan:
+        reviewer.save_plan(args.plan_output)
+        return
+
+    if reviewer.plan is not None:
+        reviewer.save_plan(args.plan_output)
+    reviewer.save_results(args.output, args.report_output)
+    if args.incremental:
+        reviewer.save_review_state(args.state_file)
+
+
+def _exit_on_sigterm(signum, frame) -> None:
+    raise SystemExit(128 + signum)
+
+
 def main():
     """Główna funkcja skryptu"""
     parser = argparse.ArgumentParser(description='Claude Code Review for GitLab CI/CD')
-    parser.add_argument('--diff', required=True, help='Base SHA for diff comparison')
-    parser.add_argument('--output', default='review-results.json', help='Output file path')
+    add_review_arguments(parser)
     parser.add_argument('--debug', action='store_true', help='Enable debug logging')
+    add_tracing_arguments(parser)
     parser.add_argument(
         '--fail-on-needs-work',
         action='store_true',
@@ -314,10 +3455,16 @@ def main():
     if args.debug:
         logging.getLogger().setLevel(logging.DEBUG)
 
+    # SIGTERM (np. timeout joba CI) przerywa review tak jak Ctrl+C - częściowe wyniki zostają zapisane
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+
+    configure_tracing(args)
+
     try:
-        reviewer = CodeReviewer()
-        reviewer.review_all_changes(args.diff)
-        reviewer.save_results(args.output)
+        reviewer = create_reviewer(args)
+        run_review(reviewer, args)
+        if args.plan:
+            return
 
         # Zwróć kod wyjścia na podstawie wyników
         summary = reviewer._generate_summary()
@@ -328,10 +3475,17 @@ def main():
 
         logger.info("Review zakończony pomyślnie")
 
+    except BudgetExceededError as e:
+        logger.error(str(e))
+        sys.exit(3)
+
     except Exception as e:
         logger.error(f"Błąd krytyczny: {e}")
         sys.exit(1)
 
+    finally:
+        export_tracing(args, 'claude_review')
+
 
 if __name__ == "__main__":
     main()
@@ -5,15 +5,23 @@ Posts code review comments from Claude analysis to GitLab Merge Request
 """
 
 import argparse
+import bisect
+import hashlib
 import json
 import logging
 import os
 import sys
+import threading
 import time
-from typing import List, Dict, Any, Optional
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Set, Tuple
 import re
 import requests
+from requests.adapters import HTTPAdapter
 from urllib.parse import quote
+from urllib3.util.retry import Retry
+
+from tracing import add_tracing_arguments, configure_tracing, export_tracing, span, traced
 
 # Konfiguracja logowania
 logging.basicConfig(
@@ -22,11 +30,489 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Ukryty znacznik w notatce podsumowania z SHA ostatnio sprawdzonego HEAD
+REVIEWED_SHA_MARKER = "<!-- ai-code-review:head_sha={sha} -->"
+REVIEWED_SHA_RE = re.compile(r'<!-- ai-code-review:head_sha=([0-9a-f]{7,64}) -->')
+
+# Ukryte znaczniki notatek review: podsumowanie i odcisk pojedynczej uwagi
+SUMMARY_MARKER = "<!-- ai-code-review:summary -->"
+FINDING_MARKER = "<!-- ai-code-review:finding={fingerprint} -->"
+FINDING_RE = re.compile(r'<!-- ai-code-review:finding=([0-9a-f]{64}) -->')
+
+# Domyślne tempo zapytań do GitLab API i liczba wątków publikujących komentarze
+DEFAULT_GITLAB_RATE = 5.0
+DEFAULT_POST_WORKERS = 4
+
+# Odpowiedzi GitLab ponawiane z backoffem (Retry-After lub wykładniczo)
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Po 5xx GitLab mógł już wykonać zapytanie, więc pozostałe metody (POST) ponawiamy tylko po 429
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+MAX_RETRIES = 5
+BACKOFF_BASE_S = 1.0
+BACKOFF_MAX_S = 60.0
+
+# Nagłówek hunka w diffie GitLab
+HUNK_HEADER_RE = re.compile(r'@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@')
+
+# Maksymalna odległość (w liniach), o jaką komentarz tuż poza hunkiem jest przyciągany do najbliższej linii diffa
+DEFAULT_SNAP_LINES = 3
+
+# Ponowienia na poziomie połączenia (błędy TCP/TLS, zanim zapytanie dotrze do GitLab)
+CONNECT_RETRIES = 3
+
+# Rozmiar strony i liczba równoległych pobrań stron list GitLab API
+PAGE_SIZE = 100
+PAGE_WORKERS = 4
+
+# Najniższe tempo, do którego zwalnia limiter po odpowiedziach 429,
+# i przyrost tempa (zapytań/s) po każdej udanej odpowiedzi
+MIN_GITLAB_RATE = 0.2
+RATE_RECOVERY_STEP = 0.1
+
+
+def _header_number(headers, name: str) -> Optional[float]:
+    """Wartość liczbowa nagłówka (None, jeśli brak lub nie jest liczbą)"""
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class GitLabRateLimiter:
+    """
+    Token bucket współdzielony przez wątki wysyłające zapytania do GitLab API.
+
+    Tempo bazowe (rate zapytań/s) jest zastępowane limitem z nagłówka
+    RateLimit-Limit (zapytań na minutę). Gdy RateLimit-Remaining spada do
+    zera, wszystkie wątki czekają do RateLimit-Reset. Odpowiedź 429 wstrzymuje
+    je na czas z Retry-After i obniża tempo o połowę (AIMD, jak
+    AdaptiveConcurrencyLimiter w claude_review.py); każda udana odpowiedź
+    podnosi ten pułap o RATE_RECOVERY_STEP, aż wróci do tempa bazowego.
+    """
+
+    def __init__(self, rate: float = DEFAULT_GITLAB_RATE, burst: int = DEFAULT_POST_WORKERS):
+        self.base_rate = rate
+        self.rate = max(MIN_GITLAB_RATE, rate)
+        self.burst = max(1, burst)
+        self.ceiling: Optional[float] = None
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> None:
+        """Czeka na token (i na koniec ewentualnej pauzy)"""
+        with span('gitlab.rate_limit_wait'):
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    self._refill(now)
+                    delay = self._paused_until - now
+                    if delay <= 0:
+                        if self._tokens >= 1:
+                            self._tokens -= 1
+                            return
+                        delay = (1 - self._tokens) / self.rate
+                time.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        """Wstrzymuje wszystkie wątki na podany czas"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + max(0.0, seconds))
+            self._tokens = min(self._tokens, 0.0)
+
+    def throttle(self) -> None:
+        """Obniża tempo o połowę (po odpowiedzi 429)"""
+        with self._lock:
+            # Kilka wątków dostaje 429 naraz - zwalniamy raz na okres pauzy
+            if time.monotonic() < self._paused_until:
+                return
+            self.rate = max(MIN_GITLAB_RATE, self.rate / 2)
+            self.ceiling = self.rate
+        logger.warning(f"Limit GitLab API - zwalniam do {self.rate:.2f} zapytań/s")
+
+    def update(self, response: requests.Response) -> None:
+        """Dostosowuje tempo do statusu i nagłówków RateLimit-* odpowiedzi GitLab"""
+        headers = response.headers
+        limit = _header_number(headers, 'RateLimit-Limit')
+        remaining = _header_number(headers, 'RateLimit-Remaining')
+        reset = _header_number(headers, 'RateLimit-Reset')
+
+        with self._lock:
+            if limit:
+                self.base_rate = limit / 60.0
+            rate = self.base_rate
+            if self.ceiling is not None and response.status_code < 400:
+                self.ceiling += RATE_RECOVERY_STEP
+                if self.ceiling >= rate:
+                    self.ceiling = None
+            if self.ceiling is not None:
+                rate = min(rate, self.ceiling)
+            self.rate = max(MIN_GITLAB_RATE, rate)
+
+        if remaining is not None and remaining < 1 and reset is not None:
+            delay = max(0.0, reset - time.time())
+            logger.warning(f"Wyczerpany limit GitLab API - czekam {delay:.1f}s do odnowienia")
+            self.pause(delay)
+
+
+class GitLabClient:
+    """
+    Warstwa dostępu do GitLab API wspólna dla wszystkich wywołań postera.
+
+    Trzyma sesję HTTP z pulą połączeń (bez nowego TCP+TLS przy każdym
+    zapytaniu), kompresją gzip i ponowieniami błędów połączenia, przepuszcza
+    zapytania przez GitLabRateLimiter, ponawia odpowiedzi 429/5xx i pobiera
+    wszystkie strony list.
+    """
+
+    def __init__(self, gitlab_url: str, gitlab_token: str, session: Optional[requests.Session] = None,
+                 limiter: Optional[GitLabRateLimiter] = None, pool_size: int = DEFAULT_POST_WORKERS + PAGE_WORKERS):
+        self.gitlab_url = gitlab_url.rstrip('/')
+        self.headers = {
+            'PRIVATE-TOKEN': gitlab_token,
+            'Content-Type': 'application/json'
+        }
+        self.session = session or self.create_session(pool_size)
+        self.limiter = limiter or GitLabRateLimiter()
+
+    @staticmethod
+    def create_session(pool_size: int = DEFAULT_POST_WORKERS + PAGE_WORKERS) -> requests.Session:
+        """Tworzy sesję z pulą pool_size połączeń i ponowieniami błędów połączenia"""
+        session = requests.Session()
+        # Statusy HTTP ponawia request(); tu tylko błędy nawiązania połączenia
+        retry = Retry(total=CONNECT_RETRIES, connect=CONNECT_RETRIES, read=0, status=0, backoff_factor=0.5)
+        adapter = HTTPAdapter(pool_maxsize=pool_size, max_retries=retry)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['Accept-Encoding'] = 'gzip, deflate'
+        return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Wysyła zapytanie do GitLab API przez limiter (url względny wobec gitlab_url lub pełny).
+
+        Odpowiedzi 429 i 5xx są ponawiane po czasie z Retry-After (albo
+        z wykładniczym backoffem); po ostatniej próbie odpowiedź jest zwracana
+        bez zmian, więc wywołujący obsługuje ją przez raise_for_status.
+        POST po 5xx nie jest ponawiany - GitLab mógł już utworzyć dyskusję
+        lub notatkę, a ponowienie dodałoby duplikat.
+        """
+        if not url.startswith(('http://', 'https://')):
+            url = f"{self.gitlab_url}/{url.lstrip('/')}"
+
+        retryable = RETRYABLE_STATUS if method.upper() in IDEMPOTENT_METHODS else {429}
+
+        for attempt in range(MAX_RETRIES + 1):
+            self.limiter.acquire()
+            response = self.session.request(method, url, headers=self.headers, **kwargs)
+            self.limiter.update(response)
+
+            if response.status_code not in retryable or attempt == MAX_RETRIES:
+                return response
+
+            delay = _header_number(response.headers, 'Retry-After')
+            if delay is None:
+                delay = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt)
+            if response.status_code == 429:
+                self.limiter.throttle()
+            logger.warning(
+                f"GitLab zwrócił {response.status_code} dla {method} {url} - "
+                f"ponawiam za {delay:.1f}s (próba {attempt + 1}/{MAX_RETRIES})"
+            )
+            self.limiter.pause(delay)
+
+        return response
+
+    def get_all_pages(self, url: str, params: Optional[Dict[str, Any]] = None,
+                      items_key: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Pobiera wszystkie strony listy GitLab API.
+
+        Pierwsza strona podaje X-Total-Pages, więc pozostałe są pobierane
+        równolegle (PAGE_WORKERS wątków) i łączone w kolejności stron. Gdy
+        GitLab pomija X-Total-Pages (listy powyżej 10 000 elementów), strony
+        są pobierane kolejno według X-Next-Page.
+
+        Args:
+            url: Adres listy
+            params: Dodatkowe parametry zapytania
+            items_key: Klucz listy, jeśli odpowiedź jest obiektem (np. 'diffs')
+
+        Raises:
+            requests.exceptions.RequestException: Błąd HTTP którejkolwiek strony
+            ValueError: Odpowiedź nie jest listą
+        """
+        def fetch(page: int) -> Tuple[List[Dict[str, Any]], requests.Response]:
+            response = self.request('GET', url, params={**(params or {}), 'per_page': PAGE_SIZE, 'page': page})
+            response.raise_for_status()
+            data = response.json()
+            if isinstance(data, dict) and items_key:
+                data = data.get(items_key, [])
+            if not isinstance(data, list):
+                raise ValueError(f"Niezrozumiała odpowiedź API dla {url}")
+            return data, response
+
+        with span('gitlab.pages'):
+            items, response = fetch(1)
+            total_pages = int(_header_number(response.headers, 'X-Total-Pages') or 0)
+
+            if total_pages > 1:
+                with ThreadPoolExecutor(max_workers=min(PAGE_WORKERS, total_pages - 1),
+                                        thread_name_prefix='gitlab-page') as executor:
+                    for page_items, _ in executor.map(fetch, range(2, total_pages + 1)):
+                        items.extend(page_items)
+            elif not response.headers.get('X-Total-Pages'):
+                next_page = response.headers.get('X-Next-Page')
+                while next_page:
+                    page_items, response = fetch(int(next_page))
+                    items.extend(page_items)
+                    next_page = response.headers.get('X-Next-Page')
+
+        return items
+
+
+def comment_fingerprint(comment: Dict[str, Any], occurrence: int = 0) -> str:
+    """
+    Odcisk uwagi niezależny od numeru linii: ścieżka, kategoria i treść bez
+    różnic w wielkości liter i białych znakach, dzięki czemu uwaga przesunięta
+    przez zmiany powyżej nie jest publikowana ponownie. occurrence rozróżnia
+    kolejne uwagi o tej samej treści w pliku. Inny niż fingerprint raportu
+    Code Quality, który zależy od linii.
+    """
+    message = ' '.join(str(comment.get('message') or '').lower().split())
+    key = f"{comment['file_path']}:{comment.get('category')}:{message}"
+    if occurrence:
+        key += f":{occurrence}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def comment_fingerprints(comments: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """Odciski kolejnych uwag (powtórzenia tej samej uwagi w pliku są numerowane w kolejności)"""
+    occurrences: Dict[str, int] = {}
+    for comment in comments:
+        base = comment_fingerprint(comment)
+        occurrence = occurrences.get(base, 0)
+        occurrences[base] = occurrence + 1
+        yield comment_fingerprint(comment, occurrence)
+
+
+class ExistingReview:
+    """
+    Notatki i dyskusje MR opublikowane wcześniej przez review, indeksowane odciskiem uwagi.
+
+    Pozwala przy ponownym uruchomieniu pominąć niezmienione uwagi, edytować
+    podsumowanie w miejscu i rozwiązać dyskusje uwag, których nie ma już
+    w wynikach. Brane są pod uwagę tylko notatki autora author_id (o ile
+    jest znany) ze znacznikami SUMMARY_MARKER/REVIEWED_SHA_RE lub FINDING_RE.
+    """
+
+    def __init__(self, discussions: List[Dict[str, Any]], author_id: Optional[int] = None):
+        self.summary_note_id: Optional[int] = None
+        self.reviewed_sha: Optional[str] = None
+        self.findings: Dict[str, Dict[str, Any]] = {}
+        self.seen: Set[str] = set()
+        self.skipped = 0
+        self._occurrences: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        # GitLab zwraca dyskusje od najstarszej, więc zostaje najnowsze podsumowanie
+        for discussion in discussions:
+            notes = discussion.get('notes') or []
+            if not notes:
+                continue
+            note = notes[0]
+            if note.get('system'):
+                continue
+            if author_id is not None and (note.get('author') or {}).get('id') != author_id:
+                continue
+
+            body = note.get('body') or ''
+            sha_match = REVIEWED_SHA_RE.search(body)
+            if SUMMARY_MARKER in body or sha_match:
+                self.summary_note_id = note['id']
+                if sha_match:
+                    self.reviewed_sha = sha_match.group(1)
+                continue
+
+            match = FINDING_RE.search(body)
+            if match:
+                self.findings.setdefault(match.group(1), {
+                    "discussion_id": discussion['id'],
+                    "resolvable": bool(note.get('resolvable')),
+                    "resolved": bool(note.get('resolved'))
+                })
+
+    def fingerprint(self, comment: Dict[str, Any]) -> str:
+        """Odcisk kolejnej uwagi w tym uruchomieniu (numeruje powtórzenia jak comment_fingerprints)"""
+        base = comment_fingerprint(comment)
+        with self._lock:
+            occurrence = self._occurrences.get(base, 0)
+            self._occurrences[base] = occurrence + 1
+        return comment_fingerprint(comment, occurrence)
+
+    def claim(self, fingerprint: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Oznacza uwagę jako aktualną.
+
+        Returns:
+            (czy to pierwsze wystąpienie w tym uruchomieniu, istniejąca dyskusja lub None)
+        """
+        with self._lock:
+            first = fingerprint not in self.seen
+            self.seen.add(fingerprint)
+            existing = self.findings.get(fingerprint)
+            if not first or existing is not None:
+                self.skipped += 1
+        return first, existing
+
+    def mark_seen(self, fingerprints: Iterable[str]) -> None:
+        """Oznacza uwagi jako aktualne bez publikowania (np. uwagi przeniesione przez review przyrostowy)"""
+        with self._lock:
+            self.seen.update(fingerprints)
+
+    def stale(self) -> List[Dict[str, Any]]:
+        """Dyskusje uwag, które nie pojawiły się w bieżących wynikach"""
+        with self._lock:
+            return [finding for fingerprint, finding in self.findings.items() if fingerprint not in self.seen]
+
+
+class FileDiffPositions:
+    """
+    Linie pliku, na których GitLab przyjmuje komentarz inline, jako posortowane przedziały.
+
+    Diff jest parsowany raz: linie nowej wersji (dodane i kontekstowe) oraz
+    usunięte linie starej wersji trafiają do przedziałów kolejnych numerów,
+    w których pozycja linii jest wyszukiwana binarnie.
+    """
+
+    def __init__(self, file_diff: Dict[str, Any]):
+        self.diff = file_diff
+        self.new_ranges: List[Tuple[int, int]] = []
+        self.old_ranges: List[Tuple[int, int]] = []
+        self._parse(file_diff.get('diff') or '')
+        self._new_starts = [start for start, _ in self.new_ranges]
+        self._old_starts = [start for start, _ in self.old_ranges]
+
+    @staticmethod
+    def _extend(ranges: List[Tuple[int, int]], line: int) -> None:
+        if ranges and ranges[-1][1] == line - 1:
+            ranges[-1] = (ranges[-1][0], line)
+        else:
+            ranges.append((line, line))
+
+    def _parse(self, diff_text: str) -> None:
+        old_line = 0
+        new_line = 0
+
+        for line in diff_text.splitlines():
+            if line.startswith('@@'):
+                match = HUNK_HEADER_RE.match(line)
+                if match:
+                    old_line = int(match.group(1))
+                    new_line = int(match.group(2))
+                continue
+
+            if line.startswith('+'):
+                self._extend(self.new_ranges, new_line)
+                new_line += 1
+            elif line.startswith('-'):
+                self._extend(self.old_ranges, old_line)
+                old_line += 1
+            elif line.startswith('\\'):
+                # Linia informacyjna "\ No newline at end of file"
+                continue
+            else:
+                # Linie kontekstowe zwiększają oba liczniki
+                self._extend(self.new_ranges, new_line)
+                old_line += 1
+                new_line += 1
+
+    @staticmethod
+    def _find(ranges: List[Tuple[int, int]], starts: List[int], line: int) -> Optional[int]:
+        """Indeks przedziału, który zawiera linię lub kończy się tuż przed nią"""
+        index = bisect.bisect_right(starts, line) - 1
+        return index if index >= 0 else None
+
+    def position(self, target_line: int, snap_lines: int = 0) -> Optional[Dict[str, Any]]:
+        """
+        Mapuje numer linii na pozycję w diffie GitLab.
+
+        Linia nowej wersji ma pierwszeństwo przed usuniętą linią o tym samym
+        numerze. Linia poza diffem jest przyciągana do najbliższej linii nowej
+        wersji odległej o co najwyżej snap_lines.
+
+        Returns:
+            {'type': 'new' | 'old', 'line': numer linii} lub None
+        """
+        if target_line < 1:
+            return None
+
+        index = self._find(self.new_ranges, self._new_starts, target_line)
+        if index is not None and target_line <= self.new_ranges[index][1]:
+            return {'type': 'new', 'line': target_line}
+
+        old_index = self._find(self.old_ranges, self._old_starts, target_line)
+        if old_index is not None and target_line <= self.old_ranges[old_index][1]:
+            return {'type': 'old', 'line': target_line}
+
+        if snap_lines <= 0:
+            return None
+
+        # Najbliższe linie: koniec przedziału przed linią i początek następnego
+        candidates = []
+        if index is not None:
+            candidates.append(self.new_ranges[index][1])
+        next_index = 0 if index is None else index + 1
+        if next_index < len(self.new_ranges):
+            candidates.append(self.new_ranges[next_index][0])
+
+        nearest = min(candidates, key=lambda line: abs(line - target_line), default=None)
+        if nearest is None or abs(nearest - target_line) > snap_lines:
+            return None
+        return {'type': 'new', 'line': nearest, 'snapped_from': target_line}
 
-class GitLabCommentPoster:
-    """Klasa do publikowania komentarzy w GitLab MR"""
 
-    def __init__(self, project_id: str = None, gitlab_token: str = None, gitlab_url: str = None):
+class DiffPositionIndex:
+    """
+    Indeks diffów MR budowany raz na publikację komentarzy.
+
+    Ścieżki nowej i starej wersji wskazują na FileDiffPositions pliku (przy
+    powtórzonej ścieżce wygrywa pierwszy diff, jak w kolejności z API).
+    """
+
+    def __init__(self, diffs: List[Dict[str, Any]]):
+        self.files: Dict[str, FileDiffPositions] = {}
+        for file_diff in diffs:
+            positions = FileDiffPositions(file_diff)
+            for path in (file_diff.get('new_path'), file_diff.get('old_path')):
+                if path:
+                    self.files.setdefault(path, positions)
+
+    def find(self, file_path: str) -> Optional[FileDiffPositions]:
+        """Zwraca pozycje pliku o podanej ścieżce (nowej lub starej)"""
+        return self.files.get(file_path)
+
+
+class GitLabCommentPoster:
+    """
+    Klasa do publikowania komentarzy w GitLab MR
+
+    Wszystkie zapytania idą przez jeden GitLabClient. Uwagi trafiają na linie
+    diffa wg DiffPositionIndex (z przyciąganiem o snap_lines), a gdy pozycji
+    nie da się ustalić - jako zwykłe notatki. Uwagi i podsumowanie z
+    poprzednich uruchomień (ExistingReview) nie są publikowane ponownie.
+    """
+
+    def __init__(self, project_id: str = None, gitlab_token: str = None, gitlab_url: str = None,
+                 session: Optional[requests.Session] = None,
+                 limiter: Optional[GitLabRateLimiter] = None,
+                 post_workers: int = DEFAULT_POST_WORKERS,
+                 snap_lines: int = DEFAULT_SNAP_LINES):
         """
         Inicjalizacja z danymi dostępowymi do GitLab
 
@@ -34,6 +520,10 @@ class GitLabCommentPoster:
             project_id: ID projektu GitLab (domyślnie z CI_PROJECT_ID)
             gitlab_token: Token dostępowy (domyślnie z GITLAB_TOKEN)
             gitlab_url: URL GitLab API (domyślnie z CI_API_V4_URL)
+            session: Współdzielona sesja HTTP (np. GitLabClient.create_session() w review_service.py)
+            limiter: Współdzielony limiter zapytań do GitLab API (domyślnie własny)
+            post_workers: Liczba wątków publikujących komentarze inline
+            snap_lines: Odległość przyciągania komentarza spoza diffa do najbliższej linii (0 = wyłączone)
         """
         self.project_id = project_id or os.environ.get('CI_PROJECT_ID')
         self.gitlab_token = gitlab_token or os.environ.get('GITLAB_TOKEN')
@@ -42,14 +532,12 @@ class GitLabCommentPoster:
         if not all([self.project_id, self.gitlab_token]):
             raise ValueError("Brak wymaganych danych: PROJECT_ID i GITLAB_TOKEN")
 
-        self.headers = {
-            'PRIVATE-TOKEN': self.gitlab_token,
-            'Content-Type': 'application/json'
-        }
-
-        # Rate limiting
-        self.request_delay = 0.5  # Opóźnienie między requestami (w sekundach)
+        # Wszystkie zapytania idą przez jeden klient: pula połączeń, limiter, ponowienia
+        self.client = GitLabClient(self.gitlab_url, self.gitlab_token, session=session, limiter=limiter)
+        self.post_workers = max(1, post_workers)
+        self.snap_lines = max(0, snap_lines)
 
+    @traced('results.load')
     def load_review_results(self, file_path: str = "review-results.json") -> Dict[str, Any]:
         """Wczytuje wyniki review z pliku"""
         try:
@@ -62,27 +550,120 @@ class GitLabCommentPoster:
             logger.error(f"Błąd parsowania JSON: {e}")
             return {}
 
-    def post_summary_comment(self, mr_iid: str, summary: Dict[str, Any]) -> bool:
+    @traced('results.load')
+    def load_review_summary(self, file_path: str = "review-results.jsonl") -> Optional[Dict[str, Any]]:
+        """
+        Odczytuje rekord podsumowania z końca pliku JSON Lines
+
+        Plik jest czytany od końca blokami, więc komentarze nie są wczytywane.
+        Zwraca None, jeśli pliku nie ma albo review zostało przerwane przed
+        zapisaniem podsumowania.
+        """
+        try:
+            with open(file_path, 'rb') as f:
+                position = f.seek(0, os.SEEK_END)
+                tail = b''
+                while position > 0 and b'\n' not in tail.rstrip(b'\n'):
+                    step = min(64 * 1024, position)
+                    position -= step
+                    f.seek(position)
+                    tail = f.read(step) + tail
+        except FileNotFoundError:
+            logger.error(f"Nie znaleziono pliku z wynikami: {file_path}")
+            return None
+
+        last_line = tail.rstrip(b'\n').rsplit(b'\n', 1)[-1]
+        try:
+            record = json.loads(last_line)
+        except json.JSONDecodeError:
+            record = None
+
+        if not isinstance(record, dict) or record.get('type') != 'summary':
+            logger.error(f"Brak podsumowania w {file_path} - review nie został zakończony")
+            return None
+        return record
+
+    def iter_review_comments(self, file_path: str = "review-results.jsonl") -> Iterator[Dict[str, Any]]:
+        """Zwraca kolejne komentarze z pliku JSON Lines, czytając go strumieniowo"""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.warning(f"Pomijam uszkodzoną linię {line_number} w {file_path}: {e}")
+                    continue
+                if record.pop('type', None) == 'comment':
+                    yield record
+
+    @traced('gitlab.existing_review')
+    def load_existing_review(self, mr_iid: str) -> ExistingReview:
+        """
+        Pobiera (raz na uruchomienie) dyskusje MR i indeksuje notatki poprzednich review
+
+        Błąd pobrania daje pusty indeks - wtedy wszystko jest publikowane od nowa.
         """
-        Publikuje komentarz z podsumowaniem review
+        url = f"{self.gitlab_url}/projects/{self.project_id}/merge_requests/{mr_iid}/discussions"
+
+        try:
+            discussions = self.client.get_all_pages(url)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Nie udało się pobrać dyskusji MR - publikuję wszystkie komentarze od nowa: {e}")
+            discussions = []
+
+        existing = ExistingReview(discussions, author_id=self._current_user_id())
+        logger.info(
+            f"Poprzednie review w MR !{mr_iid}: {len(existing.findings)} komentarzy"
+            f"{', podsumowanie' if existing.summary_note_id else ''}"
+        )
+        return existing
+
+    @traced('gitlab.user')
+    def _current_user_id(self) -> Optional[int]:
+        """ID użytkownika tokena (None, jeśli nie da się go ustalić)"""
+        try:
+            response = self.client.request('GET', f"{self.gitlab_url}/user")
+            response.raise_for_status()
+            return response.json().get('id')
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.debug(f"Nie udało się ustalić użytkownika tokena: {e}")
+            return None
+
+    @traced('gitlab.summary')
+    def post_summary_comment(self, mr_iid: str, summary: Dict[str, Any],
+                             existing: Optional[ExistingReview] = None) -> bool:
+        """
+        Publikuje komentarz z podsumowaniem review (albo edytuje poprzednie podsumowanie)
 
         Args:
             mr_iid: Internal ID merge requesta
             summary: Słownik z podsumowaniem
+            existing: Indeks poprzednich review (domyślnie pobierany z MR)
         """
-        # Przygotuj treść komentarza
+        if existing is None:
+            existing = self.load_existing_review(mr_iid)
+
+        # Przygotuj treść komentarza; niepełne review (bez head_sha) zachowuje znacznik ostatniego pełnego
+        if not summary.get('head_sha') and existing.reviewed_sha:
+            summary = {**summary, 'head_sha': existing.reviewed_sha}
         comment_body = self._format_summary_comment(summary)
 
         url = f"{self.gitlab_url}/projects/{self.project_id}/merge_requests/{mr_iid}/notes"
+        method = 'POST'
+        if existing.summary_note_id:
+            url = f"{url}/{existing.summary_note_id}"
+            method = 'PUT'
 
         payload = {
             "body": comment_body
         }
 
         try:
-            response = requests.post(url, headers=self.headers, json=payload)
+            response = self.client.request(method, url, json=payload)
             response.raise_for_status()
-            logger.info(f"Opublikowano podsumowanie review dla MR !{mr_iid}")
+            action = "Zaktualizowano" if method == 'PUT' else "Opublikowano"
+            logger.info(f"{action} podsumowanie review dla MR !{mr_iid}")
             return True
         except requests.exceptions.RequestException as e:
             logger.error(f"Błąd podczas publikowania podsumowania: {e}")
@@ -165,143 +746,230 @@ class GitLabCommentPoster:
         comment += "*🤖 Ten review został wygenerowany automatycznie przez Claude AI. "
         comment += "Szczegółowe komentarze znajdują się przy konkretnych liniach kodu.*\n"
 
+        # Znaczniki podsumowania i dla kolejnego review przyrostowego (niewidoczne w GitLab)
+        comment += "\n" + SUMMARY_MARKER + "\n"
+        if summary.get('head_sha'):
+            comment += "\n" + REVIEWED_SHA_MARKER.format(sha=summary['head_sha']) + "\n"
+
         return comment
 
-    def post_inline_comments(self, mr_iid: str, comments: List[Dict[str, Any]]) -> int:
+    def get_last_reviewed_sha(self, mr_iid: str) -> Optional[str]:
+        """
+        Zwraca SHA z ukrytego znacznika w podsumowaniu poprzedniego review
+
+        Podsumowanie jest edytowane w miejscu, więc jest szukane wśród
+        wszystkich dyskusji MR (z paginacją) i tylko w notatkach autora tokena.
+
+        Args:
+            mr_iid: Internal ID merge requesta
+        """
+        return self.load_existing_review(mr_iid).reviewed_sha
+
+    @traced('post.inline')
+    def post_inline_comments(self, mr_iid: str, comments: Iterable[Dict[str, Any]],
+                             existing: Optional[ExistingReview] = None, resolve_stale: bool = True) -> int:
         """
         Publikuje komentarze inline przy konkretnych liniach kodu
 
         Args:
             mr_iid: Internal ID merge requesta
-            comments: Lista komentarzy do opublikowania
+            comments: Komentarze do opublikowania (lista lub strumień z iter_review_comments)
+            existing: Indeks poprzednich review (domyślnie pobierany z MR)
+            resolve_stale: Rozwiąż dyskusje uwag, których nie ma w comments (tylko dla pełnych wyników)
 
         Returns:
             Liczba pomyślnie opublikowanych komentarzy
         """
 
         # Najpierw pobierz informacje o MR i zmianach
+        context = self.load_inline_context(mr_iid, existing)
+        if not context:
+            return 0
+
+        posted_count, total_count = self.post_inline_comment_stream(mr_iid, context, comments)
+
+        logger.info(
+            f"Opublikowano {posted_count} z {total_count} komentarzy inline "
+            f"(pominięto {context['existing'].skipped} już obecnych w MR)"
+        )
+        if resolve_stale:
+            self.resolve_stale_discussions(mr_iid, context['existing'])
+        return posted_count
+
+    def resolve_stale_discussions(self, mr_iid: str, existing: ExistingReview) -> int:
+        """Rozwiązuje dyskusje poprzednich review, których uwag nie ma już w wynikach"""
+        resolved = 0
+        for finding in existing.stale():
+            if finding['resolvable'] and not finding['resolved']:
+                if self._set_discussion_resolved(mr_iid, finding['discussion_id'], True):
+                    resolved += 1
+
+        if resolved:
+            logger.info(f"Rozwiązano {resolved} dyskusji z uwagami, których nie ma już w review")
+        return resolved
+
+    @traced('gitlab.resolve')
+    def _set_discussion_resolved(self, mr_iid: str, discussion_id: str, resolved: bool) -> bool:
+        """Ustawia stan rozwiązania dyskusji"""
+        url = f"{self.gitlab_url}/projects/{self.project_id}/merge_requests/{mr_iid}/discussions/{discussion_id}"
+
+        try:
+            response = self.client.request('PUT', url, json={"resolved": resolved})
+            response.raise_for_status()
+            return True
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Błąd podczas zmiany stanu dyskusji {discussion_id}: {e}")
+            return False
+
+    def post_inline_comment_stream(self, mr_iid: str, context: Dict[str, Any],
+                                   comments: Iterable[Dict[str, Any]]) -> Tuple[int, int]:
+        """
+        Publikuje komentarze równolegle w post_workers wątkach
+
+        Kolejne komentarze tego samego pliku trafiają do jednego zadania, a
+        zadanie pliku, który pojawia się w strumieniu ponownie, czeka na
+        poprzednie - kolejność komentarzy w pliku jest zachowana. Strumień
+        jest czytany na bieżąco (co najwyżej kilka zadań na wątek w kolejce).
+
+        Returns:
+            (liczba opublikowanych, liczba wszystkich komentarzy)
+        """
+        posted_count = 0
+        total_count = 0
+        last_task: Dict[str, Future] = {}
+        pending: set = set()
+
+        def post_run(previous: Optional[Future], run: List[Dict[str, Any]]) -> int:
+            if previous is not None:
+                wait([previous])
+            posted = 0
+            for comment in run:
+                try:
+                    if self.post_inline_comment(mr_iid, context, comment):
+                        posted += 1
+                except Exception as e:
+                    logger.error(f"Błąd podczas publikowania komentarza dla {comment.get('file_path')}: {e}")
+            return posted
+
+        def collect(done: Iterable[Future]) -> int:
+            pending.difference_update(done)
+            return sum(future.result() for future in done)
+
+        with ThreadPoolExecutor(max_workers=self.post_workers, thread_name_prefix='gitlab-post') as executor:
+            def submit(file_path: str, run: List[Dict[str, Any]]) -> None:
+                # Zadania są pobierane z kolejki w kolejności zgłoszenia, więc
+                # poprzednie zadanie pliku jest już wykonywane przez inny wątek
+                future = executor.submit(post_run, last_task.get(file_path), run)
+                last_task[file_path] = future
+                pending.add(future)
+
+            run: List[Dict[str, Any]] = []
+            for comment in comments:
+                total_count += 1
+                if run and comment.get('file_path') != run[0].get('file_path'):
+                    submit(run[0].get('file_path'), run)
+                    run = []
+                    if len(pending) >= self.post_workers * 4:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        posted_count += collect(done)
+                run.append(comment)
+            if run:
+                submit(run[0].get('file_path'), run)
+
+            posted_count += collect(wait(pending).done)
+
+        return posted_count, total_count
+
+    def load_inline_context(self, mr_iid: str, existing: Optional[ExistingReview] = None) -> Optional[Dict[str, Any]]:
+        """
+        Pobiera informacje o MR, jego diffy i poprzednie review potrzebne do komentarzy inline
+
+        Returns:
+            Słownik z kluczami mr_info, diffs, index (DiffPositionIndex) i
+            existing (ExistingReview) lub None, jeśli nie da się ich pobrać
+        """
         mr_info = self._get_merge_request_info(mr_iid)
         if not mr_info:
             logger.error("Nie można pobrać informacji o MR")
-            return 0
+            return None
 
         # Pobierz diff MR
         diffs = self._get_merge_request_diffs(mr_iid)
         if not diffs:
             logger.warning("Nie znaleziono zmian w MR")
-            return 0
+            return None
 
-        posted_count = 0
+        with span('diff.index'):
+            index = DiffPositionIndex(diffs)
 
-        for comment in comments:
-            # Znajdź odpowiedni diff dla pliku
-            file_diff = self._find_file_diff(diffs, comment['file_path'])
-            if not file_diff:
-                logger.warning(f"Nie znaleziono diffa dla pliku: {comment['file_path']}")
-                continue
+        if existing is None:
+            existing = self.load_existing_review(mr_iid)
 
-            # Publikuj komentarz jako discussion
-            if self._post_inline_comment(mr_iid, mr_info, file_diff, comment):
-                posted_count += 1
-                time.sleep(self.request_delay)  # Rate limiting
+        return {"mr_info": mr_info, "diffs": diffs, "index": index, "existing": existing}
 
-        logger.info(f"Opublikowano {posted_count} z {len(comments)} komentarzy inline")
-        return posted_count
+    def post_inline_comment(self, mr_iid: str, context: Dict[str, Any], comment: Dict[str, Any]) -> bool:
+        """
+        Publikuje pojedynczy komentarz inline (z kontekstem z load_inline_context)
+
+        Args:
+            mr_iid: Internal ID merge requesta
+            context: Informacje o MR i diffy
+            comment: Dane komentarza
+        """
+        # Uwagi już obecne w MR nie są publikowane ponownie; dyskusje rozwiązane przez ludzi zostają rozwiązane
+        fingerprint = context['existing'].fingerprint(comment)
+        first, previous = context['existing'].claim(fingerprint)
+        if previous is not None or not first:
+            return False
+        comment = {**comment, 'fingerprint': fingerprint}
+
+        # Znajdź odpowiedni diff dla pliku
+        positions = context['index'].find(comment['file_path'])
+        if not positions:
+            logger.warning(f"Nie znaleziono diffa dla pliku: {comment['file_path']}")
+            return False
 
+        # Publikuj komentarz jako discussion (tempo reguluje limiter klienta)
+        return self._post_inline_comment(mr_iid, context['mr_info'], positions, comment)
+
+    @traced('gitlab.mr_info')
     def _get_merge_request_info(self, mr_iid: str) -> Optional[Dict[str, Any]]:
         """Pobiera informacje o merge request"""
         url = f"{self.gitlab_url}/projects/{self.project_id}/merge_requests/{mr_iid}"
 
         try:
-            response = requests.get(url, headers=self.headers)
+            response = self.client.request('GET', url)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
             logger.error(f"Błąd podczas pobierania informacji o MR: {e}")
             return None
 
+    @traced('gitlab.diffs')
     def _get_merge_request_diffs(self, mr_iid: str) -> List[Dict[str, Any]]:
-        """Pobiera diffy merge requesta"""
+        """Pobiera diffy merge requesta (wszystkie strony)"""
         url = f"{self.gitlab_url}/projects/{self.project_id}/merge_requests/{mr_iid}/diffs"
 
         try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            data = response.json()
-
-            if isinstance(data, list):
-                return data
-
-            if isinstance(data, dict):
-                return data.get('diffs', [])
-
-            logger.error("Niezrozumiała odpowiedź API dla diffów MR")
+            # Duże MR mają wiele stron diffów - bez nich komentarze lądowałyby poza liniami
+            return self.client.get_all_pages(url, items_key='diffs')
+        except ValueError as e:
+            logger.error(str(e))
             return []
         except requests.exceptions.RequestException as e:
             logger.error(f"Błąd podczas pobierania diffów: {e}")
             return []
 
-    def _find_file_diff(self, diffs: List[Dict[str, Any]], file_path: str) -> Optional[Dict[str, Any]]:
-        """Znajduje diff dla konkretnego pliku"""
-        for diff in diffs:
-            if diff.get('new_path') == file_path or diff.get('old_path') == file_path:
-                return diff
-        return None
-
-    def _map_line_to_diff_position(self, file_diff: Dict[str, Any], target_line: int) -> Optional[Dict[str, Any]]:
-        """
-        Mapuje numer linii do pozycji w diffie GitLab (new/old).
-
-        Zwraca słownik z kluczami:
-            - type: 'new' | 'old'
-            - line: numer linii dla odpowiedniego typu
-        """
-        diff_text = file_diff.get('diff')
-        if not diff_text or target_line < 1:
-            return None
-
-        old_line = 0
-        new_line = 0
-
-        # Parsuj diff linia po linii
-        for line in diff_text.splitlines():
-            if line.startswith('@@'):
-                match = re.match(r'@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@', line)
-                if not match:
-                    continue
-                old_line = int(match.group(1))
-                new_line = int(match.group(2))
-                continue
-
-            if line.startswith('+'):
-                if new_line == target_line:
-                    return {'type': 'new', 'line': new_line}
-                new_line += 1
-            elif line.startswith('-'):
-                if old_line == target_line:
-                    return {'type': 'old', 'line': old_line}
-                old_line += 1
-            elif line.startswith('\\'):
-                # Linia informacyjna "\ No newline at end of file"
-                continue
-            else:
-                # Linie kontekstowe zwiększają oba liczniki
-                if new_line == target_line:
-                    return {'type': 'new', 'line': new_line}
-                old_line += 1
-                new_line += 1
-
-        return None
-
+    @traced('gitlab.discussion')
     def _post_inline_comment(self, mr_iid: str, mr_info: Dict[str, Any],
-                             file_diff: Dict[str, Any], comment: Dict[str, Any]) -> bool:
+                             positions: FileDiffPositions, comment: Dict[str, Any]) -> bool:
         """
         Publikuje pojedynczy komentarz inline
 
         Args:
             mr_iid: ID merge requesta
             mr_info: Informacje o MR
-            file_diff: Diff pliku
+            positions: Diff pliku z indeksem linii
             comment: Dane komentarza
         """
 
@@ -325,7 +993,8 @@ class GitLabCommentPoster:
             logger.debug("Brak wymaganych danych do komentarza inline - publikuję jako zwykły komentarz")
             return self._post_as_regular_comment(mr_iid, comment)
 
-        position_mapping = self._map_line_to_diff_position(file_diff, target_line)
+        file_diff = positions.diff
+        position_mapping = positions.position(target_line, snap_lines=self.snap_lines)
         if not position_mapping:
             logger.debug(
                 f"Nie udało się zmapować linii {target_line} na diff - publikuję jako zwykły komentarz"
@@ -351,9 +1020,14 @@ class GitLabCommentPoster:
             payload["position"]["old_line"] = position_mapping['line']
         else:
             payload["position"]["new_line"] = position_mapping['line']
+            if 'snapped_from' in position_mapping:
+                logger.debug(
+                    f"Linia {target_line} poza diffem {comment['file_path']} - "
+                    f"komentarz przy najbliższej linii {position_mapping['line']}"
+                )
 
         try:
-            response = requests.post(url, headers=self.headers, json=payload)
+            response = self.client.request('POST', url, json=payload)
             response.raise_for_status()
             logger.debug(f"Opublikowano komentarz dla {comment['file_path']}:{comment.get('line_number')}")
             return True
@@ -364,6 +1038,7 @@ class GitLabCommentPoster:
             # Jeśli nie udało się jako inline, spróbuj jako zwykły komentarz
             return self._post_as_regular_comment(mr_iid, comment)
 
+    @traced('gitlab.note')
     def _post_as_regular_comment(self, mr_iid: str, comment: Dict[str, Any]) -> bool:
         """Publikuje jako zwykły komentarz jeśli inline się nie udał"""
         url = f"{self.gitlab_url}/projects/{self.project_id}/merge_requests/{mr_iid}/notes"
@@ -375,7 +1050,7 @@ class GitLabCommentPoster:
         payload = {"body": body}
 
         try:
-            response = requests.post(url, headers=self.headers, json=payload)
+            response = self.client.request('POST', url, json=payload)
             response.raise_for_status()
             logger.debug(f"Opublikowano jako zwykły komentarz: {comment['file_path']}")
             return True
@@ -418,8 +1093,12 @@ class GitLabCommentPoster:
             body += "\n\n💡 **Sugestia:**\n"
             body += f"```suggestion\n{comment['suggestion']}\n```"
 
+        # Odcisk uwagi rozpoznawany przy kolejnym uruchomieniu (niewidoczny w GitLab)
+        body += "\n\n" + FINDING_MARKER.format(fingerprint=comment.get('fingerprint') or comment_fingerprint(comment))
+
         return body
 
+    @traced('gitlab.labels')
     def update_merge_request_labels(self, mr_iid: str, summary: Dict[str, Any]) -> bool:
         """
         Aktualizuje etykiety MR na podstawie wyników review
@@ -455,7 +1134,7 @@ class GitLabCommentPoster:
         payload = {"add_labels": ','.join(labels)}
 
         try:
-            response = requests.put(url, headers=self.headers, json=payload)
+            response = self.client.request('PUT', url, json=payload)
             response.raise_for_status()
             logger.info(f"Zaktualizowano etykiety MR: {labels}")
             return True
@@ -464,42 +1143,110 @@ class GitLabCommentPoster:
             return False
 
 
+def add_posting_arguments(parser: argparse.ArgumentParser) -> None:
+    """Dodaje opcje tempa publikowania w GitLab"""
+    parser.add_argument(
+        '--post-workers',
+        type=int,
+        default=DEFAULT_POST_WORKERS,
+        help='Liczba wątków publikujących komentarze inline'
+    )
+    parser.add_argument(
+        '--gitlab-rate',
+        type=float,
+        default=DEFAULT_GITLAB_RATE,
+        help='Startowe tempo zapytań do GitLab API na sekundę (potem według nagłówków RateLimit-*)'
+    )
+    parser.add_argument(
+        '--snap-lines',
+        type=int,
+        default=DEFAULT_SNAP_LINES,
+        help='Komentarz do linii poza diffem, odległej o co najwyżej tyle linii, trafia na najbliższą linię diffa '
+             '(0 = publikuj jako zwykły komentarz)'
+    )
+
+
+def create_poster(args: argparse.Namespace) -> GitLabCommentPoster:
+    """Tworzy GitLabCommentPoster na podstawie opcji z add_posting_arguments"""
+    return GitLabCommentPoster(
+        limiter=GitLabRateLimiter(rate=args.gitlab_rate, burst=args.post_workers),
+        post_workers=args.post_workers,
+        snap_lines=args.snap_lines
+    )
+
+
 def main():
     """Główna funkcja skryptu"""
     parser = argparse.ArgumentParser(description='Post Claude review comments to GitLab MR')
     parser.add_argument('--mr-iid', required=True, help='Merge Request IID')
-    parser.add_argument('--input', default='review-results.json', help='Input file with review results')
+    parser.add_argument(
+        '--input',
+        default='review-results.json',
+        help='Input file with review results (.json lub strumieniowo czytany .jsonl z claude_review.py --jsonl-output)'
+    )
     parser.add_argument('--skip-inline', action='store_true', help='Skip inline comments, post only summary')
     parser.add_argument('--skip-labels', action='store_true', help='Skip updating MR labels')
+    add_posting_arguments(parser)
     parser.add_argument('--debug', action='store_true', help='Enable debug logging')
+    add_tracing_arguments(parser, prefix='post')
+    parser.add_argument(
+        '--print-last-reviewed-sha',
+        action='store_true',
+        help='Wypisz SHA ostatnio sprawdzonego HEAD (dla claude_review.py --since-sha) i zakończ'
+    )
 
     args = parser.parse_args()
 
     if args.debug:
         logging.getLogger().setLevel(logging.DEBUG)
 
+    configure_tracing(args)
+
     try:
         # Inicjalizuj poster
-        poster = GitLabCommentPoster()
+        poster = create_poster(args)
 
-        # Wczytaj wyniki review
-        results = poster.load_review_results(args.input)
-        if not results:
-            logger.warning("Brak wyników review do opublikowania")
+        if args.print_last_reviewed_sha:
+            print(poster.get_last_reviewed_sha(args.mr_iid) or "")
             sys.exit(0)
 
-        summary = results.get('summary', {})
-        comments = results.get('comments', [])
+        # Wczytaj wyniki review (JSON Lines: tylko podsumowanie, komentarze czytane strumieniowo)
+        if args.input.endswith('.jsonl'):
+            record = poster.load_review_summary(args.input)
+            if not record:
+                logger.warning("Brak wyników review do opublikowania")
+                sys.exit(0)
 
-        logger.info(f"Znaleziono {len(comments)} komentarzy do opublikowania")
+            summary = record.get('summary', {})
+            comment_count = record.get('total_comments', 0)
+            comments = poster.iter_review_comments(args.input)
+        else:
+            results = poster.load_review_results(args.input)
+            if not results:
+                logger.warning("Brak wyników review do opublikowania")
+                sys.exit(0)
+
+            summary = results.get('summary', {})
+            comments = results.get('comments', [])
+            comment_count = len(comments)
+
+        logger.info(f"Znaleziono {comment_count} komentarzy do opublikowania")
+
+        # Poprzednie review w MR są pobierane raz: podsumowanie jest edytowane, powtórzone uwagi pomijane
+        existing = poster.load_existing_review(args.mr_iid)
 
         # Publikuj podsumowanie
-        if not poster.post_summary_comment(args.mr_iid, summary):
+        if not poster.post_summary_comment(args.mr_iid, summary, existing=existing):
             logger.error("Nie udało się opublikować podsumowania")
 
-        # Publikuj komentarze inline (jeśli nie pominięto)
-        if not args.skip_inline and comments:
-            posted = poster.post_inline_comments(args.mr_iid, comments)
+        # Publikuj komentarze inline (jeśli nie pominięto); także bez komentarzy, by rozwiązać nieaktualne dyskusje
+        if not args.skip_inline and (comment_count or existing.findings):
+            posted = poster.post_inline_comments(
+                args.mr_iid,
+                comments,
+                existing=existing,
+                resolve_stale=summary.get('complete', True)
+            )
             logger.info(f"Opublikowano {posted} komentarzy inline")
 
         # Aktualizuj etykiety (jeśli nie pominięto)
@@ -519,6 +1266,9 @@ def main():
         logger.debug(traceback.format_exc())
         sys.exit(1)
 
+    finally:
+        export_tracing(args, 'post_comments')
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Pipelined Claude Review and GitLab MR Posting
+Runs the Claude review and publishes inline comments while the analysis is still running
+"""
+
+import argparse
+import logging
+import queue
+import sys
+import threading
+from dataclasses import asdict
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from claude_review import BudgetExceededError, CodeReviewer, add_review_arguments, create_reviewer, run_review
+from post_comments import GitLabCommentPoster, add_posting_arguments, comment_fingerprints, create_poster
+from tracing import add_tracing_arguments, configure_tracing, export_tracing
+
+# Konfiguracja logowania
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Znacznik końca kolejki komentarzy
+_STOP = object()
+
+
+class ReviewPostPipeline:
+    """
+    Potok producent/konsument między CodeReviewer a GitLabCommentPoster.
+
+    Wątki analizy wrzucają gotowe komentarze do ograniczonej kolejki, a osobny
+    wątek przekazuje je na bieżąco do puli wątków publikujących postera.
+    Pełna kolejka wstrzymuje analizę, dopóki poster nie nadrobi zaległości.
+    """
+
+    def __init__(self, reviewer: CodeReviewer, poster: GitLabCommentPoster, mr_iid: str, queue_size: int = 100):
+        self.reviewer = reviewer
+        self.poster = poster
+        self.mr_iid = mr_iid
+        self.queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self.received_count = 0
+        self.posted_count = 0
+        self.context = None
+        self.error: Optional[Exception] = None
+        self._stopped = False
+
+    def run(self, review: Callable[[], None]) -> None:
+        """Uruchamia review i publikuje komentarze, aż review się zakończy i kolejka opustoszeje"""
+        consumer = threading.Thread(target=self._consume, name='gitlab-poster', daemon=True)
+        consumer.start()
+
+        self.reviewer.on_comment = self.queue.put
+        try:
+            review()
+        finally:
+            # Komentarze zgłoszone po znaczniku końca nie miałyby już czytelnika - są odrzucane
+            self.reviewer.on_comment = lambda comment: None
+            self.queue.put(_STOP)
+            consumer.join()
+
+        logger.info(f"Opublikowano {self.posted_count} z {self.received_count} komentarzy inline")
+
+    def _comments(self) -> Iterator[Dict[str, Any]]:
+        """Komentarze z kolejki aż do znacznika końca"""
+        for comment in iter(self.queue.get, _STOP):
+            self.received_count += 1
+            yield asdict(comment)
+        self._stopped = True
+
+    def _consume(self) -> None:
+        """Publikuje komentarze z kolejki (wątek konsumenta)"""
+        try:
+            # Pobranie informacji o MR i diffów odbywa się równolegle z pierwszymi zapytaniami do Claude
+            context = self.context = self.poster.load_inline_context(self.mr_iid)
+            if context is not None:
+                self.posted_count, _ = self.poster.post_inline_comment_stream(self.mr_iid, context, self._comments())
+        except Exception as e:
+            self.error = e
+            logger.error(f"Błąd podczas publikowania komentarzy inline - pozostałe nie zostaną opublikowane: {e}")
+        finally:
+            # Kolejkę trzeba opróżniać do końca, żeby pełna kolejka nie wstrzymała analizy
+            if not self._stopped:
+                for _ in self._comments():
+                    pass
+
+
+def main():
+    """Główna funkcja skryptu"""
+    parser = argparse.ArgumentParser(description='Claude review with pipelined posting to GitLab MR')
+    add_review_arguments(parser)
+    parser.add_argument('--mr-iid', required=True, help='Merge Request IID')
+    parser.add_argument(
+        '--queue-size',
+        type=int,
+        default=100,
+        help='Maksymalna liczba komentarzy czekających na publikację'
+    )
+    parser.add_argument('--skip-inline', action='store_true', help='Skip inline comments, post only summary')
+    parser.add_argument('--skip-labels', action='store_true', help='Skip updating MR labels')
+    add_posting_arguments(parser)
+    parser.add_argument('--debug', action='store_true', help='Enable debug logging')
+    add_tracing_arguments(parser)
+
+    args = parser.parse_args()
+
+    if args.debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    configure_tracing(args)
+
+    try:
+        reviewer = create_reviewer(args)
+        poster = create_poster(args)
+
+        if args.plan:
+            # Sama prognoza - nic nie jest publikowane w MR
+            run_review(reviewer, args)
+            return
+
+        context = None
+        if args.skip_inline:
+            run_review(reviewer, args)
+        else:
+            pipeline = ReviewPostPipeline(reviewer, poster, args.mr_iid, queue_size=args.queue_size)
+            pipeline.run(lambda: run_review(reviewer, args))
+            context = pipeline.context
+
+        # Podsumowanie i etykiety dopiero po zakończeniu analizy
+        results = poster.load_review_results(args.output)
+        summary = results.get('summary', {})
+
+        # Poprzednie review pobrał już wątek publikujący - podsumowanie jest edytowane w miejscu
+        existing = context['existing'] if context else None
+        if not poster.post_summary_comment(args.mr_iid, summary, existing=existing):
+            logger.error("Nie udało się opublikować podsumowania")
+
+        if existing is not None and summary.get('complete', True):
+            # Aktualne są wszystkie uwagi z wyników, także te, które nie przeszły przez kolejkę
+            existing.mark_seen(comment_fingerprints(asdict(comment) for comment in reviewer.comments))
+            poster.resolve_stale_discussions(args.mr_iid, existing)
+
+        if not args.skip_labels:
+            poster.update_merge_request_labels(args.mr_iid, summary)
+
+        logger.info("Review i publikowanie komentarzy zakończone pomyślnie")
+
+        # Zwróć odpowiedni kod wyjścia
+        if summary.get('status') == 'needs_work':
+            logger.warning("Review wymaga poprawek - zwracam kod błędu")
+            sys.exit(1)
+
+    except BudgetExceededError as e:
+        logger.error(str(e))
+        sys.exit(3)
+
+    except Exception as e:
+        logger.error(f"Błąd krytyczny: {e}")
+        import traceback
+        logger.debug(traceback.format_exc())
+        sys.exit(1)
+
+    finally:
+        export_tracing(args, 'review_and_post')
+
+
+if __name__ == "__main__":
+    main()
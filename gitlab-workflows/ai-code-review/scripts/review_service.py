@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+"""
+Claude Review Service
+Long-running worker that reviews merge requests from GitLab webhooks with warm API clients, connections and git mirrors
+"""
+
+import argparse
+import base64
+import hmac
+import json
+import logging
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from anthropic import Anthropic
+
+from claude_review import (AdaptiveConcurrencyLimiter, CodeReviewer, add_review_arguments, create_reviewer,
+                           run_review)
+from post_comments import DEFAULT_POST_WORKERS, GitLabClient, GitLabCommentPoster, GitLabRateLimiter
+
+# Konfiguracja logowania
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Akcje MR uruchamiające review ("update" tylko z nowymi commitami, czyli z polem oldrev)
+REVIEW_ACTIONS = ('open', 'reopen', 'update')
+
+# Akcje MR, po których oczekujące review nie ma sensu
+CLOSING_ACTIONS = ('close', 'merge')
+
+
+@dataclass
+class ReviewJob:
+    """Review jednego pushu do MR"""
+    project_id: str
+    mr_iid: str
+    head_sha: str
+    repo_url: str
+    received_at: float = field(default_factory=time.monotonic)
+    superseded: bool = False
+    reviewer: Optional[CodeReviewer] = None
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return (self.project_id, self.mr_iid)
+
+    def supersede(self) -> None:
+        """Oznacza zadanie jako nieaktualne i przerywa trwające review"""
+        self.superseded = True
+        if self.reviewer is not None:
+            self.reviewer.cancel()
+
+
+class ReviewJobQueue:
+    """
+    Kolejka review z deduplikacją po MR.
+
+    Na MR przypada co najwyżej jedno oczekujące zadanie: nowszy push zastępuje
+    czekające zadanie, a trwające review starszego commita jest przerywane
+    i jego wyniki nie są publikowane. Zadania jednego MR nigdy nie są
+    wykonywane równolegle (wspólny plik stanu review przyrostowego).
+    """
+
+    def __init__(self):
+        self._pending: Dict[Tuple[str, str], ReviewJob] = {}
+        self._running: Dict[Tuple[str, str], ReviewJob] = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self.stats = {"received": 0, "duplicate": 0, "superseded": 0, "completed": 0, "failed": 0}
+
+    def put(self, job: ReviewJob) -> None:
+        """Dodaje zadanie, zastępując starsze zadania tego samego MR"""
+        with self._condition:
+            self.stats["received"] += 1
+
+            # Ponownie dostarczony webhook dla commita, którego review właśnie trwa
+            running = self._running.get(job.key)
+            if running is not None and not running.superseded and running.head_sha == job.head_sha:
+                self.stats["duplicate"] += 1
+                return
+
+            previous = self._pending.pop(job.key, None)
+            if previous is not None:
+                self.stats["superseded"] += 1
+                logger.info(f"MR !{job.mr_iid}: pomijam oczekujące review {previous.head_sha[:8]} (nowszy push)")
+
+            if running is not None and not running.superseded:
+                self.stats["superseded"] += 1
+                logger.info(f"MR !{job.mr_iid}: przerywam review {running.head_sha[:8]} (nowszy push)")
+                running.supersede()
+
+            self._pending[job.key] = job
+            self._condition.notify_all()
+
+    def drop(self, key: Tuple[str, str]) -> None:
+        """Usuwa oczekujące i przerywa trwające review MR (np. po zamknięciu lub merge)"""
+        with self._condition:
+            pending = self._pending.pop(key, None)
+            running = self._running.get(key)
+            for job in (pending, running):
+                if job is not None and not job.superseded:
+                    self.stats["superseded"] += 1
+                    job.supersede()
+
+    def get(self) -> Optional[ReviewJob]:
+        """Zwraca najstarsze zadanie MR, dla którego nie trwa review (None po close())"""
+        with self._condition:
+            while not self._closed:
+                for key, job in self._pending.items():
+                    if key not in self._running:
+                        del self._pending[key]
+                        self._running[key] = job
+                        return job
+                self._condition.wait()
+            return None
+
+    def task_done(self, job: ReviewJob, status: str) -> None:
+        """Kończy zadanie ze statusem completed, superseded lub failed"""
+        with self._condition:
+            self._running.pop(job.key, None)
+            if status != "superseded" or not job.superseded:
+                self.stats[status] += 1
+            self._condition.notify_all()
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Stan kolejki dla GET /healthz"""
+        with self._condition:
+            return {
+                "pending": [f"{project_id}!{mr_iid}" for project_id, mr_iid in self._pending],
+                "running": [f"{project_id}!{mr_iid}" for project_id, mr_iid in self._running],
+                **self.stats
+            }
+
+
+class RepositoryMirror:
+    """
+    Lokalny klon (bare) repozytorium projektu współdzielony przez kolejne review.
+
+    Przy każdym review dociągane są tylko nowe obiekty, a kod MR trafia do
+    tymczasowego worktree, więc kilka MR tego projektu można analizować
+    równolegle. Token GitLab jest przekazywany w nagłówku HTTP przez
+    zmienne GIT_CONFIG_*, a nie w URL zapisywanym w konfiguracji klonu.
+    """
+
+    def __init__(self, path: str, url: str, token: Optional[str] = None):
+        self.path = path
+        self.url = url
+        self.worktrees_dir = f"{path}.worktrees"
+        self._lock = threading.Lock()
+        self._env = dict(os.environ)
+        if token:
+            credentials = base64.b64encode(f"oauth2:{token}".encode('utf-8')).decode('ascii')
+            self._env.update({
+                'GIT_CONFIG_COUNT': '1',
+                'GIT_CONFIG_KEY_0': 'http.extraHeader',
+                'GIT_CONFIG_VALUE_0': f"Authorization: Basic {credentials}"
+            })
+
+    def _git(self, *args: str, cwd: Optional[str] = None) -> None:
+        subprocess.run(
+            ["git", *args],
+            cwd=cwd or self.path,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            env=self._env
+        )
+
+    def checkout(self, mr_iid: str, head_sha: str) -> str:
+        """Dociąga gałęzie i head MR, tworzy worktree na head_sha i zwraca jego ścieżkę"""
+        with self._lock:
+            if not os.path.isdir(os.path.join(self.path, 'objects')):
+                logger.info(f"Klonuję {self.url} do {self.path}")
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._git("clone", "--quiet", "--bare", self.url, self.path, cwd=os.path.dirname(self.path))
+
+            self._git(
+                "fetch", "--quiet", "--prune", "origin",
+                "+refs/heads/*:refs/heads/*",
+                f"+refs/merge-requests/{mr_iid}/head:refs/merge-requests/{mr_iid}/head"
+            )
+
+            os.makedirs(self.worktrees_dir, exist_ok=True)
+            worktree = tempfile.mkdtemp(prefix=f"mr-{mr_iid}-", dir=self.worktrees_dir)
+            self._git("worktree", "add", "--quiet", "--detach", "--force", worktree, head_sha)
+            return worktree
+
+    def release(self, worktree: str) -> None:
+        """Usuwa worktree po review"""
+        with self._lock:
+            try:
+                self._git("worktree", "remove", "--force", worktree)
+            except (OSError, subprocess.CalledProcessError) as e:
+                logger.warning(f"Nie udało się usunąć worktree {worktree}: {e}")
+                shutil.rmtree(worktree, ignore_errors=True)
+                self._git("worktree", "prune")
+
+
+class ReviewService:
+    """
+    Serwis review MR zasilany webhookami GitLab.
+
+    Klient Anthropic, limiter zapytań, sesja HTTP do GitLab (pula połączeń),
+    klony repozytoriów i cache review żyją przez cały czas działania serwisu
+    i są współdzielone przez kolejne review. Webhook tylko dodaje zadanie do
+    kolejki; review wykonuje pula wątków roboczych.
+    """
+
+    def __init__(self, review_args: argparse.Namespace, work_dir: str, workers: int = 2,
+                 webhook_secret: Optional[str] = None, gitlab_token: Optional[str] = None,
+                 gitlab_url: Optional[str] = None):
+        """
+        Args:
+            review_args: Opcje review (z add_review_arguments); --diff i pliki wyników są ustawiane per MR
+            work_dir: Katalog na klony repozytoriów, cache, stan i wyniki review
+            workers: Liczba MR analizowanych równolegle
+            webhook_secret: Oczekiwana wartość nagłówka X-Gitlab-Token (None = bez weryfikacji)
+            gitlab_token: Token GitLab (domyślnie z GITLAB_TOKEN)
+            gitlab_url: URL GitLab API (domyślnie z CI_API_V4_URL)
+        """
+        self.review_args = review_args
+        self.work_dir = os.path.abspath(work_dir)
+        self.workers = max(1, workers)
+        self.webhook_secret = webhook_secret
+        self.gitlab_token = gitlab_token or os.environ.get('GITLAB_TOKEN')
+        self.gitlab_url = gitlab_url
+        self.queue = ReviewJobQueue()
+
+        if not os.path.isabs(self.review_args.cache_dir):
+            self.review_args.cache_dir = os.path.join(self.work_dir, self.review_args.cache_dir)
+
+        # Współdzielone przez wszystkie review; ponowienia obsługuje CodeReviewer
+        self.client = Anthropic(max_retries=0)
+        self.limiter = AdaptiveConcurrencyLimiter(self.review_args.concurrency * self.workers)
+        self.session = GitLabClient.create_session(pool_size=self.workers * (DEFAULT_POST_WORKERS + 1))
+        # Limity GitLab API dotyczą tokena, więc limiter jest wspólny dla wszystkich projektów
+        self.gitlab_limiter = GitLabRateLimiter()
+
+        self._posters: Dict[str, GitLabCommentPoster] = {}
+        self._mirrors: Dict[str, RepositoryMirror] = {}
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def handle_event(self, payload: Dict[str, Any]) -> Tuple[int, str]:
+        """Obsługuje zdarzenie Merge Request Hook; zwraca (status HTTP, komunikat)"""
+        if payload.get('object_kind') != 'merge_request':
+            return 202, "Zdarzenie pominięte"
+
+        attributes = payload.get('object_attributes') or {}
+        project = payload.get('project') or {}
+        project_id = str(project.get('id') or attributes.get('target_project_id') or '')
+        mr_iid = str(attributes.get('iid') or '')
+        action = attributes.get('action')
+        if not project_id or not mr_iid:
+            return 400, "Brak project.id lub object_attributes.iid"
+
+        if action in CLOSING_ACTIONS:
+            self.queue.drop((project_id, mr_iid))
+            return 202, f"MR !{mr_iid} zamknięty - review anulowane"
+
+        if action not in REVIEW_ACTIONS or (action == 'update' and not attributes.get('oldrev')):
+            return 202, "Brak nowych commitów - zdarzenie pominięte"
+
+        head_sha = (attributes.get('last_commit') or {}).get('id')
+        repo_url = project.get('git_http_url')
+        if not head_sha or not repo_url:
+            return 400, "Brak last_commit.id lub project.git_http_url"
+
+        self.queue.put(ReviewJob(project_id=project_id, mr_iid=mr_iid, head_sha=head_sha, repo_url=repo_url))
+        logger.info(f"Zakolejkowano review MR !{mr_iid} projektu {project_id} ({head_sha[:8]})")
+        return 202, "Zakolejkowano"
+
+    def _poster(self, project_id: str) -> GitLabCommentPoster:
+        with self._lock:
+            if project_id not in self._posters:
+                self._posters[project_id] = GitLabCommentPoster(
+                    project_id=project_id,
+                    gitlab_token=self.gitlab_token,
+                    gitlab_url=self.gitlab_url,
+                    session=self.session,
+                    limiter=self.gitlab_limiter
+                )
+            return self._posters[project_id]
+
+    def _mirror(self, job: ReviewJob) -> RepositoryMirror:
+        with self._lock:
+            if job.project_id not in self._mirrors:
+                self._mirrors[job.project_id] = RepositoryMirror(
+                    os.path.join(self.work_dir, 'repos', f"{job.project_id}.git"),
+                    job.repo_url,
+                    token=self.gitlab_token
+                )
+            return self._mirrors[job.project_id]
+
+    def _job_args(self, job: ReviewJob, base_sha: str) -> argparse.Namespace:
+        """Opcje review dla MR: wyniki i stan review przyrostowego w osobnym katalogu MR"""
+        job_dir = os.path.join(self.work_dir, 'results', f"{job.project_id}-{job.mr_iid}")
+        os.makedirs(job_dir, exist_ok=True)
+        return argparse.Namespace(**{
+            **vars(self.review_args),
+            'diff': base_sha,
+            'output': os.path.join(job_dir, 'review-results.json'),
+            'report_output': os.path.join(job_dir, 'review-report.json'),
+            'state_file': os.path.join(job_dir, 'review-state.json'),
+            'plan_output': os.path.join(job_dir, 'review-plan.json'),
+            'plan': False,
+            'incremental': True,
+            'journal': '',
+            'resume': False,
+            'jsonl_output': ''
+        })
+
+    def run_job(self, job: ReviewJob) -> str:
+        """Wykonuje review MR i publikuje wyniki; zwraca status zadania"""
+        poster = self._poster(job.project_id)
+
+        mr_info = poster._get_merge_request_info(job.mr_iid)
+        if not mr_info:
+            return "failed"
+
+        diff_refs = mr_info.get('diff_refs') or {}
+        if diff_refs.get('head_sha') and diff_refs['head_sha'] != job.head_sha:
+            logger.info(f"MR !{job.mr_iid}: {job.head_sha[:8]} nie jest już headem MR - pomijam")
+            return "superseded"
+        if not diff_refs.get('base_sha'):
+            logger.error(f"MR !{job.mr_iid}: brak diff_refs.base_sha")
+            return "failed"
+
+        args = self._job_args(job, diff_refs['base_sha'])
+        mirror = self._mirror(job)
+        worktree = mirror.checkout(job.mr_iid, job.head_sha)
+        try:
+            reviewer = create_reviewer(args, client=self.client, repo_path=worktree, limiter=self.limiter)
+            job.reviewer = reviewer
+            if job.superseded:
+                return "superseded"
+            run_review(reviewer, args)
+        finally:
+            mirror.release(worktree)
+
+        if job.superseded:
+            logger.info(f"MR !{job.mr_iid}: review {job.head_sha[:8]} nieaktualne - nie publikuję wyników")
+            return "superseded"
+
+        summary = poster.load_review_results(args.output).get('summary', {})
+        existing = poster.load_existing_review(job.mr_iid)
+        if not poster.post_summary_comment(job.mr_iid, summary, existing=existing):
+            logger.error(f"MR !{job.mr_iid}: nie udało się opublikować podsumowania")
+        if reviewer.comments or existing.findings:
+            poster.post_inline_comments(
+                job.mr_iid,
+                [asdict(comment) for comment in reviewer.comments],
+                existing=existing,
+                resolve_stale=reviewer.complete
+            )
+        poster.update_merge_request_labels(job.mr_iid, summary)
+        return "completed"
+
+    def _work(self) -> None:
+        """Pętla wątku roboczego"""
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+
+            started = time.monotonic()
+            try:
+                status = self.run_job(job)
+            except Exception as e:
+                logger.error(f"Błąd podczas review MR !{job.mr_iid}: {e}")
+                status = "failed"
+            self.queue.task_done(job, status)
+            logger.info(
+                f"MR !{job.mr_iid} ({job.head_sha[:8]}): {status} po {time.monotonic() - started:.1f}s "
+                f"(w kolejce {started - job.received_at:.1f}s)"
+            )
+
+    def start_workers(self) -> None:
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"review-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        self.queue.close()
+        for thread in self._threads:
+            thread.join()
+
+    def make_handler(self):
+        """Zwraca klasę handlera HTTP: POST /webhook i GET /healthz"""
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                logger.debug(f"{self.address_string()} {format % args}")
+
+            def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path != '/healthz':
+                    self._send_json(404, {"error": "Nie znaleziono"})
+                    return
+                self._send_json(200, {"status": "ok", "queue": service.queue.snapshot()})
+
+            def do_POST(self):
+                if self.path != '/webhook':
+                    self._send_json(404, {"error": "Nie znaleziono"})
+                    return
+
+                token = self.headers.get('X-Gitlab-Token', '')
+                if service.webhook_secret and not hmac.compare_digest(token, service.webhook_secret):
+                    self._send_json(401, {"error": "Nieprawidłowy X-Gitlab-Token"})
+                    return
+
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    payload = json.loads(self.rfile.read(length) or b'{}')
+                except (ValueError, json.JSONDecodeError):
+                    self._send_json(400, {"error": "Nieprawidłowy JSON"})
+                    return
+
+                if not isinstance(payload, dict):
+                    self._send_json(400, {"error": "Nieprawidłowy JSON"})
+                    return
+
+                status, message = service.handle_event(payload)
+                self._send_json(status, {"message": message})
+
+        return Handler
+
+
+def main():
+    """Główna funkcja skryptu"""
+    parser = argparse.ArgumentParser(description='Long-running Claude review service for GitLab MR webhooks')
+    parser.add_argument('--host', default='127.0.0.1', help='Adres nasłuchiwania')
+    parser.add_argument('--port', type=int, default=8080, help='Port nasłuchiwania')
+    parser.add_argument('--workers', type=int, default=2, help='Liczba MR analizowanych równolegle')
+    parser.add_argument(
+        '--work-dir',
+        default='.ai-review-service',
+        help='Katalog na klony repozytoriów, cache, stan i wyniki review'
+    )
+    parser.add_argument(
+        '--review-args',
+        default='',
+        help='Opcje claude_review.py dla każdego review, np. "--concurrency 8 --pack-tokens 8000"'
+    )
+    parser.add_argument('--debug', action='store_true', help='Enable debug logging')
+
+    args = parser.parse_args()
+
+    if args.debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    # --diff jest ustawiane osobno dla każdego MR
+    review_parser = argparse.ArgumentParser(prog='review_service.py --review-args')
+    add_review_arguments(review_parser)
+    review_args = review_parser.parse_args(['--diff', 'HEAD', *shlex.split(args.review_args)])
+
+    webhook_secret = os.environ.get('GITLAB_WEBHOOK_SECRET')
+    if not webhook_secret:
+        logger.warning("Brak GITLAB_WEBHOOK_SECRET - webhooki nie są weryfikowane")
+
+    try:
+        service = ReviewService(review_args, args.work_dir, workers=args.workers, webhook_secret=webhook_secret)
+    except Exception as e:
+        logger.error(f"Błąd krytyczny: {e}")
+        sys.exit(1)
+
+    service.start_workers()
+    httpd = ThreadingHTTPServer((args.host, args.port), service.make_handler())
+    logger.info(f"Serwis review nasłuchuje na http://{args.host}:{args.port}/webhook ({service.workers} wątków)")
+
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Review Tracing
+Span-based phase instrumentation for claude_review.py and post_comments.py (Chrome trace, Prometheus textfile, cProfile)
+"""
+
+import argparse
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Prefiks metryk w pliku dla textfile collectora node_exportera
+METRIC_PREFIX = "ai_review"
+
+
+class Tracer:
+    """
+    Zbiera spany (nazwa, początek, czas trwania, wątek) faz review.
+
+    Wyłączony tracer nie zapisuje niczego, więc instrumentacja może zostać
+    w kodzie na stałe. Spany są eksportowane do formatu Chrome trace-event
+    (chrome://tracing, Perfetto) oraz jako podsumowanie per faza w formacie
+    Prometheus textfile. Opcjonalnie jedna faza jest profilowana cProfile
+    (w wątku, który otwiera span tej fazy).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.profile_phase: Optional[str] = None
+        self.profiles: List[pstats.Stats] = []
+        self._events: List[Dict[str, Any]] = []
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._profiling = False
+        self._started = time.perf_counter()
+
+    def enable(self, profile_phase: Optional[str] = None) -> None:
+        """Włącza zbieranie spanów (i profilowanie fazy profile_phase)"""
+        self.enabled = True
+        self.profile_phase = profile_phase or None
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[None]:
+        """Mierzy czas bloku kodu jako span o podanej nazwie"""
+        if not self.enabled:
+            yield
+            return
+
+        profiler = self._start_profile(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - started
+            if profiler is not None:
+                self._stop_profile(profiler)
+            self.record(name, started, duration, **args)
+
+    def record(self, name: str, started: float, duration: float, **args: Any) -> None:
+        """Zapisuje zmierzony span (started z time.perf_counter())"""
+        if not self.enabled:
+            return
+
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": name.split('.', 1)[0],
+            "ph": "X",
+            "ts": round((started - self._started) * 1_000_000),
+            "dur": round(duration * 1_000_000),
+            "pid": os.getpid(),
+            "tid": thread.ident,
+        }
+        if args:
+            event["args"] = args
+
+        with self._lock:
+            self._events.append(event)
+            self._threads.setdefault(thread.ident, thread.name)
+
+    def _start_profile(self, name: str) -> Optional[cProfile.Profile]:
+        if name != self.profile_phase:
+            return None
+        with self._lock:
+            # cProfile nie obsługuje zagnieżdżonych ani równoległych profili
+            if self._profiling:
+                return None
+            self._profiling = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _stop_profile(self, profiler: cProfile.Profile) -> None:
+        profiler.disable()
+        with self._lock:
+            self.profiles.append(pstats.Stats(profiler))
+            self._profiling = False
+
+    def phase_totals(self) -> Dict[str, Dict[str, float]]:
+        """Zwraca {faza: {"count", "sum", "max"}} (czasy w sekundach)"""
+        totals: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            events = list(self._events)
+        for event in events:
+            entry = totals.setdefault(event["name"], {"count": 0, "sum": 0.0, "max": 0.0})
+            seconds = event["dur"] / 1_000_000
+            entry["count"] += 1
+            entry["sum"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+        return totals
+
+    def export_chrome_trace(self, path: str) -> None:
+        """Zapisuje spany w formacie Chrome trace-event (JSON)"""
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": ident, "args": {"name": name}}
+            for ident, name in threads.items()
+        ]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+        logger.info(f"Zapisano {len(events)} spanów do {path}")
+
+    def export_prometheus(self, path: str, script: str) -> None:
+        """
+        Zapisuje czasy faz w formacie Prometheus textfile.
+
+        Plik jest podmieniany atomowo, jak wymaga textfile collector.
+        """
+        metric = f"{METRIC_PREFIX}_phase_duration_seconds"
+        lines = [
+            f"# HELP {metric} Czas faz review (suma, liczba i maksimum spanów)",
+            f"# TYPE {metric} summary"
+        ]
+        max_lines = [
+            f"# HELP {metric}_max Najdłuższy span fazy review",
+            f"# TYPE {metric}_max gauge"
+        ]
+        for name, entry in sorted(self.phase_totals().items()):
+            labels = f'{{script="{script}",phase="{name}"}}'
+            lines.append(f"{metric}_sum{labels} {entry['sum']:.6f}")
+            lines.append(f"{metric}_count{labels} {entry['count']}")
+            max_lines.append(f"{metric}_max{labels} {entry['max']:.6f}")
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines + max_lines) + '\n')
+        os.replace(tmp_path, path)
+        logger.info(f"Zapisano metryki faz do {path}")
+
+    def export_profile(self, path: str, limit: int = 25) -> None:
+        """Zapisuje profil fazy (pstats) i loguje najdroższe funkcje"""
+        if not self.profiles:
+            logger.warning(f"Faza {self.profile_phase} nie została wykonana - brak profilu")
+            return
+
+        stats = self.profiles[0]
+        for other in self.profiles[1:]:
+            stats.add(other)
+        stats.dump_stats(path)
+
+        summary = io.StringIO()
+        stats.stream = summary
+        stats.sort_stats('cumulative').print_stats(limit)
+        logger.info(f"Profil fazy {self.profile_phase} zapisany do {path}\n{summary.getvalue()}")
+
+
+TRACER = Tracer()
+
+
+def span(name: str, **args: Any):
+    """Span w globalnym tracerze (no-op, gdy --profile nie jest włączone)"""
+    return TRACER.span(name, **args)
+
+
+def traced(name: str) -> Callable:
+    """Dekorator mierzący każde wywołanie funkcji jako span o podanej nazwie"""
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return function(*args, **kwargs)
+            with TRACER.span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_tracing_arguments(parser: argparse.ArgumentParser, prefix: str = 'review') -> None:
+    """Dodaje opcje --profile i plików wynikowych instrumentacji"""
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Mierz czas faz (git, Claude API, parsowanie, GitLab) i zapisz trace oraz metryki'
+    )
+    parser.add_argument(
+        '--trace-file',
+        default=f'{prefix}-trace.json',
+        help='Plik trace w formacie Chrome trace-event (chrome://tracing, Perfetto)'
+    )
+    parser.add_argument(
+        '--metrics-file',
+        default=f'{prefix}-metrics.prom',
+        help='Plik metryk faz w formacie Prometheus textfile'
+    )
+    parser.add_argument(
+        '--profile-phase',
+        default='',
+        help='Uruchom cProfile wokół spanu tej fazy (np. get_diff) i zapisz profil do <faza>.pstats'
+    )
+
+
+def configure_tracing(args: argparse.Namespace) -> None:
+    """Włącza tracer według opcji z add_tracing_arguments"""
+    if args.profile or args.profile_phase:
+        TRACER.enable(profile_phase=args.profile_phase)
+
+
+def export_tracing(args: argparse.Namespace, script: str) -> None:
+    """Zapisuje trace, metryki i profil (jeśli tracer był włączony)"""
+    if not TRACER.enabled:
+        return
+    try:
+        TRACER.export_chrome_trace(args.trace_file)
+        TRACER.export_prometheus(args.metrics_file, script)
+        if args.profile_phase:
+            TRACER.export_profile(f"{args.profile_phase}.pstats")
+    except OSError as e:
+        logger.error(f"Nie udało się zapisać wyników instrumentacji: {e}")
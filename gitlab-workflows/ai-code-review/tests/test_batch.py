@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Tests for the Message Batches mode of claude_review.py
+Maps batch results back to work units through an in-process stand-in for the batches API, and runs
+CodeReviewer against a synthetic repository and the fake Anthropic API from benchmarks/
+"""
+
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'scripts'))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'benchmarks'))
+
+from anthropic import Anthropic
+
+from claude_review import CodeReviewer, ReviewJournal, parse_diff_stream
+from fake_anthropic import FakeAnthropicServer
+from synthetic_repo import create_synthetic_repo
+
+PACKED_PATH_RE = re.compile(r'^### Plik: (\S+)', re.MULTILINE)
+
+
+def make_diff(path: str) -> str:
+    return (
+        f"diff --git a/{path} b/{path}\n"
+        f"--- a/{path}\n"
+        f"+++ b/{path}\n"
+        "@@ -1,1 +1,2 @@\n"
+        " x = 1\n"
+        "+y = 2\n"
+    )
+
+
+class FakeBatches:
+    """Zastępuje client.messages.batches: batch kończy się po polls odpytaniach"""
+
+    def __init__(self, polls: int = 1):
+        self.polls = polls
+        self.created = []
+        self.cancelled = []
+        self._polls_left = {}
+
+    def _status(self, batch_id: str) -> SimpleNamespace:
+        ended = self._polls_left[batch_id] <= 0
+        count = len(self.created[int(batch_id.split('_')[1])])
+        return SimpleNamespace(
+            id=batch_id,
+            processing_status='ended' if ended else 'in_progress',
+            request_counts=SimpleNamespace(processing=0 if ended else count, succeeded=count if ended else 0, errored=0)
+        )
+
+    def create(self, requests):
+        batch_id = f"msgbatch_{len(self.created)}"
+        self.created.append(requests)
+        self._polls_left[batch_id] = self.polls
+        return self._status(batch_id)
+
+    def retrieve(self, batch_id):
+        self._polls_left[batch_id] -= 1
+        return self._status(batch_id)
+
+    def cancel(self, batch_id):
+        self.cancelled.append(batch_id)
+        self._polls_left[batch_id] = 0
+
+    def results(self, batch_id):
+        for request in self.created[int(batch_id.split('_')[1])]:
+            content = request['params']['messages'][0]['content']
+            if isinstance(content, list):
+                content = ''.join(block.get('text', '') for block in content)
+            packed_paths = PACKED_PATH_RE.findall(content)
+            comment = {"line_number": 2, "severity": "minor", "category": "style", "message": request['custom_id']}
+            if packed_paths:
+                text = json.dumps({path: [comment] for path in packed_paths})
+            else:
+                text = json.dumps([comment])
+            message = SimpleNamespace(
+                content=[SimpleNamespace(text=text)],
+                stop_reason='end_turn',
+                model=request['params']['model'],
+                usage=SimpleNamespace(input_tokens=10, output_tokens=5)
+            )
+            yield SimpleNamespace(custom_id=request['custom_id'], result=SimpleNamespace(type='succeeded', message=message))
+
+
+class BatchUnitsTest(unittest.TestCase):
+    """Wyniki batcha trafiają do jednostek pracy, z których powstały zapytania"""
+
+    def setUp(self):
+        self.reviewer = CodeReviewer(api_key='test', batch=True)
+        self.reviewer.BATCH_POLL_INITIAL_DELAY = 0
+        self.batches = FakeBatches()
+        self.reviewer.client = SimpleNamespace(messages=SimpleNamespace(batches=self.batches))
+
+    def file_unit(self, path: str):
+        file_diff = next(parse_diff_stream(make_diff(path).splitlines(keepends=True)))
+        return 'file', (path, file_diff, 1, 1)
+
+    def pack_unit(self, *paths: str):
+        return 'pack', ([next(parse_diff_stream(make_diff(path).splitlines(keepends=True))) for path in paths],)
+
+    def test_results_are_mapped_by_custom_id(self):
+        units = [self.file_unit('a.py'), self.pack_unit('b.py', 'c.py'), self.file_unit('d.py')]
+
+        results = self.reviewer._review_units_batch(units)
+
+        self.assertEqual(len(self.batches.created), 1)
+        self.assertEqual([[c.file_path for c in unit] for unit in results], [['a.py'], ['b.py', 'c.py'], ['d.py']])
+        self.assertEqual([c.message for c in results[1]], ['unit-1', 'unit-1'])
+        self.assertEqual(self.reviewer.batch_ids, ['msgbatch_0'])
+
+    def test_requests_are_split_into_batches(self):
+        self.reviewer.BATCH_MAX_REQUESTS = 2
+        units = [self.file_unit(f'f{index}.py') for index in range(5)]
+
+        results = self.reviewer._review_units_batch(units)
+
+        self.assertEqual([len(requests) for requests in self.batches.created], [2, 2, 1])
+        self.assertEqual([c.message for unit in results for c in unit], [f'unit-{index}' for index in range(5)])
+
+    def test_batch_past_timeout_is_cancelled(self):
+        self.batches.polls = 100
+        self.reviewer.batch_timeout = 0
+
+        results = self.reviewer._review_units_batch([self.file_unit('a.py')])
+
+        self.assertEqual(self.batches.cancelled, ['msgbatch_0'])
+        self.assertEqual(len(results[0]), 1)
+
+
+
+class BatchReviewTest(unittest.TestCase):
+    """Wyniki batcha inne niż "succeeded" nie mogą wyglądać jak review bez uwag"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp(prefix='claude-review-batch-')
+        cls.repo_path = os.path.join(cls.work_dir, 'repo')
+        cls.base_sha, changed = create_synthetic_repo(cls.repo_path, file_count=6)
+        cls.paths = sorted(changed)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir, ignore_errors=True)
+
+    def review(self, batch_results=None, **options) -> CodeReviewer:
+        """Przeprowadza review w trybie batch na świeżym serwerze z podanymi wynikami zapytań"""
+        server = FakeAnthropicServer(latency_s=0, batch_processing_s=0.2, batch_results=batch_results).start()
+        self.addCleanup(server.stop)
+
+        client = Anthropic(api_key='test', base_url=server.base_url, max_retries=0)
+        reviewer = CodeReviewer(client=client, repo_path=self.repo_path, batch=True, **options)
+        reviewer.BATCH_POLL_INITIAL_DELAY = 0.05
+        reviewer.review_all_changes(self.base_sha)
+        return reviewer
+
+    def commented_files(self, reviewer: CodeReviewer):
+        return {comment.file_path for comment in reviewer.comments}
+
+    def test_succeeded_results_are_reviewed(self):
+        reviewer = self.review()
+
+        self.assertTrue(reviewer.complete)
+        self.assertEqual(reviewer.unreviewed_files, [])
+        self.assertEqual(self.commented_files(reviewer), set(self.paths))
+        self.assertEqual(len(reviewer.batch_ids), 1)
+
+    def test_failed_results_are_unreviewed(self):
+        failed_path = self.paths[0]
+        for result_type in ('errored', 'expired', 'canceled', 'missing'):
+            with self.subTest(result_type=result_type):
+                reviewer = self.review({failed_path: result_type})
+
+                self.assertFalse(reviewer.complete)
+                self.assertEqual(reviewer.unreviewed_files, [failed_path])
+                self.assertEqual(self.commented_files(reviewer), set(self.paths) - {failed_path})
+
+    def test_failed_pack_marks_all_packed_files(self):
+        reviewer = self.review({self.paths[0]: 'errored'}, pack_tokens=100_000, pack_file_tokens=100_000)
+
+        self.assertFalse(reviewer.complete)
+        self.assertEqual(sorted(reviewer.unreviewed_files), self.paths)
+        self.assertEqual(reviewer.comments, [])
+
+    def test_failed_results_are_not_journaled(self):
+        failed_path = self.paths[0]
+        journal = ReviewJournal(os.path.join(self.work_dir, 'journal.jsonl'))
+        self.addCleanup(journal.close)
+
+        reviewer = self.review({failed_path: 'expired'}, journal=journal)
+
+        self.assertEqual(journal.recorded, len(self.paths) - 1)
+        self.assertEqual(reviewer.unreviewed_files, [failed_path])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Tests for token-budgeted chunking of oversized file diffs in claude_review.py
+Checks that split hunks keep the original line numbers and that FileDiff.map_old_line
+maps old-version lines across added, removed and ignored hunks
+"""
+
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'scripts'))
+
+from claude_review import DiffHunk, FileDiff, estimate_tokens, parse_diff_stream, split_file_diff, _split_hunk
+
+
+def parse_diff(text: str) -> FileDiff:
+    return next(parse_diff_stream(text.splitlines(keepends=True)))
+
+
+def hunk_line_numbers(hunk: DiffHunk):
+    """Zwraca (stara, nowa) linię dla każdej linii hunka, licząc od nagłówka"""
+    old_line, new_line = hunk.old_start, hunk.new_start
+    numbers = []
+    for line in hunk.lines:
+        numbers.append((line, old_line, new_line))
+        if line.startswith('+'):
+            new_line += 1
+        elif line.startswith('-'):
+            old_line += 1
+        else:
+            old_line += 1
+            new_line += 1
+    return numbers
+
+
+class SplitHunkTest(unittest.TestCase):
+    """Części hunka mają przeliczone nagłówki @@ zgodne z oryginalnymi numerami linii"""
+
+    def setUp(self):
+        lines = []
+        for index in range(40):
+            lines.append(f" context_{index} = {index}")
+            lines.append(f"-removed_{index} = {index}")
+            lines.append(f"+added_{index} = {index}")
+        self.hunk = DiffHunk('@@ -10,80 +20,80 @@', 10, 80, 20, 80, lines)
+
+    def test_pieces_fit_budget_and_keep_lines(self):
+        pieces = _split_hunk(self.hunk, max_tokens=50)
+
+        self.assertGreater(len(pieces), 1)
+        self.assertEqual([line for piece in pieces for line in piece.lines], self.hunk.lines)
+        for piece in pieces:
+            self.assertLessEqual(sum(estimate_tokens(line + "\n") for line in piece.lines), 50)
+
+    def test_pieces_keep_original_line_numbers(self):
+        pieces = _split_hunk(self.hunk, max_tokens=50)
+
+        expected = hunk_line_numbers(self.hunk)
+        actual = [numbers for piece in pieces for numbers in hunk_line_numbers(piece)]
+        self.assertEqual(actual, expected)
+        for piece in pieces:
+            self.assertEqual(piece.header, f"@@ -{piece.old_start},{piece.old_count} "
+                                           f"+{piece.new_start},{piece.new_count} @@")
+
+    def test_single_line_over_budget_is_own_piece(self):
+        hunk = DiffHunk('@@ -1,2 +1,2 @@', 1, 2, 1, 2, ['-' + 'x' * 400, '+' + 'y' * 400])
+
+        pieces = _split_hunk(hunk, max_tokens=10)
+
+        self.assertEqual([piece.lines for piece in pieces], [[hunk.lines[0]], [hunk.lines[1]]])
+
+
+class SplitFileDiffTest(unittest.TestCase):
+    """Diff pliku jest dzielony na granicach hunków, a zbyt duże hunki na mniejsze"""
+
+    def make_diff(self, hunk_count: int, hunk_lines: int) -> FileDiff:
+        parts = ["diff --git a/app.py b/app.py", "--- a/app.py", "+++ b/app.py"]
+        for hunk_index in range(hunk_count):
+            start = 1 + hunk_index * 100
+            parts.append(f"@@ -{start},{hunk_lines} +{start},{hunk_lines * 2} @@")
+            for index in range(hunk_lines):
+                parts.append(f" value_{hunk_index}_{index} = compute({index})")
+                parts.append(f"+value_{hunk_index}_{index}_checked = check({index})")
+        return parse_diff("\n".join(parts) + "\n")
+
+    def test_small_diff_is_not_split(self):
+        file_diff = self.make_diff(hunk_count=2, hunk_lines=3)
+
+        self.assertEqual(split_file_diff(file_diff, max_tokens=10_000), [file_diff])
+        self.assertEqual(split_file_diff(file_diff, max_tokens=0), [file_diff])
+
+    def test_chunks_follow_hunk_boundaries(self):
+        file_diff = self.make_diff(hunk_count=4, hunk_lines=5)
+        hunk_tokens = estimate_tokens(file_diff.hunks[0].header + "\n" + "\n".join(file_diff.hunks[0].lines) + "\n")
+        header_tokens = estimate_tokens("\n".join(file_diff.header_lines) + "\n")
+
+        chunks = split_file_diff(file_diff, max_tokens=header_tokens + hunk_tokens + 1)
+
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual([chunk.hunks for chunk in chunks], [[hunk] for hunk in file_diff.hunks])
+        self.assertEqual([chunk.added for chunk in chunks], [5] * 4)
+        for chunk in chunks:
+            self.assertEqual(chunk.path, 'app.py')
+            self.assertTrue(chunk.text.startswith("diff --git a/app.py b/app.py\n"))
+
+    def test_oversized_hunk_is_split(self):
+        file_diff = self.make_diff(hunk_count=1, hunk_lines=60)
+
+        chunks = split_file_diff(file_diff, max_tokens=200)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(estimate_tokens(chunk.text), 200)
+        self.assertEqual([line for chunk in chunks for hunk in chunk.hunks for line in hunk.lines],
+                         file_diff.hunks[0].lines)
+        self.assertEqual(sum(chunk.added for chunk in chunks), file_diff.added)
+
+    def test_truncation_goes_to_last_chunk(self):
+        file_diff = self.make_diff(hunk_count=3, hunk_lines=10)
+        file_diff.truncated = True
+        file_diff.size_bytes = 12345
+
+        chunks = split_file_diff(file_diff, max_tokens=150)
+
+        self.assertEqual([chunk.truncated for chunk in chunks], [False] * (len(chunks) - 1) + [True])
+        self.assertEqual(chunks[-1].size_bytes, 12345)
+
+
+class MapOldLineTest(unittest.TestCase):
+    """Linie starej wersji są przeliczane na nową albo odrzucane, gdy zostały zmienione"""
+
+    def setUp(self):
+        self.file_diff = parse_diff(
+            "diff --git a/app.py b/app.py\n"
+            "--- a/app.py\n"
+            "+++ b/app.py\n"
+            "@@ -3,3 +3,4 @@\n"
+            " line3\n"
+            "+inserted\n"
+            " line4\n"
+            " line5\n"
+            "@@ -20,3 +21,2 @@\n"
+            " line20\n"
+            "-line21\n"
+            " line22\n"
+        )
+
+    def test_lines_before_first_hunk_are_unchanged(self):
+        self.assertEqual(self.file_diff.map_old_line(1), 1)
+        self.assertEqual(self.file_diff.map_old_line(2), 2)
+
+    def test_lines_inside_hunks(self):
+        self.assertEqual(self.file_diff.map_old_line(3), 3)
+        self.assertEqual(self.file_diff.map_old_line(4), 5)
+        self.assertEqual(self.file_diff.map_old_line(20), 21)
+        self.assertEqual(self.file_diff.map_old_line(22), 22)
+
+    def test_removed_line_has_no_new_line(self):
+        self.assertIsNone(self.file_diff.map_old_line(21))
+
+    def test_lines_between_and_after_hunks_are_shifted(self):
+        self.assertEqual(self.file_diff.map_old_line(10), 11)
+        self.assertEqual(self.file_diff.map_old_line(30), 30)
+
+    def test_pure_insertion_hunk(self):
+        file_diff = parse_diff(
+            "diff --git a/app.py b/app.py\n"
+            "--- a/app.py\n"
+            "+++ b/app.py\n"
+            "@@ -5,0 +6,2 @@\n"
+            "+new1\n"
+            "+new2\n"
+        )
+
+        self.assertEqual(file_diff.map_old_line(5), 5)
+        self.assertEqual(file_diff.map_old_line(6), 8)
+
+    def test_ignored_hunks_shift_lines(self):
+        ignored = self.file_diff.hunks.pop(0)
+        self.file_diff.ignored_hunks.append(ignored)
+
+        self.assertEqual(self.file_diff.map_old_line(10), 11)
+        self.assertEqual(self.file_diff.map_old_line(30), 30)
+
+    def test_truncated_diff_has_no_lines_after_last_hunk(self):
+        self.file_diff.truncated = True
+
+        self.assertEqual(self.file_diff.map_old_line(10), 11)
+        self.assertIsNone(self.file_diff.map_old_line(30))
+
+
+if __name__ == '__main__':
+    unittest.main()
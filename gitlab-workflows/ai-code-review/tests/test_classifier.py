@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Tests for the file classification engine of claude_review.py
+Covers gitignore-style globs, .gitattributes, numstat and generated-code detection, both
+on FileClassifier directly and through CodeReviewer.get_diff on a temporary git repository
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'scripts'))
+
+from claude_review import CodeReviewer, FileClassifier, parse_diff_stream
+
+
+def git(repo_path: str, *args: str) -> str:
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=repo_path, check=True, stdout=subprocess.PIPE, text=True
+    ).stdout.strip()
+
+
+def write(repo_path: str, path: str, content) -> None:
+    full_path = os.path.join(repo_path, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    mode = 'wb' if isinstance(content, bytes) else 'w'
+    with open(full_path, mode) as f:
+        f.write(content)
+
+
+class FileClassifierTest(unittest.TestCase):
+    """Powód pominięcia pliku wynika ze ścieżki, atrybutów i statystyk numstat"""
+
+    def test_glob_patterns(self):
+        classifier = FileClassifier(exclude_patterns=['*.min.js', 'vendor/', '/docs/*.md', 'gen/**/*.pb.go'])
+        cases = {
+            'app.min.js': 'excluded',
+            'static/js/app.min.js': 'excluded',
+            'vendor/lib.py': 'excluded',
+            'src/vendor/lib.py': 'excluded',
+            'docs/intro.md': 'excluded',
+            'src/docs/intro.md': None,
+            'docs/guide/intro.md': None,
+            'gen/api.pb.go': 'excluded',
+            'gen/v1/deep/api.pb.go': 'excluded',
+            'app.js': None,
+            'vendor.py': None,
+        }
+        for path, reason in cases.items():
+            with self.subTest(path=path):
+                self.assertEqual(classifier.classify_path(path), reason)
+
+    def test_include_patterns_limit_review(self):
+        classifier = FileClassifier(exclude_patterns=['*_test.py'], include_patterns=['src/'])
+
+        self.assertIsNone(classifier.classify_path('src/app.py'))
+        self.assertEqual(classifier.classify_path('tests/app.py'), 'not_included')
+        self.assertEqual(classifier.classify_path('src/app_test.py'), 'excluded')
+
+    def test_attributes(self):
+        classifier = FileClassifier(exclude_patterns=())
+
+        self.assertEqual(classifier.classify('a.py', attributes={'linguist-generated': 'true'}), 'generated')
+        self.assertEqual(classifier.classify('a.py', attributes={'linguist-vendored': 'set'}), 'vendored')
+        self.assertEqual(classifier.classify('a.py', attributes={'diff': 'unset'}), 'no_diff')
+        self.assertIsNone(classifier.classify('a.py', attributes={'linguist-generated': 'false'}))
+
+    def test_numstat(self):
+        classifier = FileClassifier(exclude_patterns=(), max_changed_lines=100)
+
+        self.assertEqual(classifier.classify('a.bin', numstat=(0, 0, True)), 'binary')
+        self.assertEqual(classifier.classify('a.py', numstat=(80, 21, False)), 'oversized')
+        self.assertIsNone(classifier.classify('a.py', numstat=(80, 20, False)))
+        self.assertIsNone(FileClassifier(exclude_patterns=(), max_changed_lines=0).classify('a.py', (10**6, 0, False)))
+
+    def test_generated_header(self):
+        classifier = FileClassifier()
+
+        def diff(start: int, first_line: str):
+            text = (f"diff --git a/x.go b/x.go\n--- a/x.go\n+++ b/x.go\n"
+                    f"@@ -{start},1 +{start},2 @@\n{first_line}\n+package x\n")
+            return next(parse_diff_stream(text.splitlines(keepends=True)))
+
+        self.assertTrue(classifier.detect_generated(diff(1, "+// Code generated by protoc. DO NOT EDIT.")))
+        self.assertTrue(classifier.detect_generated(diff(1, " // @generated")))
+        self.assertFalse(classifier.detect_generated(diff(1, "-// Code generated by protoc. DO NOT EDIT.")))
+        self.assertFalse(classifier.detect_generated(diff(40, "+// @generated")))
+
+    def test_report(self):
+        classifier = FileClassifier()
+        classifier.record_skip('a.min.js', 'excluded', 400)
+        classifier.record_skip('b.min.js', 'excluded', 1)
+        classifier.record_skip('c.bin', 'binary', 0)
+
+        report = classifier.report()
+
+        self.assertEqual(report['count'], 3)
+        self.assertEqual(report['by_reason'], {'excluded': 2, 'binary': 1})
+        self.assertEqual(report['estimated_tokens_saved'], 101)
+
+
+class GetDiffClassificationTest(unittest.TestCase):
+    """get_diff pomija pliki na podstawie .gitattributes i numstat, zanim wczyta ich diff"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.repo_path = tempfile.mkdtemp(prefix='claude-review-classifier-')
+        git(cls.repo_path, 'init', '-q')
+        write(cls.repo_path, 'README.md', 'test\n')
+        git(cls.repo_path, 'add', '-A')
+        git(cls.repo_path, 'commit', '-q', '-m', 'base')
+        cls.base_sha = git(cls.repo_path, 'rev-parse', 'HEAD')
+
+        write(cls.repo_path, '.gitattributes',
+              'api/schema.py linguist-generated\nthird_party/** linguist-vendored\n*.dat -diff\n')
+        write(cls.repo_path, 'src/app.py', 'def run():\n    return 1\n')
+        write(cls.repo_path, 'api/schema.py', 'SCHEMA = {}\n')
+        write(cls.repo_path, 'third_party/lib/util.py', 'def util():\n    pass\n')
+        write(cls.repo_path, 'data/table.dat', 'a,b\n1,2\n')
+        write(cls.repo_path, 'assets/logo.bin', bytes(range(256)) * 4)
+        write(cls.repo_path, 'src/big.py', ''.join(f'VALUE_{index} = {index}\n' for index in range(300)))
+        write(cls.repo_path, 'src/models_pb2.py', '# @generated by protoc\nclass Model:\n    pass\n')
+        write(cls.repo_path, 'web/app.min.js', 'var a=1;\n')
+        git(cls.repo_path, 'add', '-A')
+        git(cls.repo_path, 'commit', '-q', '-m', 'changes')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.repo_path, ignore_errors=True)
+
+    def test_skip_reasons(self):
+        reviewer = CodeReviewer(api_key='test', repo_path=self.repo_path,
+                                classifier=FileClassifier(max_changed_lines=200))
+
+        diffs = reviewer.get_diff(self.base_sha)
+
+        self.assertEqual(sorted(diffs), ['.gitattributes', 'src/app.py'])
+        skipped = {path: entry['reason'] for path, entry in reviewer.classifier.skipped.items()}
+        self.assertEqual(skipped, {
+            'api/schema.py': 'generated',
+            'third_party/lib/util.py': 'vendored',
+            'data/table.dat': 'no_diff',
+            'assets/logo.bin': 'binary',
+            'src/big.py': 'oversized',
+            'src/models_pb2.py': 'generated',
+            'web/app.min.js': 'excluded',
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
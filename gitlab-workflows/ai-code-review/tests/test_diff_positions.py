@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for the MR diff position index in post_comments.py
+Looks up inline comment positions through DiffPositionIndex and FileDiffPositions,
+including snapping lines outside the diff to the nearest commentable line
+"""
+
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'scripts'))
+
+from post_comments import DiffPositionIndex, FileDiffPositions
+
+DIFF = (
+    "@@ -3,4 +3,5 @@ def run():\n"
+    " context3\n"
+    "-removed4\n"
+    "+added4\n"
+    "+added5\n"
+    " context5\n"
+    " context6\n"
+    "@@ -20,2 +21,3 @@\n"
+    " context21\n"
+    "+added22\n"
+    " context23\n"
+    "\\ No newline at end of file\n"
+)
+
+
+class FileDiffPositionsTest(unittest.TestCase):
+    """Pozycje linii są wyszukiwane w przedziałach linii nowej i starej wersji"""
+
+    def setUp(self):
+        self.positions = FileDiffPositions({'diff': DIFF})
+
+    def test_ranges(self):
+        self.assertEqual(self.positions.new_ranges, [(3, 7), (21, 23)])
+        self.assertEqual(self.positions.old_ranges, [(4, 4)])
+
+    def test_new_lines(self):
+        for line in (3, 4, 5, 7, 21, 22, 23):
+            with self.subTest(line=line):
+                self.assertEqual(self.positions.position(line), {'type': 'new', 'line': line})
+
+    def test_removed_line_outside_new_ranges(self):
+        positions = FileDiffPositions({'diff': "@@ -10,2 +10,0 @@\n-a\n-b\n"})
+
+        self.assertEqual(positions.position(11), {'type': 'old', 'line': 11})
+        self.assertEqual(positions.new_ranges, [])
+
+    def test_lines_outside_diff(self):
+        for line in (0, -1, 1, 2, 8, 15, 20, 24, 100):
+            with self.subTest(line=line):
+                self.assertIsNone(self.positions.position(line))
+
+    def test_snap_to_nearest_line(self):
+        cases = {
+            1: 3,
+            9: 7,
+            19: 21,
+            26: 23,
+        }
+        for line, nearest in cases.items():
+            with self.subTest(line=line):
+                self.assertEqual(self.positions.position(line, snap_lines=3),
+                                 {'type': 'new', 'line': nearest, 'snapped_from': line})
+
+    def test_snap_prefers_closer_range(self):
+        self.assertEqual(self.positions.position(13, snap_lines=10)['line'], 7)
+        self.assertEqual(self.positions.position(15, snap_lines=10)['line'], 21)
+
+    def test_snap_limit(self):
+        self.assertIsNone(self.positions.position(14, snap_lines=3))
+        self.assertIsNone(self.positions.position(30, snap_lines=3))
+        self.assertIsNone(self.positions.position(8, snap_lines=0))
+
+    def test_empty_diff(self):
+        positions = FileDiffPositions({'diff': ''})
+
+        self.assertIsNone(positions.position(1, snap_lines=100))
+
+
+class DiffPositionIndexTest(unittest.TestCase):
+    """Plik jest odnajdywany po nowej i starej ścieżce, a przy powtórzeniu wygrywa pierwszy diff"""
+
+    def test_find_by_new_and_old_path(self):
+        index = DiffPositionIndex([
+            {'new_path': 'src/new.py', 'old_path': 'src/old.py', 'diff': DIFF},
+            {'new_path': 'README.md', 'old_path': 'README.md', 'diff': "@@ -1 +1 @@\n-a\n+b\n"},
+        ])
+
+        self.assertIs(index.find('src/new.py'), index.find('src/old.py'))
+        self.assertEqual(index.find('src/old.py').position(22), {'type': 'new', 'line': 22})
+        self.assertEqual(index.find('README.md').position(1), {'type': 'new', 'line': 1})
+        self.assertIsNone(index.find('missing.py'))
+
+    def test_first_diff_wins(self):
+        first = {'new_path': 'a.py', 'old_path': 'a.py', 'diff': "@@ -1 +1 @@\n-a\n+b\n"}
+        second = {'new_path': 'a.py', 'old_path': 'a.py', 'diff': DIFF}
+
+        index = DiffPositionIndex([first, second])
+
+        self.assertIs(index.find('a.py').diff, first)
+
+
+if __name__ == '__main__':
+    unittest.main()
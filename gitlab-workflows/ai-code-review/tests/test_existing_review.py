@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Tests for idempotent re-posting in post_comments.py
+Builds ExistingReview from MR discussions carrying the hidden markers and checks
+finding fingerprints, claiming findings and selecting stale discussions to resolve
+"""
+
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'scripts'))
+
+from post_comments import (
+    FINDING_MARKER, REVIEWED_SHA_MARKER, SUMMARY_MARKER, ExistingReview, comment_fingerprint, comment_fingerprints
+)
+
+BOT_ID = 7
+
+
+def make_comment(message: str = "Brak obsługi None", line_number: int = 10, **fields):
+    return {"file_path": "src/app.py", "line_number": line_number, "severity": "major",
+            "category": "bug", "message": message, **fields}
+
+
+def discussion(discussion_id: str, body: str, author_id: int = BOT_ID, **note):
+    return {"id": discussion_id, "notes": [{"id": len(discussion_id), "body": body, "author": {"id": author_id},
+                                           "resolvable": True, "resolved": False, **note}]}
+
+
+def finding_body(comment) -> str:
+    return f"**{comment['message']}**\n\n" + FINDING_MARKER.format(fingerprint=comment_fingerprint(comment))
+
+
+class CommentFingerprintTest(unittest.TestCase):
+    """Odcisk uwagi nie zależy od numeru linii ani formatowania treści"""
+
+    def test_shifted_finding_keeps_fingerprint(self):
+        self.assertEqual(comment_fingerprint(make_comment(line_number=10)),
+                         comment_fingerprint(make_comment(line_number=42)))
+
+    def test_message_is_normalized(self):
+        self.assertEqual(comment_fingerprint(make_comment("Brak obsługi None")),
+                         comment_fingerprint(make_comment("  brak  obsługi\nNONE ")))
+
+    def test_path_category_and_message_distinguish_findings(self):
+        base = comment_fingerprint(make_comment())
+
+        self.assertNotEqual(base, comment_fingerprint(make_comment(file_path="src/other.py")))
+        self.assertNotEqual(base, comment_fingerprint(make_comment(category="security")))
+        self.assertNotEqual(base, comment_fingerprint(make_comment("Inna uwaga")))
+
+    def test_repeated_findings_are_numbered(self):
+        comments = [make_comment(line_number=3), make_comment("Inna uwaga"), make_comment(line_number=30)]
+
+        fingerprints = list(comment_fingerprints(comments))
+
+        self.assertEqual(fingerprints[0], comment_fingerprint(comments[0]))
+        self.assertEqual(fingerprints[2], comment_fingerprint(comments[2], occurrence=1))
+        self.assertEqual(len(set(fingerprints)), 3)
+
+
+class ExistingReviewTest(unittest.TestCase):
+    """Notatki review są rozpoznawane po znacznikach i autorze"""
+
+    def setUp(self):
+        self.kept = make_comment("Uwaga bez zmian")
+        self.gone = make_comment("Uwaga już nieaktualna")
+        self.discussions = [
+            discussion("d1", "Podsumowanie\n" + SUMMARY_MARKER + REVIEWED_SHA_MARKER.format(sha="a" * 40)),
+            discussion("d2", finding_body(self.kept)),
+            discussion("d3", finding_body(self.gone), resolved=True),
+            discussion("d4", finding_body(make_comment("Uwaga człowieka")), author_id=99),
+            discussion("d5", "Zmieniono opis\n" + SUMMARY_MARKER, system=True),
+            {"id": "d6", "notes": []},
+            discussion("d77", "Nowsze podsumowanie\n" + REVIEWED_SHA_MARKER.format(sha="b" * 40)),
+        ]
+        self.existing = ExistingReview(self.discussions, author_id=BOT_ID)
+
+    def test_summary_and_reviewed_sha(self):
+        self.assertEqual(self.existing.summary_note_id, len("d77"))
+        self.assertEqual(self.existing.reviewed_sha, "b" * 40)
+
+    def test_findings_of_author(self):
+        self.assertEqual(self.existing.findings, {
+            comment_fingerprint(self.kept): {"discussion_id": "d2", "resolvable": True, "resolved": False},
+            comment_fingerprint(self.gone): {"discussion_id": "d3", "resolvable": True, "resolved": True},
+        })
+
+    def test_unknown_author_matches_all_notes(self):
+        existing = ExistingReview(self.discussions)
+
+        self.assertEqual(len(existing.findings), 3)
+
+    def test_claim(self):
+        new = make_comment("Nowa uwaga")
+
+        first, previous = self.existing.claim(self.existing.fingerprint(self.kept))
+        self.assertTrue(first)
+        self.assertEqual(previous["discussion_id"], "d2")
+
+        self.assertEqual(self.existing.claim(self.existing.fingerprint(new)), (True, None))
+        self.assertEqual(self.existing.claim(comment_fingerprint(new)), (False, None))
+        self.assertEqual(self.existing.skipped, 2)
+
+    def test_fingerprint_numbers_repeated_findings(self):
+        first = self.existing.fingerprint(self.kept)
+        second = self.existing.fingerprint(dict(self.kept, line_number=99))
+
+        self.assertEqual(first, comment_fingerprint(self.kept))
+        self.assertEqual(second, comment_fingerprint(self.kept, occurrence=1))
+
+    def test_stale_discussions(self):
+        self.existing.claim(self.existing.fingerprint(dict(self.kept, line_number=55)))
+
+        self.assertEqual([finding["discussion_id"] for finding in self.existing.stale()], ["d3"])
+
+    def test_mark_seen(self):
+        self.existing.mark_seen(comment_fingerprints([self.kept, self.gone]))
+
+        self.assertEqual(self.existing.stale(), [])
+        self.assertEqual(self.existing.skipped, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Tests for diff minimization in claude_review.py
+Checks which change groups _is_whitespace_only treats as whitespace-only and how
+normalize_file_diff drops them while keeping hunk headers and map_old_line consistent
+"""
+
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'scripts'))
+
+from claude_review import FileDiff, normalize_file_diff, parse_diff_stream, _is_whitespace_only
+
+
+def parse_diff(path: str, hunk_header: str, lines) -> FileDiff:
+    text = f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n{hunk_header}\n" + "".join(
+        line + "\n" for line in lines
+    )
+    return next(parse_diff_stream(text.splitlines(keepends=True)))
+
+
+def new_lines(file_diff: FileDiff):
+    """Zwraca {numer linii nowej wersji: treść} dla linii pozostałych w hunkach"""
+    lines = {}
+    for hunk in file_diff.hunks:
+        new_line = hunk.new_start
+        for line in hunk.lines:
+            if line.startswith('-'):
+                continue
+            lines[new_line] = line[1:]
+            new_line += 1
+    return lines
+
+
+class WhitespaceOnlyTest(unittest.TestCase):
+    """Grupa zmian jest pomijana tylko wtedy, gdy różni się wyłącznie białymi znakami"""
+
+    def test_whitespace_changes(self):
+        cases = {
+            'reindent': (['-    x = 1', '+        x = 1'], True),
+            'inner spaces': (['-x  =   1', '+x = 1'], True),
+            'trailing spaces': (['-x = 1   ', '+x = 1'], True),
+            'blank lines': (['+', '+   '], True),
+            'line split differently': (['-a = 1', '-', '+a = 1'], True),
+            'changed value': (['-x = 1', '+x = 2'], False),
+            'tokens glued': (['-not x', '+notx'], False),
+            'reordered lines': (['-a = 1', '-b = 2', '+b = 2', '+a = 1'], False),
+            'added line': (['-a = 1', '+a = 1', '+b = 2'], False),
+        }
+        for name, (lines, expected) in cases.items():
+            with self.subTest(name):
+                self.assertEqual(_is_whitespace_only(lines), expected)
+
+
+class NormalizeFileDiffTest(unittest.TestCase):
+    """Pominięte grupy trafiają do ignored_hunks, a wokół pozostałych zostaje ograniczony kontekst"""
+
+    def setUp(self):
+        lines = [f" line{index}" for index in range(1, 4)]
+        lines += ["-def run(a, b):", "+def run(a,  b):   "]
+        lines += [f" line{index}" for index in range(5, 13)]
+        lines += ["-    return a+b", "+    return a - b"]
+        lines += [f" line{index}" for index in range(14, 17)]
+        self.file_diff = parse_diff('app.py', '@@ -1,15 +1,15 @@', lines)
+        self.original_lines = new_lines(self.file_diff)
+
+    def test_disabled_normalization_keeps_diff(self):
+        hunks = list(self.file_diff.hunks)
+
+        stats = normalize_file_diff(self.file_diff)
+
+        self.assertEqual(self.file_diff.hunks, hunks)
+        self.assertEqual(stats['lines'], 0)
+
+    def test_whitespace_group_is_dropped(self):
+        stats = normalize_file_diff(self.file_diff, context_lines=2, ignore_whitespace=True)
+
+        self.assertEqual(len(self.file_diff.hunks), 1)
+        hunk = self.file_diff.hunks[0]
+        self.assertEqual(hunk.lines, [" line11", " line12", "-    return a+b", "+    return a - b",
+                                      " line14", " line15"])
+        self.assertEqual(hunk.header, "@@ -11,5 +11,5 @@")
+        self.assertEqual(stats['whitespace_lines'], 2)
+        self.assertEqual(stats['lines'], 18 - 6)
+        self.assertEqual(stats['context_lines'], stats['lines'] - 2)
+
+    def test_remaining_lines_keep_their_numbers(self):
+        normalize_file_diff(self.file_diff, context_lines=1, ignore_whitespace=True)
+
+        for line_number, content in new_lines(self.file_diff).items():
+            self.assertEqual(self.original_lines[line_number], content)
+
+    def test_ignored_hunks_keep_map_old_line(self):
+        normalize_file_diff(self.file_diff, context_lines=1, ignore_whitespace=True)
+
+        self.assertEqual(len(self.file_diff.ignored_hunks), 1)
+        self.assertIsNone(self.file_diff.map_old_line(4))
+        self.assertIsNone(self.file_diff.map_old_line(13))
+        self.assertEqual(self.file_diff.map_old_line(8), 8)
+        self.assertEqual(self.file_diff.map_old_line(20), 20)
+
+    def test_comment_only_group_is_dropped(self):
+        file_diff = parse_diff('app.py', '@@ -1,4 +1,5 @@', [
+            " import os",
+            "-# stary komentarz",
+            "+# nowy komentarz",
+            "+# druga linia",
+            " x = 1",
+            "-y = 2",
+            "+y = 3",
+        ])
+
+        stats = normalize_file_diff(file_diff, context_lines=0, ignore_comments=True)
+
+        self.assertEqual([hunk.lines for hunk in file_diff.hunks], [["-y = 2", "+y = 3"]])
+        self.assertEqual(file_diff.hunks[0].header, "@@ -4,1 +5,1 @@")
+        self.assertEqual(stats['comment_lines'], 3)
+
+    def test_comments_in_unknown_language_are_kept(self):
+        file_diff = parse_diff('notes.txt', '@@ -1,1 +1,1 @@', ["-# a", "+# b"])
+
+        stats = normalize_file_diff(file_diff, ignore_comments=True)
+
+        self.assertEqual(len(file_diff.hunks), 1)
+        self.assertEqual(stats['lines'], 0)
+
+    def test_whitespace_only_file_has_no_hunks(self):
+        file_diff = parse_diff('app.py', '@@ -1,2 +1,2 @@', ["-x=1 ", "+x=1", " y = 2"])
+
+        normalize_file_diff(file_diff, ignore_whitespace=True)
+
+        self.assertEqual(file_diff.hunks, [])
+        self.assertEqual(file_diff.map_old_line(2), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
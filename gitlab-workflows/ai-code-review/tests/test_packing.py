@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Tests for packing small file diffs into shared review requests in claude_review.py
+Covers the greedy packing in pack_small_diffs and the per-file fallback of
+CodeReviewer.analyze_packed when the packed response cannot be used
+"""
+
+import json
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'scripts'))
+
+from claude_review import CodeReviewer, FileDiff, ReviewComment, estimate_tokens, pack_small_diffs, parse_diff_stream
+
+
+def make_diff(path: str, added_lines: int = 1) -> FileDiff:
+    lines = [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}",
+             f"@@ -1,1 +1,{added_lines + 1} @@", " x = 1"]
+    lines.extend(f"+y_{index} = {index}" for index in range(added_lines))
+    return next(parse_diff_stream(line + "\n" for line in lines))
+
+
+def paths(file_diffs):
+    return [file_diff.path for file_diff in file_diffs]
+
+
+class PackSmallDiffsTest(unittest.TestCase):
+    """Małe pliki trafiają do paczek w budżecie tokenów, pogrupowane według katalogów"""
+
+    def test_files_are_packed_within_budget(self):
+        file_diffs = [make_diff(f"src/f{index}.py") for index in range(5)]
+        file_tokens = estimate_tokens(file_diffs[0].text)
+
+        packs, rest = pack_small_diffs(file_diffs, max_tokens=file_tokens * 2, max_file_tokens=file_tokens)
+
+        self.assertEqual([paths(pack) for pack in packs],
+                         [['src/f0.py', 'src/f1.py'], ['src/f2.py', 'src/f3.py']])
+        self.assertEqual(paths(rest), ['src/f4.py'])
+
+    def test_large_files_are_not_packed(self):
+        small = [make_diff('a.py'), make_diff('b.py')]
+        large = make_diff('big.py', added_lines=200)
+
+        packs, rest = pack_small_diffs(small + [large], max_tokens=10_000, max_file_tokens=100)
+
+        self.assertEqual([paths(pack) for pack in packs], [['a.py', 'b.py']])
+        self.assertEqual(paths(rest), ['big.py'])
+
+    def test_files_are_grouped_by_directory(self):
+        file_diffs = [make_diff(path) for path in ('a/x.py', 'b/y.py', 'a/z.py', 'b/w.py')]
+        file_tokens = estimate_tokens(file_diffs[0].text)
+
+        packs, rest = pack_small_diffs(file_diffs, max_tokens=file_tokens * 2, max_file_tokens=file_tokens)
+
+        self.assertEqual([paths(pack) for pack in packs], [['a/x.py', 'a/z.py'], ['b/w.py', 'b/y.py']])
+        self.assertEqual(rest, [])
+
+
+class AnalyzePackedTest(unittest.TestCase):
+    """Nieużyteczna odpowiedź dla paczki kończy się analizą plików pojedynczo"""
+
+    def setUp(self):
+        self.reviewer = CodeReviewer(api_key='test')
+        self.file_diffs = [make_diff('a.py'), make_diff('b.py'), make_diff('c.py')]
+        self.requests = []
+        self.individual = []
+        self.response = None
+
+        def create_message(files, **params):
+            self.requests.append(files)
+            if isinstance(self.response, Exception):
+                raise self.response
+            return self.response
+
+        def analyze_with_claude(file_path, diff):
+            self.individual.append(file_path)
+            return [ReviewComment(file_path, 1, 'minor', 'style', 'single')]
+
+        self.reviewer._create_message = create_message
+        self.reviewer.analyze_with_claude = analyze_with_claude
+
+    def respond(self, text: str, stop_reason: str = 'end_turn'):
+        self.response = SimpleNamespace(content=[SimpleNamespace(text=text)], stop_reason=stop_reason)
+
+    def test_packed_response_is_split_by_path(self):
+        comment = {"line_number": 2, "severity": "major", "category": "bug", "message": "packed"}
+        self.respond(json.dumps({"a.py": [comment], "c.py": [comment, comment], "unknown.py": [comment]}))
+
+        comments = self.reviewer.analyze_packed(self.file_diffs)
+
+        self.assertEqual(self.requests, [['a.py', 'b.py', 'c.py']])
+        self.assertEqual(self.individual, [])
+        self.assertEqual([c.file_path for c in comments], ['a.py', 'c.py', 'c.py'])
+        self.assertEqual({c.message for c in comments}, {'packed'})
+
+    def test_unusable_response_falls_back_to_single_files(self):
+        cases = {
+            'no json': lambda: self.respond("Nie znaleziono problemów."),
+            'invalid json': lambda: self.respond('{"a.py": [}'),
+            'not an object': lambda: self.respond('[{"line_number": 1}]'),
+            'max tokens': lambda: self.respond('{"a.py": []}', stop_reason='max_tokens'),
+            'api error': lambda: setattr(self, 'response', RuntimeError('overloaded')),
+        }
+        for name, prepare in cases.items():
+            with self.subTest(name):
+                self.individual.clear()
+                prepare()
+
+                comments = self.reviewer.analyze_packed(self.file_diffs)
+
+                self.assertEqual(self.individual, ['a.py', 'b.py', 'c.py'])
+                self.assertEqual([c.message for c in comments], ['single'] * 3)
+
+    def test_single_pending_file_is_not_packed(self):
+        comments = self.reviewer.analyze_packed(self.file_diffs[:1])
+
+        self.assertEqual(self.requests, [])
+        self.assertEqual(self.individual, ['a.py'])
+        self.assertEqual(len(comments), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Tests for GitLabRateLimiter in post_comments.py
+Covers the token bucket, pauses and the AIMD reaction to 429 responses and RateLimit-* headers
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'scripts'))
+
+from post_comments import MIN_GITLAB_RATE, RATE_RECOVERY_STEP, GitLabRateLimiter
+
+
+def response(status_code: int = 200, **headers) -> SimpleNamespace:
+    return SimpleNamespace(status_code=status_code, headers={name.replace('_', '-'): str(value)
+                                                            for name, value in headers.items()})
+
+
+class TokenBucketTest(unittest.TestCase):
+    """Zapytania ponad burst czekają na tokeny odnawiane w tempie rate"""
+
+    def test_burst_is_immediate(self):
+        limiter = GitLabRateLimiter(rate=1.0, burst=3)
+
+        started = time.monotonic()
+        for _ in range(3):
+            limiter.acquire()
+
+        self.assertLess(time.monotonic() - started, 0.1)
+
+    def test_requests_over_burst_wait_for_rate(self):
+        limiter = GitLabRateLimiter(rate=20.0, burst=1)
+
+        started = time.monotonic()
+        for _ in range(5):
+            limiter.acquire()
+
+        self.assertGreaterEqual(time.monotonic() - started, 4 / 20.0 - 0.02)
+
+    def test_threads_share_the_bucket(self):
+        limiter = GitLabRateLimiter(rate=50.0, burst=2)
+        threads = [threading.Thread(target=lambda: [limiter.acquire() for _ in range(3)]) for _ in range(4)]
+
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertGreaterEqual(time.monotonic() - started, (12 - 2) / 50.0 - 0.02)
+
+    def test_pause_blocks_all_requests(self):
+        limiter = GitLabRateLimiter(rate=1000.0, burst=10)
+
+        limiter.pause(0.2)
+        started = time.monotonic()
+        limiter.acquire()
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.18)
+
+
+class RateAdjustmentTest(unittest.TestCase):
+    """Tempo podąża za nagłówkami RateLimit-*, spada o połowę po 429 i wraca stopniowo"""
+
+    def test_rate_limit_header_sets_base_rate(self):
+        limiter = GitLabRateLimiter(rate=5.0)
+
+        limiter.update(response(RateLimit_Limit=600, RateLimit_Remaining=500))
+
+        self.assertEqual(limiter.base_rate, 10.0)
+        self.assertEqual(limiter.rate, 10.0)
+
+    def test_throttle_halves_rate_down_to_minimum(self):
+        limiter = GitLabRateLimiter(rate=1.0)
+
+        limiter.throttle()
+        self.assertEqual(limiter.rate, 0.5)
+        self.assertEqual(limiter.ceiling, 0.5)
+
+        for _ in range(10):
+            limiter.throttle()
+        self.assertEqual(limiter.rate, MIN_GITLAB_RATE)
+
+    def test_throttle_during_pause_is_ignored(self):
+        limiter = GitLabRateLimiter(rate=4.0)
+
+        limiter.throttle()
+        limiter.pause(10)
+        limiter.throttle()
+
+        self.assertEqual(limiter.rate, 2.0)
+
+    def test_successful_responses_recover_rate(self):
+        limiter = GitLabRateLimiter(rate=1.0)
+        limiter.throttle()
+
+        limiter.update(response(429))
+        self.assertEqual(limiter.rate, 0.5)
+
+        limiter.update(response(200))
+        self.assertAlmostEqual(limiter.rate, 0.5 + RATE_RECOVERY_STEP)
+
+        for _ in range(round(0.5 / RATE_RECOVERY_STEP)):
+            limiter.update(response(200))
+
+        self.assertIsNone(limiter.ceiling)
+        self.assertEqual(limiter.rate, 1.0)
+
+    def test_exhausted_limit_pauses_until_reset(self):
+        limiter = GitLabRateLimiter(rate=1000.0, burst=10)
+
+        limiter.update(response(RateLimit_Remaining=0, RateLimit_Reset=time.time() + 0.2))
+        started = time.monotonic()
+        limiter.acquire()
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+
+    def test_missing_or_invalid_headers_keep_rate(self):
+        limiter = GitLabRateLimiter(rate=3.0)
+
+        limiter.update(response())
+        limiter.update(response(RateLimit_Limit='abc', RateLimit_Remaining=0))
+
+        self.assertEqual(limiter.rate, 3.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
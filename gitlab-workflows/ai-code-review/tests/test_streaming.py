@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for incremental extraction of comments from a streamed response in claude_review.py
+Feeds IncrementalCommentParser the response text in arbitrary fragments, including
+responses cut off mid-object
+"""
+
+import json
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'scripts'))
+
+from claude_review import IncrementalCommentParser
+
+COMMENTS = [
+    {"line_number": 3, "severity": "major", "category": "bug", "message": "Brak obsługi {None}"},
+    {"line_number": 7, "severity": "minor", "category": "style", "message": "Cudzysłów \" i ukośnik \\ w treści",
+     "suggestion": "użyj f\"{x}\""},
+    {"line_number": 9, "severity": "info", "category": "best_practice", "message": "]} w treści nie kończy tablicy"},
+]
+
+
+def feed_all(text: str, fragment: int):
+    parser = IncrementalCommentParser()
+    items = []
+    for index in range(0, len(text), fragment):
+        items.extend(parser.feed(text[index:index + fragment]))
+    return parser, items
+
+
+class IncrementalCommentParserTest(unittest.TestCase):
+    """Komentarze są oddawane, gdy tylko zamknie się ich obiekt, niezależnie od podziału strumienia"""
+
+    def test_any_fragmentation_yields_all_comments(self):
+        text = "Oto uwagi:\n```json\n" + json.dumps(COMMENTS, ensure_ascii=False, indent=2) + "\n```\nKoniec."
+        for fragment in (1, 2, 7, 64, len(text)):
+            with self.subTest(fragment=fragment):
+                parser, items = feed_all(text, fragment)
+
+                self.assertEqual(items, COMMENTS)
+                self.assertTrue(parser.finished)
+
+    def test_comment_is_returned_when_its_object_closes(self):
+        parser = IncrementalCommentParser()
+        first = json.dumps(COMMENTS[0])
+
+        self.assertEqual(parser.feed('[' + first[:-1]), [])
+        self.assertEqual(parser.feed(first[-1] + ', {"line_number"'), [COMMENTS[0]])
+
+    def test_truncated_response_keeps_closed_comments(self):
+        text = json.dumps(COMMENTS)
+        cut = text.index(json.dumps(COMMENTS[2])) + 20
+
+        parser, items = feed_all(text[:cut], 16)
+
+        self.assertEqual(items, COMMENTS[:2])
+        self.assertFalse(parser.finished)
+
+    def test_nested_objects_are_part_of_comment(self):
+        comment = {"line_number": 1, "severity": "minor", "category": "style", "message": "x",
+                   "details": {"nested": {"depth": 2}}}
+
+        _, items = feed_all(json.dumps([comment]), 5)
+
+        self.assertEqual(items, [comment])
+
+    def test_text_before_array_and_after_end_is_ignored(self):
+        parser = IncrementalCommentParser()
+
+        self.assertEqual(parser.feed('Obiekt {"a": 1} przed tablicą '), [])
+        self.assertEqual(parser.feed('[]'), [])
+        self.assertEqual(parser.feed(' [{"line_number": 1}]'), [])
+        self.assertTrue(parser.finished)
+
+    def test_invalid_object_is_skipped(self):
+        _, items = feed_all('[{"line_number": 1,}, ' + json.dumps(COMMENTS[0]) + ']', 3)
+
+        self.assertEqual(items, [COMMENTS[0]])
+
+
+if __name__ == '__main__':
+    unittest.main()